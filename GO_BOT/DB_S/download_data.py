@@ -60,15 +60,35 @@ import pandas as pd
 import asyncio
 import aiohttp
 from datetime import datetime
+from io import BytesIO
 from tqdm.asyncio import tqdm
+import os
 import shutil
-import ta
+import sys
+import time
+
+from indicator_columns import RAW_COLUMNS, invalidate, load_candles_with_indicators
+from indicator_engine import IndicatorEngine, ema
+from rate_limiter import KLINE_WEIGHT, MAX_REQUEUES, FetchError, RateLimiter
 
 # Constantes
 MAX_LIMIT = 1000  # Limite de bougies par requête
-BINANCE_API_URL = "https://api.binance.com/api/v3/klines"
+MAX_THROTTLES = 20  # Nombre de 429/418 tolérés pour une même requête
+# URL de l'API (on peut la remplacer par un faux serveur local pour les tests)
+BINANCE_API_URL = os.environ.get("BINANCE_API_URL", "https://api.binance.com/api/v3/klines")
+# Fenêtres des EMA (calculées à la lecture, voir indicator_columns.py ; le CSV ne contient que les bougies brutes)
+EMA_WINDOWS = {'EMA1': 13, 'EMA2': 38}
+# les mêmes, déclarées pour le moteur d'indicateurs
+EMA_INDICATORS = {name: ("ema", {"window": window}) for name, window in EMA_WINDOWS.items()}
+# Colonnes renvoyées par l'API klines
+KLINE_COLUMNS = [
+    'timestamp', 'open', 'high', 'low', 'close', 'volume',
+    'close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore'
+]
 
-async def fetch_candles(session, symbol, interval, start_ts, end_ts, semaphore):
+async def fetch_candles(session, symbol, interval, start_ts, end_ts, limiter, api_url=None):
+    # débit réglé par le RateLimiter (poids utilisé, Retry-After), backoff sur les erreurs réseau / 5xx,
+    # FetchError si la plage n'a pas pu être récupérée
     params = {
         "symbol": symbol,
         "interval": interval,
@@ -77,72 +97,323 @@ async def fetch_candles(session, symbol, interval, start_ts, end_ts, semaphore):
         "limit": MAX_LIMIT,
     }
     tries = 0
+    throttles = 0
     backoff = 0.1
+    reason = None
 
-    async with semaphore:
-        while tries < 5:
-            try:
-                async with session.get(BINANCE_API_URL, params=params) as response:
+    while tries < 5:
+        try:
+            async with limiter.slot(KLINE_WEIGHT):
+                async with session.get(api_url or BINANCE_API_URL, params=params) as response:
+                    limiter.update(response.headers)
                     if response.status == 200:
-                        return await response.json()
-                    elif response.status in [429, 418]:
-                        await asyncio.sleep(backoff)
-                        backoff *= 2
-                    else:
-                        return []
-            except Exception as e:
-                print(f"Erreur : {e} pour {start_ts} -> {end_ts}")
-                await asyncio.sleep(backoff)
-                backoff *= 2
-            tries += 1
-    return []
-
-async def fetch_all_candles(symbol, start_date, end_date):
-    start_ts = int(datetime.strptime(start_date, "%d %B %Y").timestamp() * 1000)
-    end_ts = int(datetime.strptime(end_date, "%d %B %Y").timestamp() * 1000)
-    tasks = []
-    semaphore = asyncio.Semaphore(10)
-    async with aiohttp.ClientSession() as session:
-        current_ts = start_ts
-        while current_ts < end_ts:
-            next_ts = min(current_ts + MAX_LIMIT * 60 * 1000, end_ts)
-            tasks.append(fetch_candles(session, symbol, "1m", current_ts, next_ts, semaphore))
-            current_ts = next_ts + 1
+                        data = await response.json()
+                        limiter.on_success()
+                        return data
+                    reason = f"Erreur {response.status}: {response.reason}"
+                    if response.status in [429, 418]:
+                        # pause globale pendant Retry-After, ne compte pas comme un essai
+                        limiter.on_throttled(response.headers.get("Retry-After"))
+                        throttles += 1
+                        if throttles > MAX_THROTTLES:
+                            raise FetchError(start_ts, end_ts, reason)
+                        continue
+                    if response.status < 500:
+                        raise FetchError(start_ts, end_ts, reason)
+                    limiter.on_error()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            reason = f"Exception : {e!r}"
+            limiter.on_error()
+        await asyncio.sleep(backoff)
+        backoff *= 2
+        tries += 1
+    raise FetchError(start_ts, end_ts, reason)
 
-        results = []
-        for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Téléchargement des données"):
-            result = await coro
-            results.extend(result)
+async def fetch_ranges(session, symbol, ranges, limiter, api_url=None, progress=None):
+    # file de travail : un segment en échec est remis au bout de la file (au plus MAX_REQUEUES fois)
+    # renvoie (numéro de segment -> bougies, FetchError des segments abandonnés)
+    queue = asyncio.Queue()
+    for index in range(len(ranges)):
+        queue.put_nowait(index)
+    pages = {}
+    failed = []
+    requeues = {}
 
-    return results
+    async def worker():
+        while True:
+            index = await queue.get()
+            try:
+                start_ts, end_ts = ranges[index]
+                try:
+                    pages[index] = await fetch_candles(session, symbol, "1m", start_ts, end_ts, limiter, api_url)
+                except FetchError as e:
+                    requeues[index] = requeues.get(index, 0) + 1
+                    if requeues[index] <= MAX_REQUEUES:
+                        queue.put_nowait(index)
+                        continue
+                    failed.append(e)
+                if progress is not None:
+                    progress.update(1)
+            finally:
+                queue.task_done()
 
-def save_candles_with_indicators(data, filename):
-    df = pd.DataFrame(data, columns=[
-        'timestamp', 'open', 'high', 'low', 'close', 'volume',
-        'close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore'
-    ])
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(limiter.max_concurrency, len(ranges)))]
+    join = asyncio.ensure_future(queue.join())
+    try:
+        done, _ = await asyncio.wait([join, *workers], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task is not join:
+                task.result()
+    finally:
+        for task in [join, *workers]:
+            task.cancel()
+        await asyncio.gather(join, *workers, return_exceptions=True)
+    failed.sort(key=lambda e: e.start_ts)
+    return pages, failed
+
+def report_failed_ranges(failed):
+    if not failed:
+        return
+    print(f"⚠️ {len(failed)} segments n'ont pas pu être téléchargés :")
+    for error in failed:
+        print(f"  - {pd.Timestamp(error.start_ts, unit='ms')} -> {pd.Timestamp(error.end_ts, unit='ms')} ({error.reason})")
+    print("   Relancer le script, ou SMA_X_BOT/repair_gaps.py pour ne récupérer que les minutes manquantes.")
+
+def resolve_range(start_date, end_date, start_ts=None):
+    # start_ts (ms) remplace start_date en mode reprise, end_date None = jusqu'à maintenant
+    if start_ts is None:
+        start_ts = int(datetime.strptime(start_date, "%d %B %Y").timestamp() * 1000)
+    if end_date is None:
+        end_ts = int(time.time() * 1000)
+    else:
+        end_ts = int(datetime.strptime(end_date, "%d %B %Y").timestamp() * 1000)
+    return start_ts, end_ts
+
+def page_ranges(start_ts, end_ts):
+    # segments de MAX_LIMIT bougies (bornes incluses), dans l'ordre
+    ranges = []
+    current_ts = start_ts
+    while current_ts < end_ts:
+        next_ts = min(current_ts + (MAX_LIMIT - 1) * 60 * 1000, end_ts)
+        ranges.append((current_ts, next_ts))
+        current_ts = next_ts + 1
+    return ranges
+
+async def fetch_all_candles(symbol, start_date, end_date, start_ts=None, api_url=None):
+    start_ts, end_ts = resolve_range(start_date, end_date, start_ts)
+    ranges = page_ranges(start_ts, end_ts)
+    limiter = RateLimiter()
+    async with aiohttp.ClientSession() as session:
+        with tqdm(total=len(ranges), desc="Téléchargement des données") as progress:
+            pages, failed = await fetch_ranges(session, symbol, ranges, limiter, api_url, progress)
+
+    report_failed_ranges(failed)
+    return [candle for index in sorted(pages) for candle in pages[index]]
+
+def candles_to_dataframe(data):
+    # bougies brutes -> DataFrame OHLCV trié et sans doublons
+    df = pd.DataFrame(data, columns=KLINE_COLUMNS)
     df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
     df.set_index('timestamp', inplace=True)
-    df = df[['open', 'high', 'low', 'close', 'volume']]
+    df = df[RAW_COLUMNS]
+    df = df[~df.index.duplicated(keep='first')].sort_index()
+    return df
 
-    print("Calcul des indicateurs techniques...")
-    df['EMA1'] = ta.trend.ema_indicator(close=df['close'], window=13)
-    df['EMA2'] = ta.trend.ema_indicator(close=df['close'], window=38)
+def save_candles(data, filename):
+    # bougies brutes seulement : les indicateurs sont calculés à la lecture (load_candles)
+    df = candles_to_dataframe(data)
 
     print(f"Enregistrement des données dans {filename}...")
     df.to_csv(filename)
-    print("✅ Données avec indicateurs enregistrées dans", filename)
+    invalidate(filename)
+    print("✅ Données enregistrées dans", filename)
+
+def load_candles(filename, indicators=EMA_INDICATORS):
+    # bougies du fichier + colonnes d'indicateurs calculées au premier accès et mémorisées sur le disque
+    return load_candles_with_indicators(filename, indicators)
+
+def read_tail(filename, block_size=64 * 1024):
+    # lit les dernières lignes d'un CSV trié sans lire tout le fichier
+    with open(filename, "rb") as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        start = max(len(header), size - block_size)
+        f.seek(start)
+        block = f.read()
+    lines = block.splitlines()
+    # la première ligne du bloc peut être coupée
+    if start > len(header) and lines:
+        lines = lines[1:]
+    if not lines:
+        return None
+    return pd.read_csv(BytesIO(header + b"\n".join(lines) + b"\n"), parse_dates=['timestamp'], index_col='timestamp')
+
+def append_candles(data, filename, tail):
+    # ajoute les bougies après la dernière ligne du fichier, sans le réécrire ; un fichier écrit par une
+    # ancienne version (colonnes EMA dans le CSV) garde ses colonnes, continuées à partir des dernières valeurs
+    last_ts = int(tail.index[-1].value // 10**6)
+    now_ms = int(time.time() * 1000)
+    data = [candle for candle in data if candle[0] > last_ts and candle[6] < now_ms]
+    if not data:
+        print("✅ Aucune nouvelle bougie à ajouter.")
+        return 0
+    df = candles_to_dataframe(data)
+    close = pd.to_numeric(df['close'])
+    legacy = [name for name in EMA_WINDOWS if name in tail]
+    # pas encore assez d'historique pour une EMA : on recalcule sur la fin du fichier + les nouvelles bougies
+    cold = {name: EMA_INDICATORS[name] for name in legacy if pd.isna(tail[name].iloc[-1])}
+    if cold:
+        columns = IndicatorEngine(cold).compute({'close': pd.concat([tail['close'], close])})
+    for name in legacy:
+        window = EMA_WINDOWS[name]
+        if name in cold:
+            df[name] = columns[name][len(tail):]
+        else:
+            # même récurrence que ta (ewm adjust=False) en repartant de la dernière EMA
+            df[name] = ema(close, window, initial=tail[name].iloc[-1])
+    payload = df.to_csv(header=False).encode()
+    size = os.path.getsize(filename)
+    try:
+        with open(filename, "r+b") as f:
+            if size > 0:
+                f.seek(size - 1)
+                if f.read(1) not in (b"\n", b"\r"):
+                    payload = os.linesep.encode() + payload
+            f.seek(size)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        # on annule l'ajout partiel
+        with open(filename, "r+b") as f:
+            f.truncate(size)
+        raise
+    invalidate(filename)
+    print(f"✅ {len(df)} nouvelles bougies ajoutées à {filename}")
+    return len(df)
+
+async def fetch_pages_in_order(session, symbol, ranges, limiter, api_url=None, stats=None):
+    # renvoie les pages dans l'ordre des timestamps, avec au plus 2 * concurrency (du limiteur) pages
+    # en cours ou en attente dans le tampon de réordonnancement (mémoire bornée) ;
+    # une page en échec est relancée (au plus MAX_REQUEUES fois) puis renvoyée vide
+    pending = {}   # tâche -> numéro de page
+    buffer = {}    # numéro de page -> bougies arrivées en avance
+    requeues = {}  # numéro de page -> nombre de relances
+    failed = []
+    next_to_schedule = 0
+    next_to_yield = 0
+    max_buffered = 0
+
+    def schedule(index):
+        start_ts, end_ts = ranges[index]
+        task = asyncio.ensure_future(fetch_candles(session, symbol, "1m", start_ts, end_ts, limiter, api_url))
+        pending[task] = index
+
+    try:
+        while next_to_yield < len(ranges):
+            window = 2 * max(1, int(limiter.concurrency))
+            while next_to_schedule < len(ranges) and next_to_schedule - next_to_yield < window:
+                schedule(next_to_schedule)
+                next_to_schedule += 1
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                try:
+                    buffer[index] = task.result()
+                except FetchError as e:
+                    requeues[index] = requeues.get(index, 0) + 1
+                    if requeues[index] <= MAX_REQUEUES:
+                        schedule(index)
+                    else:
+                        failed.append(e)
+                        buffer[index] = []
+            max_buffered = max(max_buffered, len(buffer))
+            while next_to_yield in buffer:
+                yield buffer.pop(next_to_yield)
+                next_to_yield += 1
+    finally:
+        for task in pending:
+            task.cancel()
+        if stats is not None:
+            stats["max_buffered_pages"] = max_buffered
+            stats["failed_ranges"] = failed
+
+def peak_memory_mb():
+    # pic de mémoire (RSS) du processus en Mo, None sous Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+async def stream_candles(symbol, start_date, end_date, filename, api_url=None, limiter=None):
+    # téléchargement en flux : chaque page est écrite dès qu'elle est dans l'ordre,
+    # dans un fichier temporaire qui remplace `filename` à la fin
+    start_ts, end_ts = resolve_range(start_date, end_date)
+    ranges = page_ranges(start_ts, end_ts)
+    now_ms = int(time.time() * 1000)
+    tmp_path = filename + ".tmp"
+    written = 0
+    last_written = start_ts - 1
+    stats = {}
+    limiter = limiter or RateLimiter()
+    try:
+        with open(tmp_path, "w", newline="") as f:
+            f.write(pd.DataFrame(columns=['timestamp'] + RAW_COLUMNS).to_csv(index=False))
+            async with aiohttp.ClientSession() as session:
+                pages = fetch_pages_in_order(session, symbol, ranges, limiter, api_url, stats)
+                with tqdm(total=len(ranges), desc="Téléchargement des données") as progress:
+                    async for page in pages:
+                        page = [candle for candle in page if candle[0] > last_written and candle[6] < now_ms]
+                        if page:
+                            df = candles_to_dataframe(page)
+                            f.write(df.to_csv(header=False))
+                            written += len(df)
+                            last_written = page[-1][0]
+                        progress.update(1)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, filename)
+    invalidate(filename)
+    peak = peak_memory_mb()
+    print(f"✅ {written} bougies enregistrées dans {filename}")
+    print(f"📈 Pages max en mémoire : {stats.get('max_buffered_pages', 0)}"
+          + (f", pic mémoire : {peak:.1f} Mo" if peak is not None else ""))
+    report_failed_ranges(stats.get("failed_ranges", []))
+    return written
+
+# mode reprise : si le fichier existe déjà, on ne télécharge que ce qui manque après la dernière bougie
+RESUME = True
+# mode flux : le téléchargement complet est écrit sur le disque au fur et à mesure (mémoire bornée)
+STREAMING = True
 
 def main():
     symbol = "ETHUSDT"
     start_date = "01 January 2017"
-    end_date = "15 November 2024"
+    end_date = "15 November 2024"  # None pour aller jusqu'à maintenant
     filename = "historical_data_eth_1M.csv"
 
-    print(f"🔄 Récupération des données pour {symbol} de {start_date} à {end_date}...")
-    all_data = asyncio.run(fetch_all_candles(symbol, start_date, end_date))
-    print(f"📊 Nombre total de bougies récupérées : {len(all_data)}")
-    save_candles_with_indicators(all_data, filename)
+    tail = read_tail(filename) if RESUME and os.path.exists(filename) else None
+    if tail is not None and not tail.empty:
+        print(f"🔁 Reprise pour {symbol} après {tail.index[-1]} jusqu'à {end_date or 'maintenant'}...")
+        start_ts = int(tail.index[-1].value // 10**6) + 60 * 1000
+        all_data = asyncio.run(fetch_all_candles(symbol, start_date, end_date, start_ts=start_ts))
+        print(f"📊 Nombre total de bougies récupérées : {len(all_data)}")
+        append_candles(all_data, filename, tail)
+    elif STREAMING:
+        print(f"🔄 Récupération des données pour {symbol} de {start_date} à {end_date}...")
+        asyncio.run(stream_candles(symbol, start_date, end_date, filename))
+    else:
+        print(f"🔄 Récupération des données pour {symbol} de {start_date} à {end_date}...")
+        all_data = asyncio.run(fetch_all_candles(symbol, start_date, end_date))
+        print(f"📊 Nombre total de bougies récupérées : {len(all_data)}")
+        save_candles(all_data, filename)
     #shutil.copy(filename, "BACKUP_ETH.csv")
     print("🚀 Sauvegarde terminée.")
 
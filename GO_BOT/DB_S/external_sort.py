@@ -0,0 +1,243 @@
+# tri externe + suppression des doublons pour les fichiers de bougies plus gros que la RAM
+"""
+/*********************************\
+|* Tri externe des bougies       *|
+\*********************************/
+
+    * sort_csv_in_place / remove_duplicates (verify_downloaded_data.py) chargeaient tout le CSV en DataFrame.
+    Ici le fichier est lu par blocs d'environ `memory_mb` : chaque bloc est trié sur le timestamp (tri stable)
+    et écrit dans un fichier temporaire ("run"), puis les runs sont fusionnés (fusion k-voies avec heapq.merge)
+    en supprimant les doublons (on garde le premier, comme avant).
+
+    * Les lignes sont recopiées telles quelles (pas de reformatage des prix), le fichier de sortie est écrit
+    dans un .tmp puis renommé : en cas d'erreur le fichier d'origine est intact.
+
+    Lancement : python external_sort.py fichier.csv [sortie.csv] [--memory-mb 256]
+    Benchmark : python external_sort.py --benchmark
+"""
+
+import argparse
+import heapq
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# mémoire utilisée pour un bloc (Mo)
+MEMORY_LIMIT_MB = 256
+# nombre max de runs ouverts en même temps pendant la fusion
+MAX_OPEN_RUNS = 64
+# une ligne lue occupe environ ce facteur x sa taille en mémoire (objets bytes, liste, parsing du timestamp, tri)
+MEMORY_FACTOR = 8
+
+
+def parse_keys(lines, column=0):
+    """
+    Timestamps (int64) d'un bloc de lignes CSV, parsés en une fois par pandas.
+    Dates -> nanosecondes, timestamps numériques (ms) -> tels quels.
+    """
+    values = pd.read_csv(io.BytesIO(b"".join(lines)), header=None, usecols=[column]).iloc[:, 0]
+    if pd.api.types.is_integer_dtype(values):
+        return values.to_numpy(dtype=np.int64)
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def write_runs(input_file, tmp_dir, memory_mb=MEMORY_LIMIT_MB):
+    """
+    Découpe le fichier en runs triés.
+
+    :return: (ligne d'en-tête, liste des chemins des runs dans l'ordre du fichier, nombre de lignes)
+    """
+    block_bytes = max(1, int(memory_mb * 1024**2 / MEMORY_FACTOR))
+    runs = []
+    rows = 0
+    with open(input_file, "rb") as f:
+        header = f.readline()
+        if not header.strip():
+            raise ValueError(f"Fichier vide ou mal formaté : {input_file}")
+        columns = header.decode().strip().split(",")
+        if "timestamp" not in columns:
+            raise ValueError("La colonne 'timestamp' est manquante dans le fichier.")
+        column = columns.index("timestamp")
+        while True:
+            lines = [line if line.endswith(b"\n") else line + b"\n" for line in f.readlines(block_bytes) if line.strip()]
+            if not lines:
+                break
+            keys = parse_keys(lines, column)
+            order = np.argsort(keys, kind='stable')
+            path = os.path.join(tmp_dir, f"run_{len(runs):06d}.csv")
+            with open(path, "wb") as run:
+                # chaque ligne du run est préfixée par sa clé : la fusion n'a plus de date à parser
+                run.writelines(b"%d,%s" % (keys[i], lines[i]) for i in order)
+            runs.append(path)
+            rows += len(lines)
+            del lines, keys, order
+    return header, runs, rows
+
+
+def read_run(path):
+    """
+    Itère sur (clé, ligne d'origine) d'un run.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            key, rest = line.split(b",", 1)
+            yield int(key), rest
+
+
+def merge_runs(paths, output, dedupe=True, keep_keys=False):
+    """
+    Fusion k-voies de runs triés. À clé égale, heapq.merge garde l'ordre des runs (donc l'ordre du fichier) :
+    la première occurrence est celle qui est conservée.
+
+    :param output: Fichier binaire ouvert en écriture.
+    :param keep_keys: True pour écrire un run intermédiaire (lignes préfixées par la clé).
+    :return: (lignes écrites, doublons supprimés)
+    """
+    written = 0
+    duplicates = 0
+    last_key = None
+    for key, line in heapq.merge(*[read_run(path) for path in paths], key=lambda item: item[0]):
+        if dedupe and key == last_key:
+            duplicates += 1
+            continue
+        last_key = key
+        output.write(b"%d,%s" % (key, line) if keep_keys else line)
+        written += 1
+    return written, duplicates
+
+
+def external_sort_csv(input_file, output_file=None, memory_mb=MEMORY_LIMIT_MB, dedupe=True, tmp_dir=None):
+    """
+    Trie un CSV de bougies sur la colonne timestamp sans le charger en mémoire, et supprime les doublons
+    (on garde la première occurrence). La sortie remplace `output_file` de façon atomique.
+
+    :param input_file: CSV à trier.
+    :param output_file: CSV trié (par défaut : input_file, réécrit en place).
+    :param memory_mb: Mémoire allouée à un bloc (Mo).
+    :param dedupe: False pour seulement trier.
+    :param tmp_dir: Dossier des fichiers temporaires (par défaut : à côté de la sortie).
+    :return: Dictionnaire (lignes lues, lignes écrites, doublons, runs, durée).
+    """
+    output_file = output_file or input_file
+    started = time.perf_counter()
+    work_dir = tempfile.mkdtemp(prefix="external_sort_", dir=tmp_dir or os.path.dirname(os.path.abspath(output_file)))
+    try:
+        header, runs, rows = write_runs(input_file, work_dir, memory_mb)
+        run_count = len(runs)
+        # trop de runs pour les ouvrir tous : on fusionne par paquets (sans supprimer les doublons
+        # tant que tout n'est pas fusionné, les paquets consécutifs gardent l'ordre du fichier)
+        level = 0
+        while len(runs) > MAX_OPEN_RUNS:
+            merged = []
+            for i in range(0, len(runs), MAX_OPEN_RUNS):
+                path = os.path.join(work_dir, f"merge_{level}_{i // MAX_OPEN_RUNS:06d}.csv")
+                with open(path, "wb") as out:
+                    merge_runs(runs[i:i + MAX_OPEN_RUNS], out, dedupe=False, keep_keys=True)
+                for run in runs[i:i + MAX_OPEN_RUNS]:
+                    os.remove(run)
+                merged.append(path)
+            runs = merged
+            level += 1
+        tmp_path = output_file + ".tmp"
+        try:
+            with open(tmp_path, "wb") as out:
+                out.write(header if header.endswith(b"\n") else header + b"\n")
+                written, duplicates = merge_runs(runs, out, dedupe=dedupe)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, output_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "rows": rows,
+        "written": written,
+        "duplicates": duplicates,
+        "runs": run_count,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def write_synthetic_file(file_name, rows, duplicate_rate=0.01, page=1000, seed=0):
+    """
+    Écrit un CSV de bougies 1m synthétique comme le produisait le téléchargement avec as_completed :
+    des pages de `page` bougies dans le désordre, avec des pages en double. Écrit par morceaux
+    (mémoire constante).
+    """
+    rng = np.random.default_rng(seed)
+    pages = np.arange(-(-rows // page))
+    rng.shuffle(pages)
+    start = pd.Timestamp("2017-01-01").value
+    minute = 60 * 10**9
+    with open(file_name, "w", newline="") as f:
+        f.write("timestamp,open,high,low,close,volume\n")
+        for chunk in np.array_split(pages, max(1, len(pages) // 100)):
+            # chaque page tirée peut être écrite deux fois
+            chunk = np.concatenate([chunk, chunk[rng.random(len(chunk)) < duplicate_rate]])
+            index = (chunk[:, None] * page + np.arange(page)).ravel()
+            index = index[index < rows]
+            close = 1000 + np.round(100 * np.sin(index / 5000), 2)
+            df = pd.DataFrame({
+                "timestamp": pd.to_datetime(start + index * minute),
+                "open": close, "high": close + 1, "low": close - 1, "close": close, "volume": index % 17 + 10.0,
+            })
+            df.to_csv(f, header=False, index=False)
+
+
+def peak_memory_mb():
+    """
+    Pic de mémoire (RSS) du processus en Mo, ou None si indisponible (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def benchmark(rows=3_000_000, memory_mb=32):
+    """
+    Débit du tri externe sur un fichier synthétique plusieurs fois plus gros que la limite de mémoire.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = os.path.join(tmp_dir, "synthetic.csv")
+        write_synthetic_file(file_name, rows)
+        size_mb = os.path.getsize(file_name) / 1024**2
+        before = peak_memory_mb()
+        stats = external_sort_csv(file_name, memory_mb=memory_mb)
+        after = peak_memory_mb()
+        check = pd.read_csv(file_name, usecols=["timestamp"])["timestamp"]
+        ok = check.is_monotonic_increasing and check.is_unique and len(check) == rows
+    print(f"📊 {size_mb:.0f} Mo ({stats['rows']} lignes, {stats['duplicates']} doublons) triés en {stats['seconds']:.1f}s "
+          f"avec {memory_mb} Mo par bloc ({stats['runs']} runs) -> {stats['rows'] / stats['seconds']:.0f} lignes/s, "
+          f"{size_mb / stats['seconds']:.1f} Mo/s")
+    if before is not None:
+        print(f"   pic mémoire : {after:.0f} Mo (avant le tri : {before:.0f} Mo), résultat {'✅ trié et unique' if ok else '❌ incorrect'}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tri externe d'un CSV de bougies (suppression des doublons).")
+    parser.add_argument("input_file", nargs="?", default="historical_data_eth_1M.csv", help="CSV à trier")
+    parser.add_argument("output_file", nargs="?", default=None, help="CSV de sortie (par défaut : le fichier d'entrée)")
+    parser.add_argument("--memory-mb", type=float, default=MEMORY_LIMIT_MB, help="mémoire utilisée par bloc (Mo)")
+    parser.add_argument("--benchmark", action="store_true", help="mesure le débit sur un fichier synthétique")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+        return
+    stats = external_sort_csv(args.input_file, args.output_file, args.memory_mb)
+    print(f"✅ {stats['written']} lignes écrites, {stats['duplicates']} doublons supprimés ({stats['runs']} runs, {stats['seconds']:.1f}s).")
+
+if __name__ == "__main__":
+    main()
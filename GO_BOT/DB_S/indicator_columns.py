@@ -0,0 +1,212 @@
+# colonnes d'indicateurs calculées à la demande et mémorisées sur le disque, séparées des bougies brutes
+"""
+/*********************************\
+|* Colonnes d'indicateurs lazy   *|
+\*********************************/
+
+    * Le téléchargement n'écrit plus que les bougies brutes (timestamp, open, high, low, close, volume) :
+    calculer EMA1 / EMA2 avant d'écrire ralentissait le téléchargement et figeait les fenêtres dans le CSV
+    (changer une fenêtre = tout retélécharger).
+
+    * À la lecture, LazyIndicators donne les colonnes d'indicateurs déclarées (même format que IndicatorEngine) :
+        - une colonne est calculée au premier accès (lazy["EMA1"]), ou toutes celles qui manquent en une passe
+          du moteur avec lazy.frame()
+        - elle est enregistrée dans le dossier <fichier>.indicators (un .npy par colonne) sous une clef
+          (indicateur, params, empreinte des colonnes de bougies utilisées) et relue aux lancements suivants
+
+    * Invalidation :
+        - les bougies changent (ajout, réparation des trous, tri...) -> l'empreinte change, l'ancienne colonne
+          n'est plus jamais relue ; elle est supprimée dès que la nouvelle est enregistrée
+        - les scripts qui modifient le CSV appellent aussi invalidate(fichier), qui vide tout le dossier
+
+    Copie de SMA_X_BOT/indicator_columns.py (fingerprint vient de indicator_cache.py dans SMA_X_BOT).
+"""
+
+import hashlib
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from indicator_engine import REGISTRY, IndicatorEngine
+
+# suffixe du dossier des colonnes d'indicateurs d'un CSV
+INDICATORS_SUFFIX = ".indicators"
+# colonnes des bougies brutes
+RAW_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def fingerprint(values):
+    """
+    Empreinte (hash) d'un tableau : deux tableaux identiques ont la même empreinte.
+    """
+    values = np.ascontiguousarray(values)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{values.dtype.str}:{values.shape}".encode())
+    digest.update(values.view(np.uint8))
+    return digest.hexdigest()
+
+
+def indicators_path_for(filename):
+    """
+    Renvoie le dossier des colonnes d'indicateurs associé à un fichier CSV (même nom, extension .indicators).
+    """
+    return os.path.splitext(filename)[0] + INDICATORS_SUFFIX
+
+
+def invalidate(filename):
+    """
+    Supprime toutes les colonnes d'indicateurs enregistrées pour un fichier (à appeler quand ses bougies changent).
+    """
+    shutil.rmtree(indicators_path_for(filename), ignore_errors=True)
+
+
+def spec_key(name, params):
+    # partie de la clef indépendante des données : indicateur + params triés ("ema_window-13")
+    return "_".join([name] + [f"{key}-{value}" for key, value in sorted(params.items())])
+
+
+class LazyIndicators:
+    """
+    Colonnes d'indicateurs d'un DataFrame de bougies, calculées au premier accès et mémorisées sur le disque.
+
+    :param candles: DataFrame des bougies brutes.
+    :param indicators: Dictionnaire {nom de colonne: (indicateur, params)} (voir IndicatorEngine).
+    :param cache_dir: Dossier des colonnes enregistrées (None pour ne rien écrire).
+    """
+
+    def __init__(self, candles, indicators, cache_dir=None):
+        self.candles = candles
+        self.indicators = dict(indicators)
+        self.cache_dir = cache_dir
+        # colonnes déjà chargées ou calculées
+        self.columns = {}
+        # empreintes des colonnes de bougies (calculées une fois)
+        self.fingerprints = {}
+        # colonne -> (nom déclaré, suffixe de sortie)
+        self.owners = {}
+        for declared, (name, params) in self.indicators.items():
+            if name not in REGISTRY or REGISTRY[name].outputs is None:
+                raise ValueError(f"Indicateur inconnu : {name}")
+            for suffix in REGISTRY[name].outputs(params):
+                self.owners[declared if suffix == "" else f"{declared}_{suffix}"] = (declared, suffix)
+        self.stats = {"loaded": 0, "computed": 0}
+
+    def keys(self):
+        return list(self.owners)
+
+    def __contains__(self, column):
+        return column in self.owners
+
+    def __getitem__(self, column):
+        if column not in self.columns:
+            if column not in self.owners:
+                raise KeyError(column)
+            self.load([self.owners[column][0]])
+        return self.columns[column]
+
+    def _data_key(self, declared):
+        # empreinte des colonnes de bougies dont l'indicateur a besoin
+        parts = []
+        for column in IndicatorEngine({declared: self.indicators[declared]}).inputs():
+            if column not in self.fingerprints:
+                self.fingerprints[column] = fingerprint(np.asarray(self.candles[column], dtype=np.float64))
+            parts.append(f"{column}-{self.fingerprints[column]}")
+        return hashlib.blake2b("_".join(parts).encode(), digest_size=16).hexdigest()
+
+    def _file_prefix(self, declared, suffix):
+        name, params = self.indicators[declared]
+        return spec_key(name, params) + (f".{suffix}" if suffix else "") + "__"
+
+    def _path(self, declared, suffix, data_key):
+        return os.path.join(self.cache_dir, f"{self._file_prefix(declared, suffix)}{data_key}.npy")
+
+    def _read(self, declared, data_key):
+        # colonnes enregistrées d'un indicateur, ou None s'il en manque une
+        if not self.cache_dir:
+            return None
+        values = {}
+        for column, (owner, suffix) in self.owners.items():
+            if owner != declared:
+                continue
+            try:
+                array = np.load(self._path(declared, suffix, data_key))
+            except (FileNotFoundError, ValueError, OSError):
+                return None
+            if len(array) != len(self.candles):
+                return None
+            values[column] = array
+        return values
+
+    def _write(self, declared, data_key, values):
+        # enregistre les colonnes (écriture atomique) et supprime celles des anciennes bougies
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for column, array in values.items():
+            suffix = self.owners[column][1]
+            path = self._path(declared, suffix, data_key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+            prefix = self._file_prefix(declared, suffix)
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(prefix) and name.endswith(".npy") and os.path.join(self.cache_dir, name) != path:
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except FileNotFoundError:
+                        pass
+
+    def load(self, names=None):
+        """
+        Charge les indicateurs déclarés `names` (tous par défaut) : relus sur le disque si les bougies n'ont pas
+        changé, sinon calculés ensemble en une passe du moteur puis enregistrés.
+        """
+        names = list(self.indicators) if names is None else names
+        missing = {}
+        for declared in names:
+            if all(column in self.columns for column, (owner, _) in self.owners.items() if owner == declared):
+                continue
+            data_key = self._data_key(declared)
+            values = self._read(declared, data_key)
+            if values is None:
+                missing[declared] = data_key
+            else:
+                self.columns.update(values)
+                self.stats["loaded"] += 1
+        if not missing:
+            return
+        computed = IndicatorEngine({declared: self.indicators[declared] for declared in missing}).compute(self.candles)
+        for declared, data_key in missing.items():
+            values = {column: computed[column] for column, (owner, _) in self.owners.items() if owner == declared}
+            self._write(declared, data_key, values)
+            self.columns.update(values)
+            self.stats["computed"] += 1
+
+    def frame(self, names=None):
+        """
+        DataFrame des bougies + colonnes d'indicateurs (toutes les déclarées par défaut).
+        """
+        self.load(names)
+        df = self.candles.copy()
+        for column, (owner, _) in self.owners.items():
+            if names is None or owner in names:
+                df[column] = self.columns[column]
+        return df
+
+
+def load_candles_with_indicators(filename, indicators, cache=True):
+    """
+    Lit un CSV de bougies et prépare ses colonnes d'indicateurs (calculées à la demande).
+    Les colonnes d'indicateurs écrites dans le CSV par les anciennes versions sont ignorées.
+
+    :param indicators: Dictionnaire {nom de colonne: (indicateur, params)}.
+    :param cache: False pour ne rien enregistrer sur le disque.
+    :return: (DataFrame des bougies brutes, LazyIndicators)
+    """
+    header = pd.read_csv(filename, nrows=0).columns
+    usecols = ['timestamp'] + [column for column in RAW_COLUMNS if column in header]
+    candles = pd.read_csv(filename, usecols=usecols, parse_dates=['timestamp'], index_col='timestamp')
+    return candles, LazyIndicators(candles, indicators, indicators_path_for(filename) if cache else None)
@@ -1,65 +1,148 @@
 # part 1 
 
+import json
+import numpy as np
 import pandas as pd
 
-def validate_data_integrity(file_name, symbol, interval, expected_currency):
+"""
+vérification en un seul passage : le fichier est lu par morceaux (chunksize lignes, colonne timestamp seulement),
+on ne garde que le dernier timestamp du morceau précédent, la mémoire ne dépend pas de la taille du fichier.
+doublons, ordre, intervalle, début / fin, complétude et liste des trous sont calculés dans la même boucle,
+le rapport est écrit en JSON.
+"""
+
+def validate_data_integrity(file_name, symbol, interval, expected_currency, expected_start=None, expected_end=None,
+                            chunksize=1_000_000, report_file=None):
     """
-    Valide l'intégrité des données dans un fichier CSV.
+    Valide l'intégrité des données dans un fichier CSV, en une seule lecture par morceaux.
     
     :param file_name: Nom du fichier CSV contenant les données.
     :param symbol: Le symbole attendu (ex: "ETHUSDT").
     :param interval: Intervalle attendu des timestamps (ex: "1min").
     :param expected_currency: Monnaie attendue (ex: "ETH").
+    :param expected_start: Première date attendue (optionnel).
+    :param expected_end: Dernière date attendue (optionnel).
+    :param chunksize: Nombre de lignes lues à la fois (la mémoire utilisée en dépend).
+    :param report_file: Fichier JSON où écrire le rapport (optionnel).
     :return: Un dictionnaire contenant les résultats des vérifications.
     """
     print(f"🔍 Vérification des données pour {file_name}...")
 
-    # Chargement des données
+    step = pd.Timedelta(interval).value  # intervalle en ns
     try:
-        df = pd.read_csv(file_name, parse_dates=['timestamp'], index_col='timestamp')
-        print(f"✅ Données chargées : {len(df)} lignes.")
+        header = pd.read_csv(file_name, nrows=0).columns
+        usecols = ['timestamp'] + (['symbol'] if 'symbol' in header else [])
+        reader = pd.read_csv(file_name, usecols=usecols, chunksize=chunksize)
     except FileNotFoundError:
         return {"status": "error", "message": f"Fichier introuvable : {file_name}"}
-    except pd.errors.EmptyDataError:
+    except (pd.errors.EmptyDataError, ValueError):
         return {"status": "error", "message": f"Fichier vide ou mal formaté : {file_name}"}
 
-    results = {"status": "success", "issues": []}
+    rows = 0
+    duplicates = 0
+    unsorted = 0
+    misaligned = 0
+    wrong_symbol = 0
+    first = last = previous = None
+    lowest = highest = None
+    gaps = []  # trous (début, fin, nombre de timestamps manquants), en ns
+    for chunk in reader:
+        ts = pd.to_datetime(chunk['timestamp']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        if 'symbol' in chunk:
+            wrong_symbol += int((chunk['symbol'] != symbol).sum())
+        if len(ts) == 0:
+            continue
+        if first is None:
+            first = int(ts[0])
+            lowest, highest = first, first
+        lowest = min(lowest, int(ts.min()))
+        highest = max(highest, int(ts.max()))
+        # différences entre timestamps consécutifs, y compris avec la fin du morceau précédent
+        diffs = np.diff(ts, prepend=ts[0] if previous is None else previous)
+        if previous is None:
+            diffs = diffs[1:]
+            starts = ts[:-1]
+        else:
+            starts = np.concatenate([[previous], ts[:-1]])
+        duplicates += int((diffs == 0).sum())
+        unsorted += int((diffs < 0).sum())
+        misaligned += int(((diffs > 0) & (diffs % step != 0)).sum())
+        holes = np.flatnonzero(diffs > step)
+        for i in holes:
+            gaps.append((int(starts[i]) + step, int(starts[i] + diffs[i]) - step, int(diffs[i] // step) - 1))
+        rows += len(ts)
+        previous = int(ts[-1])
+        last = previous
+
+    if rows == 0:
+        return {"status": "error", "message": f"Fichier vide ou mal formaté : {file_name}"}
+    print(f"✅ Données lues : {rows} lignes.")
+
+    def to_iso(value):
+        return pd.Timestamp(value).isoformat()
+
+    total_expected = (highest - lowest) // step + 1
+    total_present = rows - duplicates
+    total_missing = sum(gap[2] for gap in gaps)
+    if unsorted:
+        # fichier pas trié : les écarts entre lignes voisines ne veulent rien dire, on estime avec min / max
+        gaps = []
+        total_missing = max(0, int(total_expected) - total_present)
+    results = {
+        "status": "success",
+        "issues": [],
+        "file": file_name,
+        "symbol": symbol,
+        "interval": interval,
+        "rows": rows,
+        "first_timestamp": to_iso(first),
+        "last_timestamp": to_iso(last),
+        "min_timestamp": to_iso(lowest),
+        "max_timestamp": to_iso(highest),
+        "duplicates": duplicates,
+        "unsorted": unsorted,
+        "misaligned": misaligned,
+        "total_expected": int(total_expected),
+        "total_present": total_present,
+        "total_missing": total_missing,
+        "completeness_percentage": total_present / total_expected * 100,
+        # doublons, trous et total manquant ne sont exacts que si le fichier est trié
+        "exact": unsorted == 0,
+        "gaps": [{"start": to_iso(start), "end": to_iso(end), "missing": count} for start, end, count in gaps],
+    }
 
     # Vérification de la monnaie (optionnelle si incluse dans les données)
-    if "symbol" in df.columns and not all(df["symbol"] == symbol):
+    if wrong_symbol:
         results["issues"].append("Currency mismatch: Le symbole ne correspond pas aux données.")
         print(f"❌ Currency mismatch : {symbol} attendu, mais les données contiennent d'autres symboles.")
 
     # Vérification des doublons
-    if df.index.duplicated().any():
-        results["issues"].append("Duplicate timestamps: Les données contiennent des doublons.")
-        print("❌ Doublons détectés dans les données.")
+    if duplicates:
+        results["issues"].append(f"Duplicate timestamps: {duplicates} doublons.")
+        print(f"❌ {duplicates} doublons détectés dans les données.")
 
     # Vérification de l'ordre
-    if not df.index.is_monotonic_increasing:
-        results["issues"].append("Unsorted data: Les données ne sont pas triées.")
-        print("❌ Les données ne sont pas triées.")
+    if unsorted:
+        results["issues"].append(f"Unsorted data: {unsorted} retours en arrière.")
+        print("❌ Les données ne sont pas triées (doublons et trous approximatifs, triez puis relancez).")
+
+    # Vérification de l'intervalle
+    if misaligned:
+        results["issues"].append(f"Interval mismatch: {misaligned} écarts qui ne sont pas un multiple de {interval}.")
+        print(f"❌ {misaligned} écarts ne sont pas un multiple de {interval}.")
 
     # Vérification des timestamps manquants
-    start_date = df.index.min()
-    end_date = df.index.max()
-    complete_index = pd.date_range(start=start_date, end=end_date, freq=interval)
-    missing_timestamps = complete_index.difference(df.index)
-
-    if len(missing_timestamps) > 0:
-        results["issues"].append(f"Missing data: {len(missing_timestamps)} timestamps manquants.")
-        print(f"❌ {len(missing_timestamps)} timestamps manquants détectés.")
+    if total_missing > 0:
+        results["issues"].append(f"Missing data: {total_missing} timestamps manquants.")
+        print(f"❌ {total_missing} timestamps manquants détectés" + (f" en {len(gaps)} trous." if gaps else "."))
     else:
         print("✅ Aucun timestamp manquant détecté.")
 
-    # Vérification du timestamp correct
-    if len(df) > 0:
-        first_timestamp = df.index.min()
-        last_timestamp = df.index.max()
-
-        if first_timestamp != complete_index[0] or last_timestamp != complete_index[-1]:
-            results["issues"].append("Timestamp mismatch: Les timestamps ne correspondent pas à l'intervalle attendu.")
-            print(f"❌ Les timestamps des données ({first_timestamp} -> {last_timestamp}) ne correspondent pas à l'intervalle attendu.")
+    # Vérification du début et de la fin attendus
+    if (expected_start is not None and pd.Timestamp(expected_start).value != lowest) or \
+            (expected_end is not None and pd.Timestamp(expected_end).value != highest):
+        results["issues"].append("Timestamp mismatch: Les timestamps ne correspondent pas à l'intervalle attendu.")
+        print(f"❌ Les timestamps des données ({to_iso(lowest)} -> {to_iso(highest)}) ne correspondent pas à l'intervalle attendu.")
 
     if not results["issues"]:
         print("✅ Toutes les vérifications ont été passées avec succès.")
@@ -68,6 +151,11 @@ def validate_data_integrity(file_name, symbol, interval, expected_currency):
         for issue in results["issues"]:
             print(f"  - {issue}")
 
+    if report_file:
+        with open(report_file, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Rapport enregistré dans {report_file}")
+
     return results
 
 file_name = "historical_data_eth_1M.csv"
@@ -75,99 +163,73 @@ symbol = "ETHUSDT"
 interval = "1min"
 expected_currency = "ETH"
 
-results = validate_data_integrity(file_name, symbol, interval, expected_currency)
+results = validate_data_integrity(file_name, symbol, interval, expected_currency, report_file="verify_report.json")
 
 if results["status"] == "success":
     print("\n✅ Validation terminée. Aucun problème majeur détecté.")
 else:
-    print("\n❌ Validation échouée.")
+    print(f"\n❌ Validation échouée : {results['message']}")
 
 # part 2 
-import pandas as pd
-from tqdm import tqdm
+import os
+from external_sort import MEMORY_LIMIT_MB, external_sort_csv
 
 """
 code utilisé pour trier la base de donnée 
+(tri externe : le fichier n'est jamais chargé en entier, voir external_sort.py)
 """
 
-def sort_csv_in_place(file_name):
+def sort_csv_in_place(file_name, memory_mb=MEMORY_LIMIT_MB):
     """
     Trie un fichier CSV par colonne de timestamp, de la plus ancienne à la plus récente,
     et réécrit le fichier d'origine avec les données triées.
 
     :param file_name: Nom du fichier CSV à trier.
+    :param memory_mb: Mémoire utilisée pour le tri (Mo).
     """
     print(f"🔄 Tri des données dans {file_name}...")
-
-    # Chargement des données
-    try:
-        df = pd.read_csv(file_name, parse_dates=['timestamp'])
-        print(f"✅ Données chargées : {len(df)} lignes.")
-    except FileNotFoundError:
+    if not os.path.exists(file_name):
         raise ValueError(f"Fichier introuvable : {file_name}")
-    except pd.errors.EmptyDataError:
-        raise ValueError(f"Fichier vide ou mal formaté : {file_name}")
-    
-    # Vérification de la colonne de timestamp
-    if 'timestamp' not in df.columns:
-        raise ValueError("La colonne 'timestamp' est manquante dans le fichier.")
-    
-    # Barre de progression pour simuler le tri
-    tqdm.pandas(desc="🔍 Tri des données")
-    df.sort_values(by='timestamp', inplace=True)
-    print("✅ Tri effectué.")
-    
-    # Réécrire les données triées dans le même fichier
-    print(f"💾 Réécriture des données triées dans {file_name}...")
-    df.to_csv(file_name, index=False)
-    print("✅ Réécriture terminée.")
 
-file_name = "historical_data_eth_1M.csv"
+    stats = external_sort_csv(file_name, memory_mb=memory_mb, dedupe=False)
+    print(f"✅ Tri effectué : {stats['rows']} lignes, {stats['runs']} blocs triés puis fusionnés en {stats['seconds']:.1f}s.")
 
-sort_csv_in_place(file_name)
+file_name = "historical_data_eth_1M.csv"
 
-print(f"✅ Fichier trié et réécrit : {file_name}")
+# inutile de réécrire le fichier s'il est déjà trié (rapport de la partie 1) ; rien à trier si la partie 1 a échoué
+if results["status"] != "success":
+    print(f"❌ Tri ignoré : {results['message']}")
+elif results["unsorted"]:
+    sort_csv_in_place(file_name)
+    print(f"✅ Fichier trié et réécrit : {file_name}")
+else:
+    print(f"✅ {file_name} est déjà trié.")
 
 # part 3 
-import pandas as pd
-from tqdm import tqdm
+import os
+from external_sort import MEMORY_LIMIT_MB, external_sort_csv
 
 """
 on supprime les doublons, il analyse les timestamp et supprime les doublons
+(même tri externe, on garde la première occurrence)
 """
 
-def remove_duplicates(file_name):
+def remove_duplicates(file_name, memory_mb=MEMORY_LIMIT_MB):
     """
-    Analyse et supprime les doublons dans un fichier CSV basé sur l'index (timestamp).
-    Modifie directement le fichier fourni.
+    Analyse et supprime les doublons dans un fichier CSV basé sur le timestamp.
+    Modifie directement le fichier fourni (le fichier est aussi trié).
 
     :param file_name: Chemin du fichier CSV à analyser et modifier.
+    :param memory_mb: Mémoire utilisée pour le tri (Mo).
     """
     print(f"🔍 Analyse du fichier {file_name} pour détecter les doublons...")
     
     try:
-        # Charger les données
-        df = pd.read_csv(file_name, parse_dates=['timestamp'], index_col='timestamp')
-        print(f"✅ Données chargées : {len(df)} lignes.")
-
-        # Identifier les doublons
-        duplicated = df.index.duplicated(keep='first')
-        num_duplicates = duplicated.sum()
-
-        if num_duplicates == 0:
+        stats = external_sort_csv(file_name, memory_mb=memory_mb, dedupe=True)
+        if stats["duplicates"] == 0:
             print("✅ Aucun doublon détecté.")
-            return
         else:
-            print(f"❌ {num_duplicates} doublons détectés.")
-        
-        # Suppression des doublons avec une barre de progression
-        print("🔄 Suppression des doublons en cours...")
-        df = df[~duplicated]
-        
-        # Réécrire le fichier original
-        print("💾 Mise à jour du fichier CSV...")
-        df.to_csv(file_name)
-        print(f"✅ Doublons supprimés. Fichier mis à jour : {file_name}")
+            print(f"✅ {stats['duplicates']} doublons supprimés. Fichier mis à jour : {file_name}")
     
     except FileNotFoundError:
         print(f"❌ Fichier introuvable : {file_name}")
@@ -175,67 +237,61 @@ def remove_duplicates(file_name):
         print(f"❌ Une erreur est survenue : {e}")
 
 file_name = "historical_data_eth_1M.csv"
-remove_duplicates(file_name)
+# si le fichier était trié, la partie 1 a déjà compté tous les doublons
+if results["status"] != "success":
+    print(f"❌ Suppression des doublons ignorée : {results['message']}")
+elif results["unsorted"] or results["duplicates"]:
+    remove_duplicates(file_name)
+else:
+    print(f"✅ Aucun doublon dans {file_name}.")
 
 # part 4
 ###############################
 # Verificer l'intégrité de la base de donnée
 ###############################
 
-file_path = 'historical_data_eth_1M.csv'  # Chemin vers votre fichier CSV
-df = pd.read_csv(file_path, parse_dates=['timestamp'], index_col='timestamp')
+# tout est déjà dans le rapport de la partie 1 (pas de nouvelle lecture du fichier) ;
+# relancer la partie 1 si les parties 2 ou 3 ont modifié le fichier
 
-#############################
-# vérification de l'entièreté de la base de donnée 
-############################
-expeted_interval = pd.Timedelta('1min')
-timestamp_diff = df.index.to_series().diff()
-
-anomalies = timestamp_diff[timestamp_diff != expeted_interval]
-
-# on exclus la première ligne comme une anomalie 
-anomalies = timestamp_diff[1:][timestamp_diff[1:] != expeted_interval]
-
-# Afficher le résultat
-if anomalies.empty:
-    print("✅ La base de données est complète. Tous les timestamps respectent l'intervalle de 1 minute.")
-else:
-    print(f"❌ La base de données a {len(anomalies)} anomalies.")
-    print("Premières anomalies détectées :")
-    print(anomalies.head())
-
-#############################
-# afficher l'entièreté de la base de donnée en % 
-#############################
-# plage complete attendue
-expected_index = pd.date_range(start=df.index.min(), end=df.index.max(), freq='1min')
-# calculer les stat 
-total_expected = len(expected_index)
-total_present = len(df)
-total_missing = total_expected - total_present
-# ccalculer le pourcentage de complétude 
-completeness_percentage = (total_present / total_expected) * 100
-# Afficher les résultats
-print(f"🔍 Vérification de la complétude des données...")
-print(f"📊 Total attendu : {total_expected} timestamps")
-print(f"📊 Total présent : {total_present} timestamps")
-print(f"📊 Total manquant : {total_missing} timestamps")
-print(f"📊 Complétude des données : {completeness_percentage:.2f}%")
-
-#############################
-# afficher le temps quil nous manque au totale 
-#############################
-missing_timestamps = expected_index.difference(df.index)
-# Calculer le temps total manquant
-if not missing_timestamps.empty:
-    total_missing_time = missing_timestamps[-1] - missing_timestamps[0]
-    total_minutes_missing = len(missing_timestamps)  # Nombre total de minutes manquantes
-    days, remainder = divmod(total_minutes_missing, 1440)  # 1 jour = 1440 minutes
-    hours, minutes = divmod(remainder, 60)
-
-    # Afficher les résultats
-    print(f"⏳ Temps total manquant : {days} jours, {hours} heures, {minutes} minutes.")
-    print(f"📊 Total manquant en minutes : {total_minutes_missing}")
+if results["status"] != "success":
+    print(f"❌ Vérification de l'entièreté impossible : {results['message']}")
 else:
-    print("✅ Aucune donnée manquante. Le fichier est complet.")
-
+    #############################
+    # vérification de l'entièreté de la base de donnée 
+    ############################
+    anomalies = results["gaps"]
+
+    # Afficher le résultat
+    if not results["total_missing"] and not results["misaligned"]:
+        print(f"✅ La base de données est complète. Tous les timestamps respectent l'intervalle de {results['interval']}.")
+    elif not results["exact"]:
+        print(f"❌ La base de données a environ {results['total_missing']} timestamps manquants "
+              "(fichier pas trié au moment de la partie 1 : relancer la partie 1 pour la liste des trous).")
+    else:
+        print(f"❌ La base de données a {len(anomalies) + results['misaligned']} anomalies.")
+        print("Premiers trous détectés :")
+        for gap in anomalies[:5]:
+            print(f"  - {gap['start']} -> {gap['end']} ({gap['missing']} manquants)")
+
+    #############################
+    # afficher l'entièreté de la base de donnée en % 
+    #############################
+    print(f"🔍 Vérification de la complétude des données...")
+    print(f"📊 Total attendu : {results['total_expected']} timestamps")
+    print(f"📊 Total présent : {results['total_present']} timestamps")
+    print(f"📊 Total manquant : {results['total_missing']} timestamps")
+    print(f"📊 Complétude des données : {results['completeness_percentage']:.2f}%")
+
+    #############################
+    # afficher le temps quil nous manque au totale 
+    #############################
+    if results["total_missing"]:
+        total_minutes_missing = results["total_missing"] * pd.Timedelta(results["interval"]) // pd.Timedelta('1min')
+        days, remainder = divmod(total_minutes_missing, 1440)  # 1 jour = 1440 minutes
+        hours, minutes = divmod(remainder, 60)
+
+        # Afficher les résultats
+        print(f"⏳ Temps total manquant : {days} jours, {hours} heures, {minutes} minutes.")
+        print(f"📊 Total manquant en minutes : {total_minutes_missing}")
+    else:
+        print("✅ Aucune donnée manquante. Le fichier est complet.")
@@ -0,0 +1,369 @@
+# moteur de backtest ré-entrant : les paramètres dans un objet, le solde et les positions dans une instance
+"""
+/*********************************\
+|* Moteur de backtest ré-entrant *|
+\*********************************/
+
+    * Les paramètres de main.py (BALANCE, INVEST_AMOUNT, FEE, MAX_TRANSACTION, TARGET_PROFIT, MAX_WINDOW,
+    SMA_VALUE, START_DATE, END_DATE) sont des variables globales, et le solde était modifié via `global` :
+    deux backtests ne pouvaient pas tourner dans le même processus. Ici :
+        - StrategyConfig : les paramètres d'un backtest (namedtuple, non modifiable ; main.strategy_config()
+          donne ceux de main.py, with_params en dérive une variante)
+        - MarketData : les bougies chargées une seule fois, en lecture seule, partagées par tous les moteurs.
+          Pour chaque (SMA_VALUE, START_DATE, END_DATE) les bougies de trading (jours complets dont la SMA est
+          chaude, comme dans main.py), leur SMA_X et leur ExitIndex sont calculés une fois puis réutilisés.
+        - BacktestEngine : un backtest (même logique que run_backtest), avec son propre solde, ses positions
+          et son registre de transactions.
+
+    * Plusieurs moteurs peuvent tourner en même temps sur les mêmes tableaux :
+        - run_engines : dans un pool de threads (la boucle d'événements est du python, le GIL la sérialise :
+          pour le débit sur plusieurs cœurs voir sweep.py, ici le but est de ne charger les données qu'une fois)
+        - run_interleaved : dans une seule boucle, chaque moteur avance de quelques événements à tour de rôle
+          (step), par exemple pour suivre plusieurs variantes en parallèle sur le même flux.
+
+    Lancement : python backtest_engine.py (les variantes de sweep.PARAM_GRID sur un seul chargement)
+"""
+
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from day_partition import MINUTES_PER_DAY, day_offsets
+from exit_index import ExitIndex
+from indicator_cache import IndicatorCache, derive_key, fingerprint
+from metrics import compute_metrics
+from trade_ledger import TradeLedger
+
+# nombre d'événements (achats / ventes) traités par un moteur à chaque tour de run_interleaved
+EVENTS_PER_TURN = 256
+
+# paramètres d'un backtest (mêmes noms que les variables de main.py, en minuscules)
+StrategyConfig = namedtuple("StrategyConfig", [
+    "balance", "invest_amount", "fee", "max_transaction", "target_profit", "max_window", "sma_value", "start_date", "end_date",
+])
+
+# bougies de trading d'une fenêtre SMA : tableaux en lecture seule + index de sortie + indices des signaux d'achat
+TradingWindow = namedtuple("TradingWindow", ["close", "sma_x", "timestamps", "exit_index", "buy_indices"])
+
+
+def with_params(config, params):
+    """
+    Variante d'une configuration.
+
+    :param params: Dictionnaire {nom: valeur}, noms de main.py ("SMA_VALUE") ou de StrategyConfig ("sma_value").
+    :return: Nouvelle StrategyConfig.
+    """
+    return config._replace(**{name.lower(): value for name, value in params.items()})
+
+
+def complete_day_rows(timestamps):
+    """
+    Indices des lignes qui appartiennent à un jour complet (1440 minutes), comme subdivide_db_by_date
+    suivi du filtre de calculate_sma_x_on_daily_data.
+
+    :param timestamps: Tableau int64 des dates en nanosecondes (trié).
+    """
+    _, starts, ends = day_offsets(timestamps)
+    complete_starts = starts[ends - starts == MINUTES_PER_DAY]
+    return (complete_starts[:, None] + np.arange(MINUTES_PER_DAY)).ravel()
+
+
+def select_trading_days(timestamps, close, window, cache=None, complete_rows=None, data_key=None):
+    """
+    Équivalent en tableaux de subdivide_db_by_date + calculate_sma_x_on_daily_data :
+    on garde les jours complets (1440 minutes) dont toute la SMA est chaude.
+
+    :param timestamps: Tableau int64 des dates en nanosecondes (trié).
+    :param close: Tableau des prix de clôture.
+    :param window: SMA_VALUE.
+    :param cache: IndicatorCache à utiliser (un nouveau par défaut).
+    :param complete_rows: Résultat de complete_day_rows si déjà calculé.
+    :param data_key: Empreinte de (timestamps, close) si connue (sinon le cache hashe les prix gardés).
+    :return: (indices des lignes gardées, SMA_X de ces lignes)
+    """
+    cache = cache or IndicatorCache()
+    rows = complete_day_rows(timestamps) if complete_rows is None else complete_rows
+    if len(rows) == 0:
+        return rows, np.empty(0)
+    # même série (jours complets mis bout à bout) que calculate_sma_x_on_daily_data, donc même SMA
+    key = derive_key(data_key, "complete_days") if data_key else None
+    sma_x = cache.sma(np.ascontiguousarray(close[rows]), window, key).reshape(-1, MINUTES_PER_DAY)
+    warm_days = ~np.isnan(sma_x).any(axis=1)
+    return rows.reshape(-1, MINUTES_PER_DAY)[warm_days].ravel(), sma_x[warm_days].ravel()
+
+
+def _read_only(array, dtype):
+    # vue contiguë en lecture seule (un moteur ne peut pas modifier les données des autres,
+    # le tableau de l'appelant reste modifiable)
+    array = np.ascontiguousarray(array, dtype=dtype).view()
+    array.flags.writeable = False
+    return array
+
+
+def trading_window(close, sma_x, timestamps, exit_index=None):
+    """
+    TradingWindow à partir de tableaux de bougies de trading déjà sélectionnées.
+    """
+    close = _read_only(close, np.float64)
+    sma_x = _read_only(sma_x, np.float64)
+    timestamps = _read_only(timestamps, np.int64)
+    if exit_index is None:
+        exit_index = ExitIndex(close, timestamps)
+    # indices des signaux d'achat calculés en une seule passe (même test que buy_condition)
+    buy_indices = _read_only(np.flatnonzero(close > sma_x), np.int64)
+    return TradingWindow(close, sma_x, timestamps, exit_index, buy_indices)
+
+
+class MarketData:
+    """
+    Bougies 1m en lecture seule, partagées par tous les moteurs d'un processus.
+
+    :param close: Tableau des prix de clôture.
+    :param timestamps: Tableau int64 des dates en nanosecondes (trié).
+    :param cache: IndicatorCache pour les SMA (un nouveau par défaut).
+    :param data_key: Empreinte des bougies si connue (ex: main.data_key_for), sinon calculée une seule fois
+                     au premier besoin.
+    """
+
+    def __init__(self, close, timestamps, cache=None, data_key=None):
+        self.close = _read_only(close, np.float64)
+        self.timestamps = _read_only(timestamps, np.int64)
+        self.cache = cache or IndicatorCache()
+        self.data_key = data_key
+        self.windows = {}
+        # plusieurs threads peuvent demander la même fenêtre : elle n'est calculée qu'une fois
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df, cache=None, data_key=None):
+        """
+        MarketData à partir du DataFrame de downloadDb (index = dates, colonne close).
+        """
+        return cls(df['close'].to_numpy(dtype=np.float64), df.index.values.astype('datetime64[ns]').view(np.int64), cache, data_key)
+
+    def __len__(self):
+        return len(self.close)
+
+    def window(self, sma_value, start_date=None, end_date=None):
+        """
+        Bougies de trading pour une SMA_VALUE entre deux dates (incluses), comme main.py avec
+        START_DATE / END_DATE : seules les bougies de la période servent à la SMA.
+
+        :return: TradingWindow (calculée au premier appel, puis partagée).
+        """
+        key = (sma_value, start_date or None, end_date or None)
+        with self._lock:
+            if key not in self.windows:
+                i = int(np.searchsorted(self.timestamps, pd.Timestamp(start_date).value)) if start_date else 0
+                j = int(np.searchsorted(self.timestamps, pd.Timestamp(end_date).value, side='right')) if end_date else len(self.timestamps)
+                timestamps, close = self.timestamps[i:j], self.close[i:j]
+                # les prix ne sont hashés qu'une fois pour toutes les fenêtres
+                if self.data_key is None:
+                    self.data_key = derive_key(fingerprint(self.close), fingerprint(self.timestamps))
+                data_key = derive_key(self.data_key, start_date or None, end_date or None)
+                rows, sma_x = select_trading_days(timestamps, close, sma_value, self.cache, data_key=data_key)
+                self.windows[key] = trading_window(close[rows], sma_x, timestamps[rows])
+            return self.windows[key]
+
+    def engine(self, config):
+        """
+        Nouveau moteur sur ces bougies.
+        """
+        return BacktestEngine(config, self.window(config.sma_value, config.start_date, config.end_date))
+
+
+class BacktestEngine:
+    """
+    Un backtest SMA_X avec son propre état (solde, positions ouvertes, registre), sur une TradingWindow
+    partagée en lecture seule. Même résultat que run_backtest de main.py.
+
+    :param config: StrategyConfig.
+    :param window: TradingWindow (voir MarketData.window ou trading_window).
+    """
+
+    def __init__(self, config, window):
+        self.config = config
+        self.window = window
+        self.balance = config.balance
+        # positions ouvertes : [trade_id, buy_price, quantity, buy_fee, exit_bar]
+        self.positions = []
+        # registre de toutes les transactions (voir trade_ledger.py)
+        self.ledger = TradeLedger()
+        self.closed_at_end = 0
+        self.done = False
+        n = len(window.close)
+        # prochaine bougie à traiter et plus petite bougie de vente parmi les positions ouvertes
+        self._i = 0
+        self._next_exit = n
+
+    def step(self, max_events=None):
+        """
+        Avance le backtest de max_events événements (un achat et / ou des ventes sur une bougie),
+        jusqu'à la fin si None. Les positions encore ouvertes à la fin sont clôturées au dernier prix.
+
+        :return: True s'il reste des bougies à traiter.
+        """
+        if self.done:
+            return False
+        config = self.config
+        close, timestamps, exit_index, buy_indices = self.window.close, self.window.timestamps, self.window.exit_index, self.window.buy_indices
+        invest_amount, fee_rate, max_transaction = config.invest_amount, config.fee, config.max_transaction
+        # fenêtre max en nanosecondes (même test que sell_condition)
+        max_window_ns = config.max_window * 60 * 10**9
+        target_factor = 1 + config.target_profit + 2 * fee_rate
+        balance, positions, ledger = self.balance, self.positions, self.ledger
+        n = len(close)
+        next_exit = self._next_exit
+        i = self._i
+        events = 0
+        while max_events is None or events < max_events:
+            # prochain achat possible : seulement s'il reste de la place et du solde
+            next_buy = n
+            if len(positions) < max_transaction and balance >= invest_amount:
+                k = int(np.searchsorted(buy_indices, i))
+                if k < len(buy_indices):
+                    next_buy = int(buy_indices[k])
+            # on saute directement au prochain événement
+            i = min(next_buy, next_exit)
+            if i >= n:
+                break
+            # item() : float python, bien plus rapide qu'un scalaire numpy dans les calculs
+            price = close.item(i)
+            # condition d'achat
+            if i == next_buy:
+                buy_fee = invest_amount * fee_rate
+                net_investment = invest_amount - buy_fee
+                quantity = net_investment / price
+                target_price = price * target_factor
+                balance -= invest_amount
+                now = timestamps.item(i)
+                trade_id = ledger.open(i, now, price, quantity, buy_fee, target_price)
+                exit_bar = exit_index.exit_bar(i, target_price, now + max_window_ns)
+                positions.append([trade_id, price, quantity, buy_fee, exit_bar])
+                next_exit = min(next_exit, exit_bar)
+            # condition de vente : les positions dont c'est la bougie de sortie, dans l'ordre d'achat
+            if i == next_exit:
+                now = timestamps.item(i)
+                remaining = []
+                for position in positions:
+                    if position[4] == i:
+                        sell_fee = price * position[2] * fee_rate
+                        net_proceeds = price * position[2] - sell_fee
+                        profit = net_proceeds - (position[1] * position[2] + position[3])
+                        balance += net_proceeds
+                        ledger.close(position[0], i, now, price, sell_fee, profit)
+                    else:
+                        remaining.append(position)
+                positions = remaining
+                next_exit = min((position[4] for position in positions), default=n)
+            i += 1
+            events += 1
+        self.balance, self.positions, self._next_exit, self._i = balance, positions, next_exit, i
+        if i >= n:
+            self._finish()
+        return not self.done
+
+    def _finish(self):
+        # Clôturer les transactions ouvertes restantes au dernier prix disponible
+        n = len(self.window.close)
+        self.closed_at_end = len(self.positions)
+        if self.positions:
+            last_index = n - 1
+            price = self.window.close.item(last_index)
+            now = self.window.timestamps.item(last_index)
+            fee_rate = self.config.fee
+            for position in self.positions:
+                sell_fee = price * position[2] * fee_rate
+                net_proceeds = price * position[2] - sell_fee
+                profit = net_proceeds - (position[1] * position[2] + position[3])
+                self.balance += net_proceeds
+                self.ledger.close(position[0], last_index, now, price, sell_fee, profit)
+            self.positions = []
+        self.done = True
+
+    def run(self):
+        """
+        Lance le backtest jusqu'au bout.
+
+        :return: Le moteur (engine.balance, engine.ledger, engine.report()).
+        """
+        self.step()
+        return self
+
+    def period(self):
+        """
+        (première, dernière) date des bougies de trading en ns, ou None.
+        """
+        timestamps = self.window.timestamps
+        return (int(timestamps[0]), int(timestamps[-1])) if len(timestamps) else None
+
+    def report(self, curve=True):
+        """
+        Métriques du backtest (voir metrics.py).
+        """
+        return compute_metrics(self.ledger.to_dataframe(), self.balance, self.config.balance, self.period(), curve)
+
+
+def run_engines(engines, workers=None):
+    """
+    Lance des moteurs jusqu'au bout dans un pool de threads.
+
+    :param workers: Nombre de threads (par défaut celui de ThreadPoolExecutor).
+    :return: Les moteurs, dans le même ordre.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(BacktestEngine.run, engines))
+
+
+def run_interleaved(engines, events=EVENTS_PER_TURN):
+    """
+    Fait avancer des moteurs à tour de rôle dans une seule boucle, `events` événements chacun par tour.
+
+    :return: Les moteurs, dans le même ordre.
+    """
+    running = list(engines)
+    while running:
+        running = [engine for engine in running if engine.step(events)]
+    return list(engines)
+
+
+def run_configs(data, configs, workers=None):
+    """
+    Un moteur par configuration sur les mêmes bougies : les fenêtres sont préparées une fois
+    (une par SMA_VALUE / période), puis les moteurs tournent dans un pool de threads.
+
+    :param data: MarketData.
+    :param configs: Liste de StrategyConfig.
+    :return: Liste des moteurs terminés, dans l'ordre de `configs`.
+    """
+    for config in configs:
+        data.window(config.sma_value, config.start_date, config.end_date)
+    return run_engines([data.engine(config) for config in configs], workers)
+
+
+def main():
+    import main as bot
+    from sweep import PARAM_GRID, expand_grid
+
+    config = bot.strategy_config()
+    # un seul chargement pour toutes les variantes
+    df = bot.downloadDb(bot.FILE_NAME, config.start_date, config.end_date)
+    data = MarketData.from_frame(df, data_key=bot.data_key_for(bot.FILE_NAME, config.start_date, config.end_date))
+    del df
+    configs = [with_params(config, params) for params in expand_grid(PARAM_GRID)]
+    print(f"🔄 {len(configs)} backtests sur {len(data)} bougies chargées une seule fois...")
+    started = time.perf_counter()
+    engines = run_configs(data, configs)
+    elapsed = time.perf_counter() - started
+    rows = [dict(params, final_balance=engine.balance, transactions=len(engine.ledger))
+            for params, engine in zip(expand_grid(PARAM_GRID), engines)]
+    print(f"✅ {len(engines)} backtests en {elapsed:.1f}s")
+    print(pd.DataFrame(rows).sort_values("final_balance", ascending=False).head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
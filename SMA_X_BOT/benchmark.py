@@ -0,0 +1,262 @@
+# benchmark de chaque étape du backtest sur des bougies synthétiques
+"""
+/*********************************\
+|* Benchmark du pipeline SMA_X   *|
+\*********************************/
+
+    * Mesurer downloadDb, subdivide_db_by_date, calculate_sma_x_on_daily_data, le trading et print_report
+    demandait le vrai CSV Binance (plusieurs centaines de Mo) et un accès réseau. Ici on génère un CSV de
+    bougies 1m synthétiques (mouvement brownien géométrique, graine fixe) avec des trous et des doublons
+    comme dans les vrais téléchargements, de 10k à 50M lignes (écrit par blocs, mémoire constante).
+
+    * Chaque étape de main() est chronométrée : durée, lignes/s et pic de mémoire (tracemalloc, les tableaux
+    numpy compris ; les durées sont donc mesurées avec tracemalloc actif). Les résultats vont dans un JSON.
+
+    * --compare ancien.json : une étape est une régression si elle est plus lente (ou utilise plus de mémoire)
+    que dans l'ancien résultat de plus de --threshold (20% par défaut) ; le script sort alors avec le code 1.
+
+    Lancement : python benchmark.py --rows 1M [--output bench.json] [--compare ancien.json] [--threshold 0.2] [--iterrows]
+    (python benchmark.py --help pour toutes les options)
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import main as bot
+from indicator_cache import IndicatorCache
+from instrumentation import stage
+
+# nombre de lignes par défaut
+ROWS = 1_000_000
+# graine du générateur
+SEED = 42
+# probabilité qu'une minute commence un trou, et longueur moyenne d'un trou (minutes)
+GAP_RATE = 0.0005
+GAP_LENGTH = 30
+# part des lignes écrites en double
+DUPLICATE_RATE = 0.0002
+# lignes générées à la fois
+CHUNK_ROWS = 1_000_000
+# au-delà, la boucle iterrows (trade) n'est pas mesurée (trop lente)
+ITERROWS_MAX_ROWS = 200_000
+# seuil de régression par défaut (+20%)
+THRESHOLD = 0.2
+# en dessous de cette durée (s) une étape n'est pas comparée (bruit de mesure)
+MIN_SECONDS = 0.05
+# fichier de résultats par défaut
+OUTPUT_FILE = "benchmark_results.json"
+
+
+def parse_rows(text):
+    """
+    "10k", "1M", "50M" ou "250000" -> nombre de lignes.
+    """
+    text = str(text).strip().lower()
+    factor = {"k": 10**3, "m": 10**6}.get(text[-1], 1)
+    return int(float(text[:-1] if factor > 1 else text) * factor)
+
+
+def generate_candles(rows, seed=SEED, start="2020-01-01", gap_rate=GAP_RATE, gap_length=GAP_LENGTH, duplicate_rate=DUPLICATE_RATE,
+                     price=1000.0, drift=0.0, volatility=0.0008, chunk_rows=CHUNK_ROWS):
+    """
+    Génère des bougies 1m par blocs : prix de clôture en mouvement brownien géométrique, open = clôture
+    précédente, high / low autour, trous (minutes absentes) et doublons.
+
+    :param rows: Nombre de minutes générées (avant trous et doublons).
+    :param drift: Tendance par minute du log-prix.
+    :param volatility: Écart type par minute du log-prix.
+    :return: Itérateur de DataFrames (timestamp, open, high, low, close, volume).
+    """
+    rng = np.random.default_rng(seed)
+    start_minute = pd.Timestamp(start).value // (60 * 10**9)
+    # fin du trou en cours (en minutes depuis le début), reportée d'un bloc à l'autre
+    gap_end = 0
+    for offset in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - offset)
+        minutes = offset + np.arange(n)
+        log_returns = drift + volatility * rng.standard_normal(n)
+        close = price * np.exp(np.cumsum(log_returns))
+        open_ = np.concatenate([[price], close[:-1]])
+        spread = np.abs(rng.standard_normal(n)) * volatility / 2
+        high = np.maximum(open_, close) * (1 + spread)
+        low = np.minimum(open_, close) * (1 - spread)
+        volume = rng.gamma(2.0, 5.0, n)
+        price = close[-1]
+        # trous : chaque minute peut commencer un trou de longueur géométrique
+        keep = np.ones(n, dtype=bool)
+        starts = np.flatnonzero(rng.random(n) < gap_rate)
+        lengths = rng.geometric(1 / gap_length, len(starts))
+        keep[:max(0, gap_end - offset)] = False
+        for first, length in zip(starts.tolist(), lengths.tolist()):
+            keep[first:first + length] = False
+            gap_end = max(gap_end, offset + first + length)
+        # doublons : certaines lignes sont écrites deux fois
+        index = np.flatnonzero(keep)
+        index = np.sort(np.concatenate([index, index[rng.random(len(index)) < duplicate_rate]]), kind='stable')
+        yield pd.DataFrame({
+            "timestamp": pd.to_datetime((start_minute + minutes[index]) * 60 * 10**9),
+            "open": np.round(open_[index], 2), "high": np.round(high[index], 2), "low": np.round(low[index], 2),
+            "close": np.round(close[index], 2), "volume": np.round(volume[index], 4),
+        })
+
+
+def write_candles_csv(file_name, rows, **kwargs):
+    """
+    Écrit un CSV de bougies synthétiques au format de download_db.py.
+
+    :return: Le nombre de lignes écrites.
+    """
+    written = 0
+    with open(file_name, "w", newline="") as f:
+        for i, chunk in enumerate(generate_candles(rows, **kwargs)):
+            chunk.to_csv(f, header=i == 0, index=False)
+            written += len(chunk)
+    return written
+
+
+def peak_rss_mb():
+    """
+    Pic de mémoire (RSS) du processus en Mo, ou None si indisponible (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(results, name, rows, function, *args):
+    """
+    Lance une étape sans ses print, et enregistre durée, temps CPU, lignes/s, pic de mémoire et compteurs
+    dans `results` (mesures de instrumentation.py, tracemalloc actif). rows=None : le nombre de lignes
+    renvoyées par l'étape.
+
+    :return: Le résultat de l'étape.
+    """
+    with stage(name, rows, memory=True) as s, contextlib.redirect_stdout(io.StringIO()):
+        value = function(*args)
+        if rows is None:
+            s.rows_in = s.rows_out = len(value)
+    record = s.record
+    results[name] = {
+        "seconds": record["wall_s"],
+        "cpu_seconds": record["cpu_s"],
+        "rows": record["rows_in"],
+        "rows_per_sec": record["rows_per_sec"],
+        "peak_mb": record["peak_mb"],
+        "counters": record["counters"],
+    }
+    print(f"  {name:<32} {record['wall_s']:8.3f}s {record['rows_per_sec'] or 0:14,.0f} lignes/s {record['peak_mb']:9.1f} Mo")
+    return value
+
+
+def run_pipeline(file_name, iterrows=None):
+    """
+    Chronomètre chaque étape de main() sur un fichier de bougies.
+
+    :param iterrows: True pour mesurer aussi la boucle d'origine (trade), par défaut si le fichier est petit.
+    :return: Dictionnaire {étape: mesures}.
+    """
+    results = {}
+    bot.START_DATE = bot.END_DATE = None
+    df = measure(results, "downloadDb", None, bot.downloadDb, file_name)
+    rows = len(df)
+    measure(results, "verify_db_integrity", rows, bot.verify_db_integrity, df, '1min')
+    daily_data = measure(results, "subdivide_db_by_date", rows, bot.subdivide_db_by_date, df)
+    # sans cache disque : on mesure le calcul, pas la relecture d'un .npy
+    daily_data = measure(results, "calculate_sma_x_on_daily_data", rows, bot.calculate_sma_x_on_daily_data, daily_data, IndicatorCache(cache_dir=None))
+    trading_rows = int(daily_data.lengths.sum())
+    trades = measure(results, "trade_vectorized", trading_rows, bot.trade_vectorized, daily_data)
+    if iterrows if iterrows is not None else trading_rows <= ITERROWS_MAX_ROWS:
+        measure(results, "trade", trading_rows, bot.trade, daily_data)
+    measure(results, "print_report", len(trades), bot.print_report, trades, [])
+    return results
+
+
+def run_benchmark(rows=ROWS, seed=SEED, output=OUTPUT_FILE, iterrows=None, tmp_dir=None, **kwargs):
+    """
+    Génère le fichier synthétique, mesure le pipeline et écrit le JSON des résultats.
+
+    :return: Dictionnaire des résultats (meta + étapes).
+    """
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as work_dir:
+        file_name = os.path.join(work_dir, "synthetic_candles.csv")
+        started = time.perf_counter()
+        written = write_candles_csv(file_name, rows, seed=seed, **kwargs)
+        print(f"🔄 {written} lignes synthétiques générées en {time.perf_counter() - started:.1f}s "
+              f"({os.path.getsize(file_name) / 1024**2:.0f} Mo)")
+        stages = run_pipeline(file_name, iterrows)
+    results = {
+        "meta": {
+            "rows": rows, "written": written, "seed": seed, **kwargs,
+            "date": pd.Timestamp.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count(), "peak_rss_mb": peak_rss_mb(),
+        },
+        "stages": stages,
+        "total_seconds": sum(stage["seconds"] for stage in stages.values()),
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"📊 Résultats enregistrés dans {output}")
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD, min_seconds=MIN_SECONDS):
+    """
+    Compare deux résultats étape par étape.
+
+    :return: Liste des régressions (étape, mesure, ancienne valeur, nouvelle valeur).
+    """
+    regressions = []
+    if baseline["meta"]["rows"] != results["meta"]["rows"]:
+        print(f"⚠️ Tailles différentes ({baseline['meta']['rows']} vs {results['meta']['rows']} lignes), comparaison indicative.")
+    for name, stage in results["stages"].items():
+        old = baseline["stages"].get(name)
+        if old is None:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            if metric == "seconds" and max(old[metric], stage[metric]) < min_seconds:
+                continue
+            change = stage[metric] / old[metric] - 1 if old[metric] else 0.0
+            flag = "❌" if change > threshold else "✅"
+            print(f"  {flag} {name:<32} {metric:<8} {old[metric]:10.3f} -> {stage[metric]:10.3f} ({change:+.0%})")
+            if change > threshold:
+                regressions.append((name, metric, old[metric], stage[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de chaque étape du backtest sur des bougies synthétiques.")
+    parser.add_argument("--rows", type=parse_rows, default=ROWS, help="nombre de bougies (10k, 1M, 50M...)")
+    parser.add_argument("--seed", type=int, default=SEED, help="graine du générateur")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="fichier JSON des résultats")
+    parser.add_argument("--compare", default=None, help="ancien JSON de résultats à comparer")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="seuil de régression (0.2 = +20%%)")
+    parser.add_argument("--iterrows", action="store_true", default=None,
+                        help="mesure aussi la boucle iterrows (trade), par défaut seulement si le fichier est petit")
+    args = parser.parse_args()
+    results = run_benchmark(args.rows, args.seed, args.output, args.iterrows)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} régression(s) par rapport à {args.compare}")
+            sys.exit(1)
+        print(f"✅ Pas de régression par rapport à {args.compare}")
+
+if __name__ == "__main__":
+    main()
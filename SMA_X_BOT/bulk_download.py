@@ -0,0 +1,206 @@
+# téléchargement de plusieurs paires / intervalles en une seule fois
+"""
+/*********************************\
+|* Téléchargement en masse       *|
+\*********************************/
+
+    * Un job = (symbole, intervalle, date de début, date de fin). Toutes les requêtes de tous les jobs
+    passent par une seule ClientSession (pool de connexions keep-alive + cache DNS) et un seul RateLimiter :
+    le budget de poids de l'API est partagé entre les paires, la durée totale dépend de la limite de l'API
+    et plus du nombre de paires (avant : un lancement du script par paire, l'un après l'autre).
+
+    * Chaque paire est écrite dans son propre store (voir candle_store.py) : <STORE_DIR>/<SYMBOLE>_<intervalle>.store.
+    Si le store existe déjà, seule la fin manquante est téléchargée (rafraîchissement).
+
+    * Les pages d'un job arrivent dans l'ordre (fetch_pages_in_order) et sont converties en tableaux numpy tout
+    de suite ; tous les BATCH_ROWS bougies, le lot est écrit dans le store. La mémoire d'un job ne dépend pas
+    de la longueur de l'historique, et une erreur en fin de job ne perd que le dernier lot (la relance reprend
+    après la dernière bougie écrite).
+
+    Lancement : python bulk_download.py
+    Benchmark contre le faux serveur local : python bulk_download.py --benchmark
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from candle_store import COLUMNS, merge_candles, read_meta, store_exists, to_epoch_minutes, write_store
+from instrumentation import format_summary, stage
+from download_db import INTERVAL_MS, candles_to_dataframe, fetch_pages_in_order, page_ranges, report_failed_ranges, resolve_range
+from rate_limiter import RateLimiter
+
+# jobs (symbole, intervalle, date de début, date de fin ou None pour maintenant)
+JOBS = [
+    ("ETHUSDT", "1m", "01 January 2017", None),
+    ("BTCUSDT", "1m", "01 January 2017", None),
+    ("BNBUSDT", "1m", "01 January 2017", None),
+    ("SOLUSDT", "1m", "01 January 2020", None),
+    ("ETHUSDT", "1h", "01 January 2017", None),
+]
+# dossier des stores
+STORE_DIR = "stores"
+# nombre max de connexions ouvertes dans le pool (toutes paires confondues)
+POOL_SIZE = 64
+# durée de vie du cache DNS (s)
+DNS_CACHE_SECONDS = 300
+# durée pendant laquelle une connexion inutilisée reste ouverte (s)
+KEEPALIVE_SECONDS = 30
+# bougies gardées en mémoire par job avant d'être écrites dans le store
+BATCH_ROWS = 500_000
+
+
+def job_store_path(symbol, interval, store_dir=STORE_DIR):
+    """
+    Chemin du store d'une paire pour un intervalle.
+    """
+    return os.path.join(store_dir, f"{symbol}_{interval}.store")
+
+
+def job_ranges(job, store_dir=STORE_DIR):
+    """
+    Segments à télécharger pour un job : tout l'historique, ou seulement la fin si le store existe déjà.
+
+    :return: (chemin du store, liste des segments (start_ts, end_ts))
+    """
+    symbol, interval, start_date, end_date = job
+    interval_ms = INTERVAL_MS[interval]
+    store_path = job_store_path(symbol, interval, store_dir)
+    start_ts = None
+    if store_exists(store_path):
+        last = read_meta(store_path)["last"]
+        if last is not None:
+            # les timestamps du store sont en minutes
+            start_ts = last * 60 * 1000 + interval_ms
+    start_ts, end_ts = resolve_range(start_date, end_date, start_ts)
+    return store_path, page_ranges(start_ts, end_ts, interval_ms)
+
+
+def save_batch(store_path, frames):
+    """
+    Écrit un lot de pages d'un job dans son store : création, sinon ajout au bout des colonnes
+    (merge_candles -> append_candles, le store n'est pas réécrit).
+
+    :param frames: DataFrames OHLCV numériques (une par page), dans l'ordre.
+    :return: Le nombre de bougies ajoutées.
+    """
+    df = pd.concat(frames)
+    if store_exists(store_path):
+        return merge_candles(store_path, df)
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    write_store(store_path, to_epoch_minutes(df.index), {name: df[name].to_numpy(dtype=np.float64) for name in COLUMNS})
+    return len(df)
+
+
+def make_session(pool_size=POOL_SIZE):
+    """
+    Session HTTP partagée par tous les jobs : pool de connexions keep-alive et cache DNS.
+    """
+    connector = aiohttp.TCPConnector(limit=pool_size, ttl_dns_cache=DNS_CACHE_SECONDS, keepalive_timeout=KEEPALIVE_SECONDS)
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def run_job(session, limiter, job, position=0, store_dir=STORE_DIR, api_url=None):
+    """
+    Télécharge un job avec la session et le limiteur partagés et l'écrit dans son store par lots de BATCH_ROWS
+    bougies. Les bougies pas encore clôturées sont ignorées.
+
+    :param position: Ligne de la barre de progression du job.
+    :return: Résumé du job (symbole, intervalle, bougies ajoutées, segments en échec).
+    """
+    symbol, interval = job[0], job[1]
+    store_path, ranges = job_ranges(job, store_dir)
+    # une étape par job : requêtes, retries et 429 de la paire (voir instrumentation.py)
+    with stage(f"{symbol} {interval}", len(ranges)) as job_stage:
+        now_ms = int(time.time() * 1000)
+        stats = {}
+        added = 0
+        frames = []
+        rows = 0
+        with tqdm(total=len(ranges), desc=f"{symbol} {interval}", position=position, leave=True) as progress:
+            async for page in fetch_pages_in_order(session, symbol, ranges, limiter, api_url, stats, interval):
+                page = [candle for candle in page if candle[6] < now_ms]
+                if page:
+                    frames.append(candles_to_dataframe(page).apply(pd.to_numeric))
+                    rows += len(frames[-1])
+                if rows >= BATCH_ROWS:
+                    # l'écriture du store ne bloque pas les autres jobs
+                    added += await asyncio.to_thread(save_batch, store_path, frames)
+                    frames = []
+                    rows = 0
+                progress.update(1)
+        if frames:
+            added += await asyncio.to_thread(save_batch, store_path, frames)
+        job_stage.rows_out = added
+    return {"symbol": symbol, "interval": interval, "store": store_path, "added": added, "failed": stats.get("failed_ranges", [])}
+
+
+async def bulk_download(jobs, store_dir=STORE_DIR, api_url=None, limiter=None, pool_size=POOL_SIZE):
+    """
+    Lance tous les jobs en même temps sur une seule session et un seul budget de poids.
+
+    :param jobs: Liste de (symbole, intervalle, date de début, date de fin).
+    :param limiter: RateLimiter partagé (un nouveau par défaut).
+    :return: Liste des résumés des jobs, dans l'ordre de `jobs`.
+    """
+    limiter = limiter or RateLimiter(max_concurrency=pool_size)
+    async with make_session(pool_size) as session:
+        results = await asyncio.gather(*[
+            run_job(session, limiter, job, position, store_dir, api_url) for position, job in enumerate(jobs)
+        ])
+    for result in results:
+        print(f"✅ {result['symbol']} {result['interval']} : {result['added']} bougies ajoutées dans {result['store']}")
+        report_failed_ranges(result["failed"])
+    print(f"📊 {limiter.stats['requests']} requêtes, {limiter.stats['throttled']} 429/418, "
+          f"requêtes en vol max : {limiter.stats['peak_concurrency']}")
+    return results
+
+
+async def benchmark(symbols=20, days=7, weight_limit=200, window_seconds=1, latency=0.2, port=8095):
+    """
+    Compare, contre le faux serveur local, le rafraîchissement de `symbols` paires une par une
+    (une session et un limiteur par paire, comme en lançant download_db.py plusieurs fois)
+    et en masse (bulk_download).
+    """
+    import tempfile
+    import fake_klines_server
+
+    end_ts = int(time.time() * 1000)
+    start_date = pd.Timestamp(end_ts - days * 86400 * 1000, unit='ms').strftime("%d %B %Y")
+    jobs = [(f"PAIR{i}USDT", "1m", start_date, None) for i in range(symbols)]
+    app = fake_klines_server.create_app(weight_limit=weight_limit, window_seconds=window_seconds, latency=latency)
+    runner, url = await fake_klines_server.start_server(app, port=port)
+    try:
+        with tempfile.TemporaryDirectory() as store_dir:
+            started = time.perf_counter()
+            for job in jobs:
+                await bulk_download([job], os.path.join(store_dir, "one_by_one"), url, RateLimiter(weight_limit, window_seconds))
+            one_by_one = time.perf_counter() - started
+
+            started = time.perf_counter()
+            await bulk_download(jobs, os.path.join(store_dir, "bulk"), url, RateLimiter(weight_limit, window_seconds))
+            bulk = time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+    print(f"⏱️ {symbols} paires x {days} jours : une par une {one_by_one:.1f}s, en masse {bulk:.1f}s "
+          f"(x{one_by_one / bulk:.1f})")
+    return one_by_one, bulk
+
+
+def main():
+    if "--benchmark" in sys.argv:
+        asyncio.run(benchmark())
+        return
+    with stage("bulk_download"):
+        asyncio.run(bulk_download(JOBS))
+    print(format_summary())
+
+
+if __name__ == "__main__":
+    main()
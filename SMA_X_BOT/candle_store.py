@@ -0,0 +1,345 @@
+# stockage binaire en colonnes des bougies
+"""
+/*********************************\
+|* Candle store (colonnes .npy)  *|
+\*********************************/
+
+    * Relire le CSV de plusieurs centaines de Mo à chaque lancement coûte cher (parsing texte + parse_dates).
+    On le convertit une seule fois en un dossier "<nom>.store" qui contient une colonne par fichier .npy :
+        - timestamp.npy : int64, minutes depuis l'epoch (triées, sans doublons)
+        - open.npy, high.npy, low.npy, close.npy, volume.npy : float64 (ou float32)
+        - meta.json : nombre de lignes, colonnes, première et dernière bougie
+
+    * Les fichiers sont ouverts en mémoire mappée (mmap), une plage de dates est trouvée par recherche
+    dichotomique sur la colonne timestamp, et seule cette tranche est lue sur le disque.
+
+    * Des bougies plus récentes que la dernière du store sont ajoutées au bout de chaque .npy (append_candles) :
+    seul l'en-tête du fichier est réécrit, pas les colonnes. meta.json est écrit en dernier et son nombre de
+    lignes fait foi : une écriture interrompue laisse des octets en trop à la fin des fichiers, ignorés à la
+    lecture et écrasés par l'ajout suivant. merge_candles ne trie et ne réécrit tout le store que pour des
+    bougies qui tombent au milieu (trous réparés).
+
+    * store_fingerprint identifie le contenu d'un store (meta.json + taille et date de modification de chaque
+    .npy) sans lire les colonnes : le cache d'indicateurs s'en sert comme clef au lieu de hasher les prix.
+
+    Conversion : python candle_store.py 1_min_eth_candles_01012017_15112024.csv
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+# colonnes OHLCV stockées
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+# extension du dossier de stockage
+STORE_SUFFIX = ".store"
+# nanosecondes dans une minute
+NS_PER_MINUTE = 60 * 10**9
+
+
+def store_path_for(filename):
+    """
+    Renvoie le chemin du store associé à un fichier CSV (même nom, extension .store).
+    """
+    return os.path.splitext(filename)[0] + STORE_SUFFIX
+
+
+def store_exists(store_path):
+    """
+    True si le store existe et est complet (meta.json écrit en dernier).
+    """
+    return os.path.isfile(os.path.join(store_path, "meta.json"))
+
+
+def to_epoch_minutes(timestamps):
+    """
+    Convertit des dates (DatetimeIndex, Series, tableau) en minutes depuis l'epoch (int64).
+    """
+    ns = pd.DatetimeIndex(timestamps).as_unit('ns').asi8
+    if (ns % NS_PER_MINUTE).any():
+        raise ValueError("Timestamps must be aligned on whole minutes.")
+    return ns // NS_PER_MINUTE
+
+
+def from_epoch_minutes(minutes):
+    """
+    Convertit des minutes depuis l'epoch en DatetimeIndex.
+    """
+    return pd.DatetimeIndex((np.asarray(minutes, dtype=np.int64) * NS_PER_MINUTE).view('datetime64[ns]'), name='timestamp')
+
+
+def write_store(store_path, timestamps, columns, dtype=np.float64, extra_meta=None):
+    """
+    Écrit un store complet de façon atomique (dossier temporaire puis renommage).
+
+    :param store_path: Dossier de destination.
+    :param timestamps: Tableau int64 des minutes depuis l'epoch, trié et sans doublons.
+    :param columns: Dictionnaire {nom de colonne: tableau} aligné sur timestamps.
+    :param dtype: Type des colonnes de prix (np.float64 ou np.float32).
+    :param extra_meta: Clés ajoutées à meta.json (ex: intervalle et source d'un store rééchantillonné).
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) > 1 and not (np.diff(timestamps) > 0).all():
+        raise ValueError("Timestamps must be strictly increasing.")
+    tmp_path = store_path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "timestamp.npy"), timestamps)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(values, dtype=dtype))
+    meta = {
+        "rows": int(len(timestamps)),
+        "columns": list(columns),
+        "dtype": np.dtype(dtype).name,
+        "timestamp_unit": "minute",
+        "first": int(timestamps[0]) if len(timestamps) else None,
+        "last": int(timestamps[-1]) if len(timestamps) else None,
+        **(extra_meta or {}),
+    }
+    write_meta(tmp_path, meta)
+    # on remplace l'ancien store d'un coup
+    if os.path.exists(store_path):
+        old_path = store_path + ".old"
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        os.replace(store_path, old_path)
+        os.replace(tmp_path, store_path)
+        shutil.rmtree(old_path)
+    else:
+        os.replace(tmp_path, store_path)
+
+
+def read_meta(store_path):
+    """
+    Lit le fichier meta.json d'un store.
+    """
+    with open(os.path.join(store_path, "meta.json")) as f:
+        return json.load(f)
+
+
+def write_meta(store_path, meta):
+    """
+    Écrit le fichier meta.json d'un store de façon atomique (fichier temporaire puis renommage).
+    """
+    tmp_path = os.path.join(store_path, "meta.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(store_path, "meta.json"))
+
+
+def store_fingerprint(store_path, start=None, end=None):
+    """
+    Empreinte d'un store (et d'une plage de dates) sans lire les colonnes : toute écriture dans le store
+    (write_store, append_candles, merge_candles) change meta.json ou la date de modification des fichiers.
+
+    :param start: Date de début de la plage chargée (ou None).
+    :param end: Date de fin de la plage chargée (ou None).
+    :return: Empreinte hexadécimale.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(os.path.join(store_path, "meta.json"), "rb") as f:
+        digest.update(f.read())
+    for name in sorted(os.listdir(store_path)):
+        if name.endswith(".npy"):
+            stat = os.stat(os.path.join(store_path, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    digest.update(f"{start}:{end}".encode())
+    return digest.hexdigest()
+
+
+def open_columns(store_path, columns=None):
+    """
+    Ouvre les colonnes d'un store en mémoire mappée (rien n'est lu tant qu'on n'y accède pas).
+
+    :return: (timestamps, {nom: tableau mmap})
+    """
+    meta = read_meta(store_path)
+    columns = meta["columns"] if columns is None else columns
+    # les fichiers peuvent être plus longs que le store si un ajout a été interrompu avant meta.json
+    rows = meta["rows"]
+    timestamps = np.load(os.path.join(store_path, "timestamp.npy"), mmap_mode='r')[:rows]
+    arrays = {name: np.load(os.path.join(store_path, f"{name}.npy"), mmap_mode='r')[:rows] for name in columns}
+    return timestamps, arrays
+
+
+def extend_npy(path, rows, values):
+    """
+    Ajoute des valeurs à la fin d'un fichier .npy 1D dont les `rows` premières valeurs sont gardées
+    (ce qui dépasse est écrasé), puis met à jour la taille dans l'en-tête.
+
+    :param path: Fichier .npy.
+    :param rows: Nombre de valeurs valides du fichier.
+    :param values: Tableau 1D ajouté, du même type que le fichier.
+    """
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        header_size = f.tell()
+        if len(shape) != 1 or dtype != values.dtype:
+            raise ValueError(f"Cannot append {values.dtype} values to {path} ({dtype}, shape {shape}).")
+        # les données d'abord, l'en-tête ensuite : sans meta.json à jour, rien de tout ça n'est lu
+        f.truncate(header_size + rows * dtype.itemsize)
+        f.seek(0, os.SEEK_END)
+        f.write(np.ascontiguousarray(values).tobytes())
+        header = io.BytesIO()
+        header_fields = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": fortran_order, "shape": (rows + len(values),)}
+        write_header = np.lib.format.write_array_header_1_0 if version == (1, 0) else np.lib.format.write_array_header_2_0
+        write_header(header, header_fields)
+        if header.tell() == header_size:
+            f.seek(0)
+            f.write(header.getvalue())
+            return
+    # l'en-tête ne tient plus à la même place (numpy laisse pourtant de la marge) : on réécrit le fichier
+    array = np.memmap(path, dtype=dtype, mode='r', offset=header_size, shape=(rows + len(values),))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asarray(array))
+    del array
+    os.replace(tmp_path, path)
+
+
+def append_candles(store_path, timestamps, columns):
+    """
+    Ajoute à la fin d'un store des bougies plus récentes que sa dernière, sans réécrire les colonnes.
+
+    :param store_path: Dossier du store.
+    :param timestamps: Tableau int64 des minutes depuis l'epoch, strictement croissant, après la dernière bougie.
+    :param columns: Dictionnaire {nom de colonne: tableau} aligné sur timestamps (toutes les colonnes du store).
+    :return: Le nombre de bougies ajoutées.
+    """
+    meta = read_meta(store_path)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) == 0:
+        return 0
+    if (meta["last"] is not None and timestamps[0] <= meta["last"]) or \
+            (len(timestamps) > 1 and not (np.diff(timestamps) > 0).all()):
+        raise ValueError("Appended timestamps must be strictly increasing and after the last candle of the store.")
+    rows = meta["rows"]
+    extend_npy(os.path.join(store_path, "timestamp.npy"), rows, timestamps)
+    for name in meta["columns"]:
+        extend_npy(os.path.join(store_path, f"{name}.npy"), rows, np.asarray(columns[name], dtype=np.dtype(meta["dtype"])))
+    meta["rows"] = rows + len(timestamps)
+    meta["first"] = int(timestamps[0]) if meta["first"] is None else meta["first"]
+    meta["last"] = int(timestamps[-1])
+    write_meta(store_path, meta)
+    return len(timestamps)
+
+
+def find_range(timestamps, start=None, end=None):
+    """
+    Trouve par recherche dichotomique les indices [i, j) des bougies entre start et end (inclus).
+    """
+    i = 0
+    j = len(timestamps)
+    if start is not None:
+        start_ns = pd.Timestamp(start).as_unit('ns').value
+        # première minute >= start
+        i = int(np.searchsorted(timestamps, -(-start_ns // NS_PER_MINUTE), side='left'))
+    if end is not None:
+        end_ns = pd.Timestamp(end).as_unit('ns').value
+        # dernière minute <= end
+        j = int(np.searchsorted(timestamps, end_ns // NS_PER_MINUTE, side='right'))
+    return i, max(i, j)
+
+
+def load_candles(store_path, start=None, end=None, columns=None):
+    """
+    Charge les bougies d'un store entre deux dates, dans le même format que pd.read_csv
+    (index 'timestamp', colonnes OHLCV en float64). Seule la tranche demandée est lue.
+
+    :param store_path: Dossier du store.
+    :param start: Date de début incluse (ou None).
+    :param end: Date de fin incluse (ou None).
+    :param columns: Colonnes à charger (toutes par défaut).
+    :return: DataFrame indexé par timestamp.
+    """
+    timestamps, arrays = open_columns(store_path, columns)
+    i, j = find_range(timestamps, start, end)
+    index = from_epoch_minutes(timestamps[i:j])
+    return pd.DataFrame({name: np.array(values[i:j], dtype=np.float64) for name, values in arrays.items()}, index=index)
+
+
+def convert_csv_to_store(csv_path, store_path=None, dtype=np.float64, chunksize=1_000_000):
+    """
+    Convertit une fois pour toutes un CSV de bougies (timestamp, open, high, low, close, volume, ...)
+    en store binaire. Les données sont triées et les doublons supprimés (on garde le premier).
+    Les colonnes d'indicateurs éventuelles (EMA1, EMA2...) sont ignorées.
+
+    :param csv_path: Fichier CSV produit par download_db.py ou download_data.py.
+    :param store_path: Dossier de destination (par défaut : même nom que le CSV, extension .store).
+    :param dtype: Type des colonnes de prix.
+    :param chunksize: Nombre de lignes lues à la fois.
+    :return: Le chemin du store.
+    """
+    store_path = store_path or store_path_for(csv_path)
+    print(f"🔄 Conversion de {csv_path} vers {store_path}...")
+    timestamps = []
+    columns = {name: [] for name in COLUMNS}
+    for chunk in pd.read_csv(csv_path, usecols=['timestamp'] + COLUMNS, chunksize=chunksize):
+        timestamps.append(to_epoch_minutes(pd.to_datetime(chunk['timestamp'])))
+        for name in COLUMNS:
+            columns[name].append(chunk[name].to_numpy(dtype=np.float64))
+    timestamps = np.concatenate(timestamps) if timestamps else np.empty(0, dtype=np.int64)
+    columns = {name: np.concatenate(values) if values else np.empty(0) for name, values in columns.items()}
+    count = len(timestamps)
+    timestamps, columns = sort_and_deduplicate(timestamps, columns)
+    write_store(store_path, timestamps, columns, dtype=dtype)
+    print(f"✅ {len(timestamps)} bougies enregistrées ({count - len(timestamps)} doublons supprimés).")
+    return store_path
+
+
+def sort_and_deduplicate(timestamps, columns):
+    """
+    Trie les bougies par timestamp (tri stable) et supprime les doublons en gardant la première occurrence.
+
+    :return: (timestamps, {nom: tableau}) triés et sans doublons.
+    """
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order]
+    keep = np.concatenate([[True], timestamps[1:] != timestamps[:-1]]) if len(timestamps) else np.empty(0, dtype=bool)
+    return timestamps[keep], {name: np.asarray(values)[order][keep] for name, values in columns.items()}
+
+
+def merge_candles(store_path, df):
+    """
+    Insère des bougies (ex: trous réparés) dans un store existant, à leur place dans l'ordre.
+    Les bougies déjà présentes sont conservées telles quelles. Si elles sont toutes après la dernière
+    bougie du store, elles sont simplement ajoutées au bout (append_candles, sans réécrire le store).
+
+    :param store_path: Dossier du store.
+    :param df: DataFrame indexé par timestamp avec les colonnes OHLCV.
+    :return: Le nombre de bougies ajoutées.
+    """
+    meta = read_meta(store_path)
+    new_timestamps = to_epoch_minutes(df.index)
+    if len(new_timestamps) == 0:
+        return 0
+    if meta["last"] is None or new_timestamps.min() > meta["last"]:
+        new_timestamps, new_columns = sort_and_deduplicate(new_timestamps, {name: df[name].to_numpy(dtype=np.float64) for name in meta["columns"]})
+        return append_candles(store_path, new_timestamps, new_columns)
+    timestamps, arrays = open_columns(store_path)
+    merged_timestamps = np.concatenate([np.asarray(timestamps), new_timestamps])
+    merged = {name: np.concatenate([np.asarray(values, dtype=np.float64), df[name].to_numpy(dtype=np.float64)]) for name, values in arrays.items()}
+    merged_timestamps, merged = sort_and_deduplicate(merged_timestamps, merged)
+    added = len(merged_timestamps) - len(timestamps)
+    # on libère les fichiers mappés avant de remplacer le store
+    del timestamps, arrays
+    write_store(store_path, merged_timestamps, merged, dtype=np.dtype(meta["dtype"]))
+    return added
+
+
+def main():
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "1_min_eth_candles_01012017_15112024.csv"
+    convert_csv_to_store(csv_path)
+
+
+if __name__ == "__main__":
+    main()
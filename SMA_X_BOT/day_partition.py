@@ -0,0 +1,159 @@
+# découpage par jour sans copie : un seul DataFrame + les bornes de chaque jour
+"""
+/*********************************\
+|* Découpage par jour (offsets)  *|
+\*********************************/
+
+    * subdivide_db_by_date créait un dictionnaire {date: DataFrame} (~1800 DataFrames pour 5 ans).
+    DayPartition garde le DataFrame d'origine et, pour chaque jour, seulement trois entiers :
+    le début du jour (ns) et les indices [début, fin) de ses lignes, trouvés par searchsorted.
+
+    * Il s'utilise comme l'ancien dictionnaire (items(), keys(), daily_data[date]) ; chaque jour renvoyé
+    est une tranche du DataFrame d'origine (pas de copie). Les filtres (jours complets, SMA_X chaude)
+    sont des masques numpy calculés en une opération, et select() renvoie une nouvelle partition
+    sur les mêmes données.
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+# nombre de minutes dans un jour complet
+MINUTES_PER_DAY = 1440
+# nanosecondes dans un jour
+NS_PER_DAY = 86400 * 10**9
+
+
+def to_ns(index):
+    """
+    Dates d'un DatetimeIndex en int64 nanosecondes (sans copie si l'index est déjà en ns).
+    """
+    return np.asarray(pd.DatetimeIndex(index).as_unit('ns').asi8)
+
+
+def day_offsets(timestamps):
+    """
+    Bornes de chaque jour calendaire entre le premier et le dernier timestamp, jours vides compris
+    (comme pd.Grouper(freq='D')).
+
+    :param timestamps: Tableau int64 des dates en nanosecondes (trié).
+    :return: (début de chaque jour en ns, indice de la première ligne, indice après la dernière ligne)
+    """
+    if len(timestamps) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    first_day = int(timestamps[0]) // NS_PER_DAY
+    last_day = int(timestamps[-1]) // NS_PER_DAY
+    bounds = np.arange(first_day, last_day + 2, dtype=np.int64) * NS_PER_DAY
+    offsets = np.searchsorted(timestamps, bounds).astype(np.int64)
+    return bounds[:-1], offsets[:-1], offsets[1:]
+
+
+class DayPartition(Mapping):
+    """
+    Vue par jour d'un DataFrame de bougies 1m indexé par timestamp (trié).
+
+    :param frame: DataFrame d'origine (jamais copié).
+    :param days: Début de chaque jour gardé (ns), None pour tous les jours.
+    :param starts: Indice de la première ligne de chaque jour.
+    :param ends: Indice après la dernière ligne de chaque jour.
+    :param timestamps: Timestamps du DataFrame en ns, s'ils sont déjà calculés.
+    """
+
+    def __init__(self, frame, days=None, starts=None, ends=None, timestamps=None):
+        self.frame = frame
+        self.timestamps = to_ns(frame.index) if timestamps is None else timestamps
+        if days is None:
+            days, starts, ends = day_offsets(self.timestamps)
+        self.days = days
+        self.starts = starts
+        self.ends = ends
+
+    @property
+    def dates(self):
+        """
+        Dates des jours (DatetimeIndex), les clés de l'ancien dictionnaire.
+        """
+        return pd.DatetimeIndex(self.days.view('datetime64[ns]'))
+
+    @property
+    def lengths(self):
+        """
+        Nombre de lignes de chaque jour.
+        """
+        return self.ends - self.starts
+
+    def __len__(self):
+        return len(self.days)
+
+    def __iter__(self):
+        return iter(self.dates)
+
+    def __getitem__(self, date):
+        value = pd.Timestamp(date).as_unit('ns').value
+        i = int(np.searchsorted(self.days, value))
+        if i == len(self.days) or self.days[i] != value:
+            raise KeyError(date)
+        return self.day(i)
+
+    def items(self):
+        for i, date in enumerate(self.dates):
+            yield date, self.day(i)
+
+    def day(self, i):
+        """
+        Lignes du i-ème jour : une tranche du DataFrame d'origine.
+        """
+        return self.frame.iloc[self.starts[i]:self.ends[i]]
+
+    def column(self, name):
+        """
+        Colonne complète du DataFrame d'origine en tableau numpy (une tranche par jour via starts / ends).
+        """
+        return self.frame[name].to_numpy()
+
+    def nan_counts(self, name):
+        """
+        Nombre de NaN de la colonne `name` dans chaque jour (somme cumulée, une seule passe).
+        """
+        counts = np.concatenate([[0], np.cumsum(np.isnan(self.column(name)))])
+        return counts[self.ends] - counts[self.starts]
+
+    def complete_mask(self, columns=()):
+        """
+        Masque des jours complets : 1440 minutes et aucune valeur manquante dans `columns`.
+        """
+        mask = self.lengths == MINUTES_PER_DAY
+        for name in columns:
+            mask &= self.nan_counts(name) == 0
+        return mask
+
+    def select(self, mask):
+        """
+        Nouvelle partition ne gardant que les jours du masque (mêmes données, pas de copie).
+        """
+        return DayPartition(self.frame, self.days[mask], self.starts[mask], self.ends[mask], self.timestamps)
+
+    def rows(self):
+        """
+        Indices des lignes des jours gardés, mis bout à bout.
+        """
+        lengths = self.lengths
+        if len(lengths) == 0:
+            return np.empty(0, dtype=np.int64)
+        # un seul bloc contigu : simple intervalle
+        if (self.starts[1:] == self.ends[:-1]).all():
+            return np.arange(self.starts[0], self.ends[-1])
+        offsets = np.repeat(self.starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return np.arange(lengths.sum()) + offsets
+
+    def gather(self, name=None):
+        """
+        Valeurs de la colonne `name` (ou les timestamps en ns si None) des jours gardés, mises bout à bout.
+        Si les jours gardés se suivent, c'est une vue sur les données d'origine.
+        """
+        values = self.timestamps if name is None else self.column(name)
+        if len(self) and (self.starts[1:] == self.ends[:-1]).all():
+            return values[self.starts[0]:self.ends[-1]]
+        return values[self.rows()]
@@ -5,17 +5,36 @@ from datetime import datetime
 from tqdm.asyncio import tqdm
 import os
 import shutil
+import sys
+import time
+
+from instrumentation import count, format_summary, stage
+from rate_limiter import KLINE_WEIGHT, MAX_REQUEUES, FetchError, RateLimiter
 
 # nouvelle version du scripte pour télécharger les données de binance plsu rapidement
 
 # Constantes
 MAX_LIMIT = 1000  # Limite de bougies par requête
-BINANCE_API_URL = "https://api.binance.com/api/v3/klines"
+MAX_THROTTLES = 20  # Nombre de 429/418 tolérés pour une même requête
+# Durée des intervalles klines en ms
+INTERVAL_MS = {
+    "1m": 60 * 1000, "3m": 3 * 60 * 1000, "5m": 5 * 60 * 1000, "15m": 15 * 60 * 1000, "30m": 30 * 60 * 1000,
+    "1h": 60 * 60 * 1000, "2h": 2 * 60 * 60 * 1000, "4h": 4 * 60 * 60 * 1000, "1d": 24 * 60 * 60 * 1000,
+}
+# URL de l'API (on peut la remplacer par celle de fake_klines_server.py pour les tests)
+BINANCE_API_URL = os.environ.get("BINANCE_API_URL", "https://api.binance.com/api/v3/klines")
+# Colonnes renvoyées par l'API klines
+KLINE_COLUMNS = [
+    'timestamp', 'open', 'high', 'low', 'close', 'volume',
+    'close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore'
+]
 
-async def fetch_candles(session, symbol, interval, start_ts, end_ts, semaphore):
+async def fetch_candles(session, symbol, interval, start_ts, end_ts, limiter, api_url=None):
     """
     Récupère des bougies pour une plage donnée de timestamps.
-    Implémente un backoff exponentiel en cas d'erreur.
+    Le débit est réglé par le RateLimiter (poids utilisé, Retry-After) ; les erreurs réseau
+    et 5xx sont retentées avec un backoff exponentiel.
+    Lève FetchError si la plage n'a pas pu être récupérée (au lieu de renvoyer []).
     """
     params = {
         "symbol": symbol,
@@ -25,84 +44,410 @@ async def fetch_candles(session, symbol, interval, start_ts, end_ts, semaphore):
         "limit": MAX_LIMIT,
     }
     tries = 0
+    throttles = 0
     backoff = 0.1  # Temps d'attente initial en secondes
+    reason = None
 
-    async with semaphore:
-        while tries < 5:  # Limite le nombre de tentatives à 5
-            try:
-                async with session.get(BINANCE_API_URL, params=params) as response:
+    while tries < 5:  # Limite le nombre de tentatives à 5
+        try:
+            async with limiter.slot(KLINE_WEIGHT):
+                # compteurs de l'étape en cours (voir instrumentation.py)
+                count("http_requests")
+                async with session.get(api_url or BINANCE_API_URL, params=params) as response:
+                    limiter.update(response.headers)
                     if response.status == 200:
-                        return await response.json()
-                    else:
-                        print(f"Erreur {response.status}: {response.reason} pour {start_ts} -> {end_ts}")
-                        if response.status in [429, 418]:  # Limite de taux ou blocage temporaire
-                            await asyncio.sleep(backoff)
-                            backoff *= 2  # Double le temps d'attente à chaque tentative
-                        else:
-                            return []
-            except Exception as e:
-                print(f"Exception : {e} pour {start_ts} -> {end_ts}")
-                await asyncio.sleep(backoff)
-                backoff *= 2
-            tries += 1
-
-    print(f"❌ Échec final pour {start_ts} -> {end_ts}")
-    return []
-
-async def fetch_all_candles(symbol, start_date, end_date):
+                        data = await response.json()
+                        limiter.on_success()
+                        count("candles", len(data))
+                        return data
+                    reason = f"Erreur {response.status}: {response.reason}"
+                    if response.status in [429, 418]:  # Limite de taux ou blocage temporaire
+                        count(f"http_{response.status}")
+                        # le limiteur met tout le monde en pause pendant Retry-After, ça ne compte pas comme un essai
+                        limiter.on_throttled(response.headers.get("Retry-After"))
+                        throttles += 1
+                        if throttles > MAX_THROTTLES:
+                            raise FetchError(start_ts, end_ts, reason)
+                        continue
+                    if response.status < 500:
+                        # requête invalide : inutile de réessayer
+                        raise FetchError(start_ts, end_ts, reason)
+                    limiter.on_error()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            reason = f"Exception : {e!r}"
+            limiter.on_error()
+        count("http_retries")
+        await asyncio.sleep(backoff)
+        backoff *= 2  # Double le temps d'attente à chaque tentative
+        tries += 1
+
+    raise FetchError(start_ts, end_ts, reason)
+
+async def fetch_ranges(session, symbol, ranges, limiter, api_url=None, progress=None, interval="1m"):
+    """
+    Télécharge une liste de segments avec une file de travail : un segment en échec est remis
+    au bout de la file (au plus MAX_REQUEUES fois) au lieu d'être perdu.
+
+    :param ranges: Segments (start_ts, end_ts), voir page_ranges.
+    :param limiter: RateLimiter partagé (il décide combien de requêtes sont vraiment en vol).
+    :param progress: Barre tqdm optionnelle, avancée d'un cran par segment terminé.
+    :param interval: Intervalle des bougies ("1m", "1h"...).
+    :return: (dictionnaire numéro de segment -> bougies, liste des FetchError des segments abandonnés)
+    """
+    queue = asyncio.Queue()
+    for index in range(len(ranges)):
+        queue.put_nowait(index)
+    pages = {}
+    failed = []
+    requeues = {}
+
+    async def worker():
+        while True:
+            index = await queue.get()
+            try:
+                start_ts, end_ts = ranges[index]
+                try:
+                    pages[index] = await fetch_candles(session, symbol, interval, start_ts, end_ts, limiter, api_url)
+                except FetchError as e:
+                    requeues[index] = requeues.get(index, 0) + 1
+                    if requeues[index] <= MAX_REQUEUES:
+                        count("requeued_ranges")
+                        queue.put_nowait(index)
+                        continue
+                    count("failed_ranges")
+                    failed.append(e)
+                if progress is not None:
+                    progress.update(1)
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(limiter.max_concurrency, len(ranges)))]
+    join = asyncio.ensure_future(queue.join())
+    try:
+        done, _ = await asyncio.wait([join, *workers], return_when=asyncio.FIRST_COMPLETED)
+        # un worker ne s'arrête que sur une erreur inattendue : on la propage
+        for task in done:
+            if task is not join:
+                task.result()
+    finally:
+        for task in [join, *workers]:
+            task.cancel()
+        await asyncio.gather(join, *workers, return_exceptions=True)
+    failed.sort(key=lambda e: e.start_ts)
+    return pages, failed
+
+def report_failed_ranges(failed):
+    """
+    Affiche les segments qui n'ont pas pu être téléchargés.
+    """
+    if not failed:
+        return
+    print(f"⚠️ {len(failed)} segments n'ont pas pu être téléchargés :")
+    for error in failed:
+        print(f"  - {pd.Timestamp(error.start_ts, unit='ms')} -> {pd.Timestamp(error.end_ts, unit='ms')} ({error.reason})")
+    print("   Relancer le script, ou python repair_gaps.py pour ne récupérer que les minutes manquantes.")
+
+def resolve_range(start_date, end_date, start_ts=None):
+    """
+    Convertit les dates ("01 January 2017") en timestamps ms.
+    start_ts remplace start_date s'il est donné, end_date None = maintenant.
+    """
+    if start_ts is None:
+        start_ts = int(datetime.strptime(start_date, "%d %B %Y").timestamp() * 1000)
+    if end_date is None:
+        end_ts = int(time.time() * 1000)
+    else:
+        end_ts = int(datetime.strptime(end_date, "%d %B %Y").timestamp() * 1000)
+    return start_ts, end_ts
+
+def page_ranges(start_ts, end_ts, interval_ms=INTERVAL_MS["1m"]):
+    """
+    Découpe [start_ts, end_ts] en segments de MAX_LIMIT bougies (bornes incluses), dans l'ordre.
+
+    :param interval_ms: Durée d'une bougie en ms (1m par défaut).
+    """
+    ranges = []
+    current_ts = start_ts
+    while current_ts < end_ts:
+        next_ts = min(current_ts + (MAX_LIMIT - 1) * interval_ms, end_ts)  # Prochain segment (MAX_LIMIT bougies, bornes incluses)
+        ranges.append((current_ts, next_ts))
+        current_ts = next_ts + 1  # Passer au segment suivant
+    return ranges
+
+async def fetch_all_candles(symbol, start_date, end_date, start_ts=None, api_url=None):
     """
     Récupère toutes les bougies 1m pour une paire donnée de manière asynchrone,
     avec une barre de progression.
+
+    :param end_date: Date de fin, ou None pour aller jusqu'à maintenant.
+    :param start_ts: Timestamp de départ en ms (mode reprise), remplace start_date s'il est donné.
+    :param api_url: URL de l'API klines (BINANCE_API_URL par défaut).
     """
-    start_ts = int(datetime.strptime(start_date, "%d %B %Y").timestamp() * 1000)
-    end_ts = int(datetime.strptime(end_date, "%d %B %Y").timestamp() * 1000)
+    start_ts, end_ts = resolve_range(start_date, end_date, start_ts)
+    ranges = page_ranges(start_ts, end_ts)
 
-    tasks = []
-    semaphore = asyncio.Semaphore(10)  # Limite à 10 requêtes simultanées
+    limiter = RateLimiter()
     async with aiohttp.ClientSession() as session:
-        # Crée des tâches pour récupérer les données par lots de MAX_LIMIT
-        current_ts = start_ts
-        while current_ts < end_ts:
-            next_ts = min(current_ts + MAX_LIMIT * 60 * 1000, end_ts)  # Prochain segment
-            tasks.append(fetch_candles(session, symbol, "1m", current_ts, next_ts, semaphore))
-            current_ts = next_ts + 1  # Passer au segment suivant
-
         # Barre de progression avec tqdm
-        results = []
-        for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Téléchargement des données"):
-            result = await coro
-            results.extend(result)
+        with tqdm(total=len(ranges), desc="Téléchargement des données") as progress:
+            pages, failed = await fetch_ranges(session, symbol, ranges, limiter, api_url, progress)
 
-    return results
+    report_failed_ranges(failed)
+    # les pages sont remises dans l'ordre des timestamps
+    return [candle for index in sorted(pages) for candle in pages[index]]
 
-def save_candles_to_csv(data, filename):
+def candles_to_dataframe(data):
     """
-    Sauvegarde les bougies récupérées dans un fichier CSV.
+    Convertit les bougies brutes de l'API en DataFrame OHLCV indexé par timestamp,
+    trié et sans doublons.
     """
-    df = pd.DataFrame(data, columns=[
-        'timestamp', 'open', 'high', 'low', 'close', 'volume',
-        'close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore'
-    ])
+    df = pd.DataFrame(data, columns=KLINE_COLUMNS)
     # Convertir les colonnes et formater le DataFrame
     df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
     df.set_index('timestamp', inplace=True)
     df = df[['open', 'high', 'low', 'close', 'volume']]
+    df = df[~df.index.duplicated(keep='first')].sort_index()
+    return df
+
+def save_candles_to_csv(data, filename):
+    """
+    Sauvegarde les bougies récupérées dans un fichier CSV.
+    """
+    df = candles_to_dataframe(data)
     df.to_csv(filename)
     print(f"✅ Données enregistrées dans {filename}")
 
+def read_last_timestamp(filename, block_size=64 * 1024):
+    """
+    Lit le timestamp (en ms) de la dernière bougie d'un CSV trié, sans lire tout le fichier :
+    on ne lit que la fin du fichier.
+
+    :return: Le timestamp en ms, ou None si le fichier ne contient aucune bougie.
+    """
+    with open(filename, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - block_size))
+        lines = f.read().splitlines()
+    for line in reversed(lines):
+        field = line.split(b",")[0].strip()
+        if not field or field == b"timestamp":
+            continue
+        return int(pd.Timestamp(field.decode()).value // 10**6)
+    return None
+
+def append_frame_to_csv(df, filename):
+    """
+    Ajoute les lignes d'un DataFrame à la fin du CSV (mêmes colonnes que le fichier), sans le réécrire.
+    L'ajout se fait en une seule écriture : en cas d'erreur, le fichier est remis à sa taille d'origine.
+    """
+    payload = df.to_csv(header=False).encode()
+    size = os.path.getsize(filename)
+    try:
+        with open(filename, "r+b") as f:
+            # on s'assure que le fichier se termine par un retour à la ligne
+            if size > 0:
+                f.seek(size - 1)
+                if f.read(1) not in (b"\n", b"\r"):
+                    payload = os.linesep.encode() + payload
+            f.seek(size)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        # on annule l'ajout partiel
+        with open(filename, "r+b") as f:
+            f.truncate(size)
+        raise
+
+def new_candles(data, after_ts):
+    """
+    Bougies postérieures à after_ts et déjà clôturées.
+    """
+    now_ms = int(time.time() * 1000)
+    return [candle for candle in data if candle[0] > after_ts and candle[6] < now_ms]
+
+def append_candles_to_csv(data, filename, after_ts):
+    """
+    Ajoute à la fin du CSV les bougies postérieures à after_ts, sans réécrire le fichier.
+    Les bougies pas encore clôturées sont ignorées (voir append_frame_to_csv).
+
+    :param after_ts: Timestamp (ms) de la dernière bougie déjà enregistrée.
+    :return: Le nombre de bougies ajoutées.
+    """
+    data = new_candles(data, after_ts)
+    if not data:
+        print("✅ Aucune nouvelle bougie à ajouter.")
+        return 0
+    df = candles_to_dataframe(data)
+    append_frame_to_csv(df, filename)
+    print(f"✅ {len(df)} nouvelles bougies ajoutées à {filename}")
+    return len(df)
+
+async def fetch_pages_in_order(session, symbol, ranges, limiter, api_url=None, stats=None, interval="1m"):
+    """
+    Générateur asynchrone qui renvoie les pages dans l'ordre des timestamps.
+    Au plus `2 * concurrency` pages (concurrency du limiteur) sont en cours ou en attente dans le tampon
+    de réordonnancement : la mémoire dépend de la fenêtre de téléchargement, pas de la taille de la base.
+    Une page en échec est relancée (au plus MAX_REQUEUES fois), puis renvoyée vide.
+
+    :param ranges: Segments (start_ts, end_ts) dans l'ordre, voir page_ranges.
+    :param limiter: RateLimiter qui règle le débit.
+    :param stats: Dictionnaire optionnel rempli avec la taille max du tampon ("max_buffered_pages")
+                  et les FetchError des segments abandonnés ("failed_ranges").
+    :param interval: Intervalle des bougies ("1m", "1h"...).
+    """
+    pending = {}   # tâche -> numéro de page
+    buffer = {}    # numéro de page -> bougies (pages arrivées en avance)
+    requeues = {}  # numéro de page -> nombre de relances
+    failed = []
+    next_to_schedule = 0
+    next_to_yield = 0
+    max_buffered = 0
+
+    def schedule(index):
+        start_ts, end_ts = ranges[index]
+        task = asyncio.ensure_future(fetch_candles(session, symbol, interval, start_ts, end_ts, limiter, api_url))
+        pending[task] = index
+
+    try:
+        while next_to_yield < len(ranges):
+            # on garde au plus `window` pages entre la prochaine page à écrire et la dernière lancée
+            window = 2 * max(1, int(limiter.concurrency))
+            while next_to_schedule < len(ranges) and next_to_schedule - next_to_yield < window:
+                schedule(next_to_schedule)
+                next_to_schedule += 1
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                try:
+                    buffer[index] = task.result()
+                except FetchError as e:
+                    requeues[index] = requeues.get(index, 0) + 1
+                    if requeues[index] <= MAX_REQUEUES:
+                        count("requeued_ranges")
+                        schedule(index)
+                    else:
+                        count("failed_ranges")
+                        failed.append(e)
+                        buffer[index] = []
+            max_buffered = max(max_buffered, len(buffer))
+            # on renvoie toutes les pages qui sont maintenant dans l'ordre
+            while next_to_yield in buffer:
+                yield buffer.pop(next_to_yield)
+                next_to_yield += 1
+    finally:
+        for task in pending:
+            task.cancel()
+        if stats is not None:
+            stats["max_buffered_pages"] = max_buffered
+            stats["failed_ranges"] = failed
+
+def peak_memory_mb():
+    """
+    Pic de mémoire (RSS) du processus en Mo, ou None si indisponible (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Ko sous Linux, octets sous macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+async def stream_candles_to_csv(symbol, start_date, end_date, filename, start_ts=None, append=False, api_url=None, limiter=None):
+    """
+    Téléchargement en flux : chaque page est écrite dans le CSV dès qu'elle est dans l'ordre,
+    rien n'est gardé en mémoire au-delà de la fenêtre de téléchargement.
+
+    :param append: True pour ajouter à la fin d'un fichier existant (mode reprise),
+                   sinon on écrit un fichier temporaire qui remplace `filename` à la fin.
+    :param limiter: RateLimiter à utiliser (un nouveau par défaut).
+    :return: Le nombre de bougies écrites.
+    """
+    start_ts, end_ts = resolve_range(start_date, end_date, start_ts)
+    ranges = page_ranges(start_ts, end_ts)
+    now_ms = int(time.time() * 1000)
+    path = filename if append else filename + ".tmp"
+    size = os.path.getsize(filename) if append else 0
+    written = 0
+    last_written = start_ts - 1
+    stats = {}
+    limiter = limiter or RateLimiter()
+    try:
+        with open(path, "a" if append else "w", newline="") as f:
+            if not append:
+                f.write(pd.DataFrame(columns=['timestamp', 'open', 'high', 'low', 'close', 'volume']).to_csv(index=False))
+            async with aiohttp.ClientSession() as session:
+                pages = fetch_pages_in_order(session, symbol, ranges, limiter, api_url, stats)
+                with tqdm(total=len(ranges), desc="Téléchargement des données") as progress:
+                    async for page in pages:
+                        # on ignore les bougies déjà écrites et celles qui ne sont pas encore clôturées
+                        page = [candle for candle in page if candle[0] > last_written and candle[6] < now_ms]
+                        if page:
+                            df = candles_to_dataframe(page)
+                            f.write(df.to_csv(header=False))
+                            written += len(df)
+                            last_written = page[-1][0]
+                        progress.update(1)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        # on annule l'écriture partielle
+        if append:
+            with open(filename, "r+b") as f:
+                f.truncate(size)
+        elif os.path.exists(path):
+            os.remove(path)
+        raise
+    if not append:
+        os.replace(path, filename)
+    peak = peak_memory_mb()
+    print(f"✅ {written} bougies écrites dans {filename}")
+    print(f"📈 Pages max en mémoire : {stats.get('max_buffered_pages', 0)}"
+          + (f", pic mémoire : {peak:.1f} Mo" if peak is not None else ""))
+    report_failed_ranges(stats.get("failed_ranges", []))
+    return written
+
+# mode reprise : si le fichier existe déjà, on ne télécharge que ce qui manque après la dernière bougie
+RESUME = True
+# mode flux : les pages sont écrites sur le disque au fur et à mesure (mémoire bornée)
+STREAMING = True
+
+# téléchargement complet, en reprise ou en flux selon RESUME / STREAMING
+def download(symbol, start_date, end_date, filename, last_ts):
+    if STREAMING:
+        if last_ts is not None:
+            print(f"🔁 Reprise pour {symbol} après {pd.Timestamp(last_ts, unit='ms')} jusqu'à {end_date or 'maintenant'}...")
+            asyncio.run(stream_candles_to_csv(symbol, start_date, end_date, filename, start_ts=last_ts + 60 * 1000, append=True))
+        else:
+            print(f"🔄 Récupération des données pour {symbol} de {start_date} à {end_date}...")
+            asyncio.run(stream_candles_to_csv(symbol, start_date, end_date, filename))
+    elif last_ts is not None:
+        print(f"🔁 Reprise pour {symbol} après {pd.Timestamp(last_ts, unit='ms')} jusqu'à {end_date or 'maintenant'}...")
+        all_data = asyncio.run(fetch_all_candles(symbol, start_date, end_date, start_ts=last_ts + 60 * 1000))
+        print(f"📊 Nombre total de bougies récupérées : {len(all_data)}")
+        append_candles_to_csv(all_data, filename, last_ts)
+    else:
+        print(f"🔄 Récupération des données pour {symbol} de {start_date} à {end_date}...")
+        all_data = asyncio.run(fetch_all_candles(symbol, start_date, end_date))
+        print(f"📊 Nombre total de bougies récupérées : {len(all_data)}")
+        save_candles_to_csv(all_data, filename)
+
 def main():
     symbol = "ETHUSDT"
     start_date = "01 January 2017"
-    end_date = "15 November 2024"
+    end_date = "15 November 2024"  # None pour aller jusqu'à maintenant
     filename = "1_min_eth_candles_01012017_15112024.csv"
 
-    print(f"🔄 Récupération des données pour {symbol} de {start_date} à {end_date}...")
-    all_data = asyncio.run(fetch_all_candles(symbol, start_date, end_date))
-    print(f"📊 Nombre total de bougies récupérées : {len(all_data)}")
-    save_candles_to_csv(all_data, filename)
+    last_ts = read_last_timestamp(filename) if RESUME and os.path.exists(filename) else None
+    # durée, requêtes, retries et 429 du téléchargement (voir instrumentation.py)
+    with stage("download"):
+        download(symbol, start_date, end_date, filename, last_ts)
+    print(format_summary())
     print(f"Sauvegarde des données terminée dans BACKUP_ETH.csv")
     shutil.copy("1_min_eth_candles_01012017_15112024.csv", "BACKUP_ETH.csv")
-    
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,93 @@
+# index de sortie : premier prix >= cible sans parcourir chaque bougie
+"""
+/*********************************\
+|* Index de sortie (range max)   *|
+\*********************************/
+
+    * Une position ouverte est vendue à la première bougie où close >= target_price, ou à la première bougie
+    après buy_date + MAX_WINDOW. Plutôt que de tester chaque position à chaque minute, on calcule
+    directement cette bougie au moment de l'achat.
+
+    * Les prix sont découpés en blocs de BLOCK_SIZE bougies. On garde le max de chaque bloc et une sparse table
+    sur ces max (table[k][b] = max des blocs b .. b + 2^k - 1). Pour trouver la première bougie >= cible :
+    on regarde la fin du bloc de départ, puis on saute les blocs dont le max est trop bas (O(log n) sauts),
+    puis on cherche dans le bloc trouvé. Mémoire : n / BLOCK_SIZE * log(n / BLOCK_SIZE) flottants.
+"""
+
+import numpy as np
+
+# nombre de bougies par bloc
+BLOCK_SIZE = 64
+
+
+class ExitIndex:
+    """
+    Index des max par bloc sur un tableau de prix.
+
+    :param close: Tableau des prix de clôture.
+    :param timestamps: Tableau int64 des dates en nanosecondes (trié), pour les dates limites.
+    :param block_size: Nombre de bougies par bloc.
+    """
+
+    def __init__(self, close, timestamps=None, block_size=BLOCK_SIZE):
+        self.close = np.asarray(close, dtype=np.float64)
+        self.timestamps = timestamps
+        self.block_size = block_size
+        n = len(self.close)
+        blocks = -(-n // block_size)
+        padded = np.full(blocks * block_size, -np.inf)
+        padded[:n] = self.close
+        # les NaN ne déclenchent jamais de vente (close >= cible est faux), comme -inf
+        padded[np.isnan(padded)] = -np.inf
+        self.table = [padded.reshape(blocks, block_size).max(axis=1)]
+        width = 1
+        while 2 * width <= blocks:
+            previous = self.table[-1]
+            self.table.append(np.maximum(previous[:-width], previous[width:]))
+            width *= 2
+
+    def _scan(self, start, stop, target):
+        # première bougie de [start, stop) >= target, ou None
+        hits = self.close[start:stop] >= target
+        if hits.any():
+            return start + int(hits.argmax())
+        return None
+
+    def first_at_least(self, start, stop, target):
+        """
+        Première bougie j de [start, stop) avec close[j] >= target, ou stop s'il n'y en a pas.
+        """
+        stop = min(stop, len(self.close))
+        if start >= stop:
+            return stop
+        size = self.block_size
+        first_block = start // size
+        last_block = (stop - 1) // size
+        if first_block == last_block:
+            hit = self._scan(start, stop, target)
+            return stop if hit is None else hit
+        # fin du bloc de départ
+        hit = self._scan(start, (first_block + 1) * size, target)
+        if hit is not None:
+            return hit
+        # on saute les blocs entiers dont le max est < target (descente sur la sparse table)
+        block = first_block + 1
+        for k in range(len(self.table) - 1, -1, -1):
+            if block + (1 << k) <= last_block and self.table[k][block] < target:
+                block += 1 << k
+        if block < last_block:
+            return self._scan(block * size, (block + 1) * size, target)
+        # début du dernier bloc
+        hit = self._scan(last_block * size, stop, target)
+        return stop if hit is None else hit
+
+    def exit_bar(self, buy_index, target_price, deadline):
+        """
+        Bougie de sortie d'une position achetée à buy_index : première bougie (à partir de buy_index)
+        où close >= target_price, ou première bougie dont la date dépasse deadline (ns).
+
+        :return: L'indice de la bougie de sortie, ou len(close) si la position est encore ouverte à la fin.
+        """
+        # première bougie strictement après la date limite
+        limit = int(np.searchsorted(self.timestamps, deadline, side='right'))
+        return self.first_at_least(buy_index, limit, target_price)
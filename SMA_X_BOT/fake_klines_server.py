@@ -0,0 +1,214 @@
+# faux serveur klines (API Binance) pour tester les scripts de téléchargement en local
+"""
+/*********************************\
+|* Faux serveur klines (tests)   *|
+\*********************************/
+
+    * Répond sur /api/v3/klines comme l'API Binance (startTime, endTime, limit, interval de 1m à 1d),
+    avec des bougies déterministes : le prix ne dépend que du timestamp, deux appels donnent
+    donc toujours les mêmes données.
+
+    * On peut lui retirer des plages de minutes (missing) pour simuler des trous côté exchange.
+
+    * /ws/<symbole>@kline_<intervalle> imite le flux websocket de Binance : un événement "kline" non clôturé
+    puis clôturé par période, à partir de startTime, toutes les stream_interval secondes (count périodes
+    au plus, puis le serveur ferme la connexion).
+
+    * Il peut aussi appliquer une limite de poids comme Binance (weight_limit par fenêtre de window_seconds) :
+    en-tête X-MBX-USED-WEIGHT-1M sur chaque réponse, 429 + Retry-After au-delà de la limite,
+    418 si le client continue d'insister pendant la même fenêtre. latency simule le temps réseau.
+
+    Lancement : python fake_klines_server.py
+    puis      : BINANCE_API_URL=http://127.0.0.1:8080/api/v3/klines python download_db.py
+"""
+
+import asyncio
+import json
+import math
+import time
+
+from aiohttp import web
+
+# première bougie disponible (17 août 2017, comme ETHUSDT sur Binance)
+FIRST_CANDLE_TS = 1502942400000
+# durée d'une bougie 1m en ms
+INTERVAL_MS = 60 * 1000
+# intervalles acceptés -> durée en ms
+INTERVALS = {
+    "1m": INTERVAL_MS, "3m": 3 * INTERVAL_MS, "5m": 5 * INTERVAL_MS, "15m": 15 * INTERVAL_MS, "30m": 30 * INTERVAL_MS,
+    "1h": 60 * INTERVAL_MS, "2h": 120 * INTERVAL_MS, "4h": 240 * INTERVAL_MS, "1d": 1440 * INTERVAL_MS,
+}
+# nombre max de bougies par réponse
+MAX_LIMIT = 1000
+# poids d'une requête klines
+KLINE_WEIGHT = 2
+# nombre de 429 dans une même fenêtre avant de renvoyer 418 (ban)
+BAN_AFTER = 20
+# état du serveur (réglages et compteurs) : l'application aiohttp est figée une fois démarrée,
+# les handlers modifient ce dictionnaire et plus les clés de l'application
+STATE = web.AppKey("state", dict)
+HOST = "127.0.0.1"
+PORT = 8080
+
+
+def make_kline(open_time, interval_ms=INTERVAL_MS):
+    """
+    Construit une bougie au format de l'API Binance pour une période donnée.
+    """
+    minute = open_time // INTERVAL_MS
+    close = 1000 + 200 * math.sin(minute / 5000) + 5 * math.sin(minute / 7)
+    open_ = 1000 + 200 * math.sin((minute - 1) / 5000) + 5 * math.sin((minute - 1) / 7)
+    high = max(open_, close) + 1
+    low = min(open_, close) - 1
+    volume = 10 + (minute % 17)
+    return [
+        open_time, f"{open_:.2f}", f"{high:.2f}", f"{low:.2f}", f"{close:.2f}", f"{volume:.4f}",
+        open_time + interval_ms - 1, f"{volume * close:.4f}", 100, f"{volume / 2:.4f}", f"{volume * close / 2:.4f}", "0",
+    ]
+
+
+def is_missing(open_time, missing):
+    # missing : liste de plages (début, fin) en ms, bornes incluses
+    return any(start <= open_time <= end for start, end in missing)
+
+
+async def klines(request):
+    """
+    Handler de /api/v3/klines.
+    """
+    state = request.app[STATE]
+    state["requests"] += 1
+    if state["latency"]:
+        await asyncio.sleep(state["latency"])
+    headers = {}
+    if state["weight_limit"]:
+        now = time.time()
+        window = int(now // state["window_seconds"])
+        if window != state["weight_window"]:
+            state["weight_window"] = window
+            state["used_weight"] = 0
+            state["rejected"] = 0
+        retry_after = (window + 1) * state["window_seconds"] - now
+        if state["used_weight"] + KLINE_WEIGHT > state["weight_limit"]:
+            state["throttled"] += 1
+            state["rejected"] += 1
+            status = 418 if state["rejected"] > BAN_AFTER else 429
+            headers = {"X-MBX-USED-WEIGHT-1M": str(state["used_weight"]), "Retry-After": f"{retry_after:.3f}"}
+            return web.json_response({"code": -1003, "msg": "Too much request weight used."}, status=status, headers=headers)
+        state["used_weight"] += KLINE_WEIGHT
+        headers = {"X-MBX-USED-WEIGHT-1M": str(state["used_weight"])}
+    query = request.query
+    interval_ms = INTERVALS.get(query.get("interval", "1m"))
+    if interval_ms is None:
+        return web.json_response({"code": -1120, "msg": "Invalid interval."}, status=400)
+    now_ms = int(time.time() * 1000)
+    limit = min(int(query.get("limit", 500)), MAX_LIMIT)
+    start = max(int(query.get("startTime", FIRST_CANDLE_TS)), state["first_ts"])
+    end = min(int(query.get("endTime", now_ms)), now_ms)
+    # première période >= start
+    open_time = -(-start // interval_ms) * interval_ms
+    data = []
+    while open_time <= end and len(data) < limit:
+        if not is_missing(open_time, state["missing"]):
+            data.append(make_kline(open_time, interval_ms))
+        open_time += interval_ms
+    return web.json_response(data, headers=headers)
+
+
+def kline_event(symbol, interval, kline, closed):
+    """
+    Événement websocket "kline" de Binance construit à partir d'une bougie de l'API REST.
+    """
+    return {
+        "e": "kline", "E": int(time.time() * 1000), "s": symbol,
+        "k": {
+            "t": kline[0], "T": kline[6], "s": symbol, "i": interval,
+            "o": kline[1], "h": kline[2], "l": kline[3], "c": kline[4], "v": kline[5], "x": closed,
+        },
+    }
+
+
+async def kline_stream(request):
+    """
+    Handler de /ws/<symbole>@kline_<intervalle>.
+    Paramètres : startTime (ms, par défaut la première bougie), count (nombre de périodes),
+    stream_interval (secondes entre deux périodes, par défaut celui de l'application).
+    """
+    state = request.app[STATE]
+    symbol, _, interval = request.match_info["stream"].partition("@kline_")
+    interval_ms = INTERVALS.get(interval)
+    if interval_ms is None:
+        return web.json_response({"code": -1120, "msg": "Invalid interval."}, status=400)
+    query = request.query
+    open_time = -(-int(query.get("startTime", state["first_ts"])) // interval_ms) * interval_ms
+    count = int(query["count"]) if "count" in query else None
+    pause = float(query.get("stream_interval", state["stream_interval"]))
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    symbol = symbol.upper()
+    sent = 0
+    while count is None or sent < count:
+        if not is_missing(open_time, state["missing"]):
+            kline = make_kline(open_time, interval_ms)
+            # une mise à jour en cours de période, puis la bougie clôturée
+            await ws.send_str(json.dumps(kline_event(symbol, interval, kline, False)))
+            await ws.send_str(json.dumps(kline_event(symbol, interval, kline, True)))
+            state["streamed"] += 1
+        sent += 1
+        open_time += interval_ms
+        await asyncio.sleep(pause)
+    await ws.close()
+    return ws
+
+
+def create_app(missing=(), first_ts=FIRST_CANDLE_TS, weight_limit=None, window_seconds=60, latency=0.0, stream_interval=60.0):
+    """
+    Crée l'application aiohttp du faux serveur (compteurs dans app[STATE]).
+
+    :param missing: Plages (début, fin) en ms pour lesquelles le serveur n'a pas de données.
+    :param first_ts: Première bougie disponible (ms).
+    :param weight_limit: Poids max par fenêtre (None = pas de limite).
+    :param window_seconds: Durée de la fenêtre de poids.
+    :param latency: Délai ajouté à chaque réponse (s).
+    :param stream_interval: Secondes entre deux bougies du flux websocket.
+    """
+    app = web.Application()
+    app[STATE] = {
+        "missing": list(missing),
+        "first_ts": first_ts,
+        "weight_limit": weight_limit,
+        "window_seconds": window_seconds,
+        "latency": latency,
+        "weight_window": None,
+        "used_weight": 0,
+        "rejected": 0,
+        "requests": 0,   # nombre de requêtes reçues
+        "throttled": 0,  # nombre de réponses 429/418
+        "stream_interval": stream_interval,
+        "streamed": 0,   # nombre de bougies clôturées envoyées sur les websockets
+    }
+    app.router.add_get("/api/v3/klines", klines)
+    app.router.add_get("/ws/{stream}", kline_stream)
+    return app
+
+
+async def start_server(app=None, host=HOST, port=PORT):
+    """
+    Démarre le serveur dans la boucle asyncio courante (pour les tests).
+
+    :return: (runner à arrêter avec await runner.cleanup(), URL de /api/v3/klines)
+    """
+    app = app or create_app()
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner, f"http://{host}:{port}/api/v3/klines"
+
+
+def main():
+    web.run_app(create_app(), host=HOST, port=PORT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# cache des indicateurs (SMA) calculés à partir d'une somme cumulée
+"""
+/*********************************\
+|* Cache d'indicateurs (SMA_X)   *|
+\*********************************/
+
+    * On calcule une seule fois la somme cumulée (prefix sum) des prix de clôture, ensuite la SMA de
+    n'importe quelle fenêtre s'obtient par une simple différence : sma[i] = (S[i+1] - S[i+1-X]) / X.
+    Essayer 200 valeurs de SMA_VALUE coûte donc à peu près une passe sur les données, pas 200.
+    La somme est cumulée par blocs de PREFIX_CHUNK_ROWS valeurs, chacun décalé de sa première valeur
+    (comme l'écart type glissant de indicator_engine.py) : une seule somme sur tout l'historique grandit
+    avec lui et la différence de deux grands nombres perd de la précision.
+
+    * La clef d'une série est son empreinte (hash de toutes les valeurs) ; quand l'appelant la connaît déjà
+    (store_fingerprint de candle_store.py, derive_key), sma(..., data_key=...) ne relit pas les valeurs :
+    une colonne déjà calculée est relue sans passe sur les données.
+
+    * Chaque colonne calculée est enregistrée sur le disque (un .npy par colonne) sous une clef
+    (empreinte des données, fenêtre). Quand le cache dépasse sa taille maximale, on supprime les
+    colonnes utilisées le moins récemment (LRU, d'après la date de dernier accès du fichier).
+
+    * Comme pandas, si les X dernières valeurs sont identiques on renvoie directement le prix,
+    pour que close > SMA_X donne le même résultat.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+# dossier du cache sur le disque
+CACHE_DIR = "indicator_cache"
+# taille maximale du cache sur le disque (en octets)
+MAX_CACHE_BYTES = 2 * 1024**3
+# lignes par bloc de la somme cumulée (un décalage par bloc garde la précision)
+PREFIX_CHUNK_ROWS = 4096
+
+
+def fingerprint(values):
+    """
+    Empreinte (hash) d'un tableau : deux tableaux identiques ont la même empreinte.
+    """
+    values = np.ascontiguousarray(values)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{values.dtype.str}:{values.shape}".encode())
+    digest.update(values.view(np.uint8))
+    return digest.hexdigest()
+
+
+def derive_key(data_key, *parts):
+    """
+    Empreinte d'une série tirée de données déjà identifiées (ex: store + plage de dates, jours gardés),
+    calculée à partir de leur empreinte sans relire les valeurs.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(":".join(str(part) for part in (data_key,) + parts).encode())
+    return digest.hexdigest()
+
+
+def chunked_prefix_sum(values, chunk_rows=PREFIX_CHUNK_ROWS):
+    """
+    Somme cumulée par blocs de chunk_rows valeurs : dans chaque bloc on cumule valeur - première valeur du bloc,
+    les sommes restent petites quelle que soit la longueur de la série.
+
+    :return: Tableaux de n + 1 valeurs (une par borne de fenêtre j, la borne n appartient au dernier bloc) :
+             (somme locale avant j dans son bloc, première valeur du bloc, position de j dans le bloc,
+             somme locale du bloc entier), puis les sommes cumulées des blocs entiers avec un 0 au début.
+    """
+    n = len(values)
+    blocks = max(1, -(-n // chunk_rows))
+    offsets = values[::chunk_rows] if n else np.zeros(1)
+    shifted = np.zeros((blocks, chunk_rows))
+    shifted.ravel()[:n] = values
+    shifted -= offsets[:, None]
+    # les valeurs ajoutées pour compléter le dernier bloc ne comptent pas
+    shifted.ravel()[n:] = 0.0
+    sums = np.cumsum(shifted, axis=1)
+    totals = sums[:, -1]
+    local = np.empty(n + 1)
+    local[1:] = sums.ravel()[:n]
+    local[::chunk_rows] = 0.0
+    # la borne n appartient au dernier bloc : elle garde sa somme locale
+    local[n] = totals[-1]
+    lengths = np.full(blocks, chunk_rows)
+    lengths[-1] = n - (blocks - 1) * chunk_rows
+    positions = np.append(np.tile(np.arange(chunk_rows), blocks)[:n], lengths[-1])
+    row_offsets = np.append(np.repeat(offsets, chunk_rows)[:n], offsets[-1])
+    row_totals = np.append(np.repeat(totals, chunk_rows)[:n], totals[-1])
+    block_prefix = np.concatenate([[0.0], np.cumsum(totals + lengths * offsets)])
+    return local, row_offsets, positions, row_totals, block_prefix
+
+
+def window_sums(prefix, window, chunk_rows=PREFIX_CHUNK_ROWS):
+    """
+    Sommes glissantes sum(values[i - window + 1:i + 1]) pour i >= window - 1, à partir de chunked_prefix_sum.
+    Une fenêtre à cheval sur plusieurs blocs est découpée en fin du bloc de départ + blocs entiers + début du
+    bloc d'arrivée : chaque terme reste petit devant la somme elle-même.
+    """
+    local, offsets, positions, block_sums, block_prefix = prefix
+    n = len(local) - 1
+    count = n - window + 1
+    if window > chunk_rows:
+        # toutes les fenêtres couvrent plusieurs blocs : fin du bloc de départ + blocs entiers + début du bloc d'arrivée
+        sums = block_sums[:count] - local[:count] + (chunk_rows - positions[:count]) * offsets[:count]
+        sums += local[window:] + positions[window:] * offsets[window:]
+        start_blocks = np.arange(count) // chunk_rows
+        end_blocks = (np.arange(window, n + 1) - positions[window:]) // chunk_rows
+        sums += block_prefix[end_blocks] - block_prefix[start_blocks + 1]
+        return sums
+    # fenêtre dans un seul bloc : local[j + window] - local[j] + window * première valeur du bloc
+    sums = local[window:] - local[:count]
+    sums += window * offsets[:count]
+    # fenêtres à cheval sur deux blocs : fin du bloc de départ + début du bloc d'arrivée
+    crossing = np.flatnonzero(positions[window:] < window)
+    start, end = crossing, crossing + window
+    sums[crossing] = (block_sums[start] - local[start] + (chunk_rows - positions[start]) * offsets[start]
+                      + local[end] + positions[end] * offsets[end])
+    return sums
+
+
+def equal_runs(values):
+    """
+    Pour chaque position, nombre de valeurs identiques consécutives qui se terminent à cette position.
+    """
+    indices = np.arange(len(values))
+    changes = np.concatenate([[True], values[1:] != values[:-1]]) if len(values) else np.empty(0, dtype=bool)
+    run_starts = np.maximum.accumulate(np.where(changes, indices, 0)) if len(values) else indices
+    return indices - run_starts + 1
+
+
+class IndicatorCache:
+    """
+    Cache des SMA basé sur une somme cumulée, avec persistance sur le disque et éviction LRU.
+
+    :param cache_dir: Dossier où sont enregistrées les colonnes (None pour ne rien écrire).
+    :param max_bytes: Taille maximale du cache sur le disque.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # sommes cumulées gardées en mémoire : {empreinte: (sommes par blocs, runs)}
+        self.prefixes = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def prefix_sum(self, values, key=None):
+        """
+        Somme cumulée des valeurs par blocs (voir chunked_prefix_sum) et longueurs des séries de valeurs
+        identiques. Calculée une seule fois par série de données.
+        """
+        key = key or fingerprint(values)
+        if key not in self.prefixes:
+            values = np.asarray(values, dtype=np.float64)
+            prefix = chunked_prefix_sum(values)
+            # on ne garde que la dernière série en mémoire
+            self.prefixes.clear()
+            self.prefixes[key] = (prefix, equal_runs(values))
+        return self.prefixes[key]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            array = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # on met à jour la date d'accès pour l'éviction LRU
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return array
+
+    def _save(self, key, array):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        # écriture atomique (plusieurs processus peuvent partager le cache)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Supprime les colonnes les moins récemment utilisées jusqu'à repasser sous max_bytes.
+        """
+        if not self.cache_dir:
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npy"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def sma(self, values, window, data_key=None):
+        """
+        SMA sur `window` périodes (NaN tant que la fenêtre n'est pas remplie), lue depuis le cache
+        si elle a déjà été calculée pour ces données.
+
+        :param values: Tableau des prix de clôture.
+        :param window: Nombre de périodes.
+        :param data_key: Empreinte des valeurs si l'appelant la connaît (sinon calculée sur tout le tableau).
+        :return: Tableau numpy de la SMA.
+        """
+        if window <= 0:
+            raise ValueError("window must be a positive integer.")
+        values = np.asarray(values, dtype=np.float64)
+        data_key = data_key or fingerprint(values)
+        key = f"{data_key}_sma_{window}"
+        cached = self._load(key)
+        if cached is not None and len(cached) == len(values):
+            return cached
+        prefix, runs = self.prefix_sum(values, data_key)
+        n = len(values)
+        result = np.full(n, np.nan)
+        if window <= n:
+            result[window - 1:] = window_sums(prefix, window) / window
+            flat = runs >= window
+            result[flat] = values[flat]
+        self._save(key, result)
+        return result
@@ -0,0 +1,410 @@
+# moteur d'indicateurs : les stratégies déclarent leurs indicateurs, tout est calculé en une passe numpy
+"""
+/*********************************\
+|* Moteur d'indicateurs          *|
+\*********************************/
+
+    * Chaque appel ta (ta.trend.sma_indicator, ta.trend.ema_indicator...) crée une Series pandas et refait
+    ses propres calculs intermédiaires. Ici une stratégie déclare ce dont elle a besoin :
+        IndicatorEngine({"EMA1": ("ema", {"window": 13}), "EMA2": ("ema", {"window": 38})})
+    et le moteur :
+        - résout le graphe de dépendances (DAG) : un même intermédiaire (ex: la somme cumulée des clôtures,
+          la moyenne glissante sur 20 bougies) n'est calculé qu'une fois, pour la SMA comme pour les Bollinger
+        - calcule tout avec numpy, dans l'ordre du graphe, en libérant chaque intermédiaire dès qu'il ne sert plus
+        - écrit les colonnes dans un seul tableau 2D préalloué (une ligne contiguë par colonne)
+
+    * Indicateurs du registre (mêmes valeurs que ta, NaN tant que la fenêtre n'est pas remplie) :
+        - sma (window), ema (window), rsi (window), bollinger (window, dev : colonnes mavg / hband / lband),
+          atr (window ; ta renvoie 0 au lieu de NaN avant la fenêtre)
+    D'autres se déclarent avec @register (voir plus bas).
+
+    * Les EMA (et le lissage de Wilder du RSI et de l'ATR) sont des récurrences y[i] = c * y[i-1] + b[i] :
+    linear_recurrence les résout par blocs (somme cumulée dans chaque bloc, puis report d'un bloc au suivant),
+    sans boucle python par bougie.
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from indicator_cache import equal_runs
+
+# facteur max entre deux termes d'un bloc de linear_recurrence (précision : ~1e-13 en relatif)
+MAX_GROWTH = 1e3
+# lignes traitées à la fois pour l'écart type glissant (un décalage par bloc garde la précision)
+STD_CHUNK_ROWS = 4096
+
+# noeud du graphe : fonction de calcul, dépendances et colonnes produites
+Node = namedtuple("Node", ["function", "depends", "outputs"])
+
+# registre : nom -> Node (indicateurs et intermédiaires)
+REGISTRY = {}
+
+
+def register(name, depends=None, outputs=None):
+    """
+    Décorateur : ajoute un noeud au registre.
+
+    :param depends: Fonction params -> liste de (nom, params) des noeuds dont le calcul a besoin
+                    (leurs résultats sont passés dans le même ordre).
+    :param outputs: Fonction params -> liste des suffixes de colonnes pour un indicateur ([""] : une colonne) ;
+                    None pour un intermédiaire (la fonction renvoie un tableau au lieu d'écrire dans `out`).
+    La fonction reçoit (params, inputs, out) : out est la liste des lignes du tableau 2D à remplir.
+    """
+    def decorator(function):
+        REGISTRY[name] = Node(function, depends or (lambda params: []), outputs)
+        return function
+    return decorator
+
+
+def node_key(name, params):
+    # clef d'un noeud : deux demandes identiques n'en font qu'un
+    return name, tuple(sorted(params.items()))
+
+
+def linear_recurrence(b, c, initial=0.0):
+    """
+    Résout y[i] = c * y[i-1] + b[i] avec y[-1] = initial, pour 0 <= c < 1.
+    Par blocs de taille B (c^-B <= MAX_GROWTH) : dans un bloc y[j] = c^j * cumsum(c^-k * b[k]) + c^(j+1) * y_avant,
+    tous les blocs en même temps, puis une boucle sur les blocs (pas sur les bougies) pour le report.
+
+    :return: Tableau y (float64).
+    """
+    b = np.asarray(b, dtype=np.float64)
+    n = len(b)
+    if n == 0:
+        return np.empty(0)
+    if c == 0:
+        return b.copy()
+    size = min(n, max(1, int(math.log(MAX_GROWTH) / -math.log(c))))
+    blocks = -(-n // size)
+    padded = np.zeros(blocks * size)
+    padded[:n] = b
+    exponents = np.arange(size)
+    # solution de chaque bloc en partant de 0
+    local = np.cumsum(padded.reshape(blocks, size) * c ** -exponents, axis=1) * c ** exponents
+    # valeur juste avant chaque bloc
+    carries = np.empty(blocks)
+    carry = initial
+    decay = c ** size
+    for k, last in enumerate(local[:, -1].tolist()):
+        carries[k] = carry
+        carry = last + decay * carry
+    local += carries[:, None] * c ** (exponents + 1)
+    return local.ravel()[:n]
+
+
+def ema(values, window, initial=None):
+    """
+    EMA comme ta.trend.ema_indicator (ewm(span=window, adjust=False)), sans les NaN du début.
+
+    :param initial: EMA de la bougie précédente pour continuer une série (None : la série commence ici).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    alpha = 2 / (window + 1)
+    if len(values) == 0:
+        return np.empty(0)
+    # y[-1] = values[0] donne y[0] = values[0] (première valeur de ewm adjust=False)
+    return linear_recurrence(alpha * values, 1 - alpha, values[0] if initial is None else initial)
+
+
+# ------------------------------------------------------------------
+# intermédiaires
+# ------------------------------------------------------------------
+
+@register("input")
+def _input(params, inputs, out):
+    # colonne des bougies (float64), déjà préparée par IndicatorEngine.compute
+    raise KeyError(params["column"])
+
+
+@register("prefix_sum", depends=lambda params: [("input", {"column": params["column"]})])
+def _prefix_sum(params, inputs, out):
+    # somme cumulée avec un 0 au début : sum(values[i:j]) = prefix[j] - prefix[i]
+    return np.concatenate([[0.0], np.cumsum(inputs[0])])
+
+
+@register("equal_runs", depends=lambda params: [("input", {"column": params["column"]})])
+def _equal_runs(params, inputs, out):
+    # longueur de la suite de valeurs identiques finissant à chaque bougie (fenêtres plates)
+    return equal_runs(inputs[0])
+
+
+@register("rolling_mean", depends=lambda params: [
+    ("input", {"column": params["column"]}), ("prefix_sum", {"column": params["column"]}),
+    ("equal_runs", {"column": params["column"]}),
+])
+def _rolling_mean(params, inputs, out):
+    # moyenne glissante tirée de la somme cumulée (comme IndicatorCache.sma)
+    values, prefix, runs = inputs
+    window = params["window"]
+    n = len(values)
+    result = np.full(n, np.nan)
+    if window <= n:
+        result[window - 1:] = (prefix[window:] - prefix[:n - window + 1]) / window
+        # comme pandas : fenêtre de valeurs identiques -> la valeur exacte
+        flat = runs >= window
+        result[flat] = values[flat]
+    return result
+
+
+@register("rolling_std", depends=lambda params: [
+    ("input", {"column": params["column"]}), ("equal_runs", {"column": params["column"]}),
+])
+def _rolling_std(params, inputs, out):
+    # écart type glissant (ddof=0) : var = moyenne((x - d)²) - moyenne(x - d)², par blocs de STD_CHUNK_ROWS lignes
+    # avec d = première valeur du bloc (sommes locales et petites : pas de perte de précision sur une longue série)
+    values, runs = inputs
+    window = params["window"]
+    n = len(values)
+    result = np.full(n, np.nan)
+    for start in range(window - 1, n, STD_CHUNK_ROWS):
+        stop = min(start + STD_CHUNK_ROWS, n)
+        span = values[start - window + 1:stop]
+        shifted = span - span[0]
+        sums = np.concatenate([[0.0], np.cumsum(shifted)])
+        squares = np.concatenate([[0.0], np.cumsum(shifted * shifted)])
+        mean = (sums[window:] - sums[:-window]) / window
+        variance = (squares[window:] - squares[:-window]) / window - mean * mean
+        result[start:stop] = np.sqrt(np.maximum(variance, 0.0))
+    # fenêtre de valeurs identiques : 0 exact, comme pandas
+    result[runs >= window] = 0.0
+    return result
+
+
+@register("diff", depends=lambda params: [("input", {"column": params["column"]})])
+def _diff(params, inputs, out):
+    # variation d'une bougie à l'autre (0 pour la première, comme up / down de ta)
+    values = inputs[0]
+    return np.concatenate([[0.0], np.diff(values)]) if len(values) else np.empty(0)
+
+
+@register("true_range", depends=lambda params: [
+    ("input", {"column": "high"}), ("input", {"column": "low"}), ("input", {"column": "close"}),
+])
+def _true_range(params, inputs, out):
+    # max(high - low, |high - close précédent|, |low - close précédent|), high - low pour la première bougie
+    high, low, close = inputs
+    result = high - low
+    if len(close) > 1:
+        previous = close[:-1]
+        np.maximum(result[1:], np.abs(high[1:] - previous), out=result[1:])
+        np.maximum(result[1:], np.abs(low[1:] - previous), out=result[1:])
+    return result
+
+
+# ------------------------------------------------------------------
+# indicateurs
+# ------------------------------------------------------------------
+
+def _column(params):
+    # colonne des bougies utilisée par un indicateur (close par défaut)
+    return params.get("column", "close")
+
+
+@register("sma", depends=lambda params: [("rolling_mean", {"column": _column(params), "window": params["window"]})],
+          outputs=lambda params: [""])
+def _sma(params, inputs, out):
+    out[0][:] = inputs[0]
+
+
+@register("ema", depends=lambda params: [("input", {"column": _column(params)})], outputs=lambda params: [""])
+def _ema(params, inputs, out):
+    window = params["window"]
+    out[0][:] = ema(inputs[0], window)
+    out[0][:window - 1] = np.nan
+
+
+@register("rsi", depends=lambda params: [("diff", {"column": _column(params)})], outputs=lambda params: [""])
+def _rsi(params, inputs, out):
+    # lissage de Wilder (ewm alpha = 1 / window) des hausses et des baisses, comme ta.momentum.rsi
+    diff = inputs[0]
+    window = params["window"]
+    if len(diff) == 0:
+        return
+    up = np.where(diff > 0, diff, 0.0)
+    down = np.where(diff < 0, -diff, 0.0)
+    decay = 1 - 1 / window
+    ema_up = linear_recurrence(up / window, decay, up[0])
+    ema_down = linear_recurrence(down / window, decay, down[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[0][:] = np.where(ema_down == 0, 100.0, 100 - 100 / (1 + ema_up / ema_down))
+    out[0][:window - 1] = np.nan
+
+
+@register("bollinger", depends=lambda params: [
+    ("rolling_mean", {"column": _column(params), "window": params["window"]}),
+    ("rolling_std", {"column": _column(params), "window": params["window"]}),
+], outputs=lambda params: ["mavg", "hband", "lband"])
+def _bollinger(params, inputs, out):
+    # bandes de Bollinger comme ta.volatility.BollingerBands (écart type ddof=0)
+    mean, std = inputs
+    dev = params.get("dev", 2)
+    out[0][:] = mean
+    np.add(mean, dev * std, out=out[1])
+    np.subtract(mean, dev * std, out=out[2])
+
+
+@register("atr", depends=lambda params: [("true_range", {})], outputs=lambda params: [""])
+def _atr(params, inputs, out):
+    # moyenne des window premiers true range, puis lissage de Wilder, comme ta.volatility.average_true_range
+    true_range = inputs[0]
+    window = params["window"]
+    out[0][:] = np.nan
+    if len(true_range) < window:
+        return
+    first = true_range[:window].mean()
+    out[0][window - 1] = first
+    out[0][window:] = linear_recurrence(true_range[window:] / window, (window - 1) / window, first)
+
+
+# ------------------------------------------------------------------
+# moteur
+# ------------------------------------------------------------------
+
+class IndicatorEngine:
+    """
+    Calcule en une passe un ensemble d'indicateurs déclarés.
+
+    :param indicators: Dictionnaire {nom de colonne: (indicateur, params)} ou liste de (indicateur, params)
+                       (noms automatiques : "ema_13", "bollinger_hband_20_2"...). Un indicateur à plusieurs
+                       colonnes (bollinger) donne <nom>_<suffixe>.
+    """
+
+    def __init__(self, indicators):
+        if not isinstance(indicators, dict):
+            indicators = {default_name(name, params): (name, params) for name, params in indicators}
+        self.indicators = indicators
+        # colonnes du tableau de sortie et, pour chaque indicateur, ses lignes
+        self.columns = []
+        self.targets = []
+        for column, (name, params) in indicators.items():
+            if name not in REGISTRY or REGISTRY[name].outputs is None:
+                raise ValueError(f"Indicateur inconnu : {name}")
+            suffixes = REGISTRY[name].outputs(params)
+            rows = list(range(len(self.columns), len(self.columns) + len(suffixes)))
+            self.columns += [column if suffix == "" else f"{column}_{suffix}" for suffix in suffixes]
+            self.targets.append((node_key(name, params), name, params, rows))
+        self.order, self.consumers = self._resolve()
+
+    def _resolve(self):
+        # ordre topologique des noeuds nécessaires (parcours en profondeur) et nombre d'utilisateurs de chacun
+        order = []
+        consumers = {}
+        visiting = set()
+        seen = set()
+
+        def visit(name, params):
+            key = node_key(name, params)
+            if key in seen:
+                return key
+            if key in visiting:
+                raise ValueError(f"Dépendance circulaire sur {name}")
+            visiting.add(key)
+            depends = [visit(dep_name, dep_params) for dep_name, dep_params in REGISTRY[name].depends(params)]
+            for dep in depends:
+                consumers[dep] = consumers.get(dep, 0) + 1
+            visiting.discard(key)
+            seen.add(key)
+            order.append((key, name, params, depends))
+            return key
+
+        for _, name, params, _ in self.targets:
+            visit(name, params)
+        return order, consumers
+
+    def inputs(self):
+        """
+        Colonnes des bougies dont le calcul a besoin (ex: ["close"], ["high", "low", "close"]).
+        """
+        return [dict(key[1])["column"] for key, name, _, _ in self.order if name == "input"]
+
+    def compute(self, candles):
+        """
+        Calcule tous les indicateurs.
+
+        :param candles: DataFrame ou dictionnaire {colonne: tableau} (close, et high / low pour l'ATR).
+        :return: IndicatorColumns (tableau 2D columns x bougies + noms des colonnes).
+        """
+        results = {}
+        remaining = dict(self.consumers)
+        n = None
+        values = None
+        # lignes de chaque indicateur (le même indicateur peut être demandé sous plusieurs noms)
+        targets = {}
+        for key, _, _, rows in self.targets:
+            targets.setdefault(key, []).append(rows)
+        for key, name, params, depends in self.order:
+            if name == "input":
+                column = candles[params["column"]]
+                results[key] = np.ascontiguousarray(column.to_numpy() if hasattr(column, "to_numpy") else column, dtype=np.float64)
+                if values is None:
+                    n = len(results[key])
+                    # un seul tableau pour toutes les colonnes
+                    values = np.empty((len(self.columns), n))
+                continue
+            inputs = [results[dep] for dep in depends]
+            node = REGISTRY[name]
+            if node.outputs is None:
+                results[key] = node.function(params, inputs, None)
+            else:
+                first, *others = targets[key]
+                node.function(params, inputs, [values[row] for row in first])
+                for rows in others:
+                    values[rows] = values[first]
+            # on libère les intermédiaires qui ne servent plus
+            for dep in depends:
+                remaining[dep] -= 1
+                if remaining[dep] == 0:
+                    del results[dep]
+        if values is None:
+            values = np.empty((len(self.columns), 0))
+        return IndicatorColumns(self.columns, values)
+
+
+def default_name(name, params):
+    """
+    Nom de colonne par défaut : indicateur + valeurs des paramètres dans l'ordre donné ("ema_13", "bollinger_20_2").
+    """
+    return "_".join([name] + [str(value) for value in params.values()])
+
+
+class IndicatorColumns:
+    """
+    Résultat d'IndicatorEngine.compute : values[i] est la colonne names[i] (vue contiguë, sans copie).
+    """
+
+    def __init__(self, names, values):
+        self.names = names
+        self.values = values
+        self.index = {name: i for i, name in enumerate(names)}
+
+    def __getitem__(self, name):
+        return self.values[self.index[name]]
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.names)
+
+    def to_frame(self, index=None):
+        """
+        DataFrame des colonnes (une copie en colonnes pandas).
+        """
+        return pd.DataFrame({name: self.values[i] for i, name in enumerate(self.names)}, index=index)
+
+
+def add_indicators(df, indicators):
+    """
+    Ajoute des colonnes d'indicateurs à un DataFrame de bougies (à la place d'un appel ta par colonne).
+
+    :param indicators: Voir IndicatorEngine.
+    :return: Le DataFrame.
+    """
+    columns = IndicatorEngine(indicators).compute(df)
+    for name in columns.names:
+        df[name] = columns[name]
+    return df
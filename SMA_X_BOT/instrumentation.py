@@ -0,0 +1,312 @@
+# mesures par étape : durée, temps CPU, lignes, mémoire et compteurs
+"""
+/*********************************\
+|* Instrumentation des étapes    *|
+\*********************************/
+
+    * main() enchaîne chargement -> vérification -> découpage -> SMA -> trading, et les téléchargeurs
+    n'affichaient qu'une barre tqdm : impossible de savoir où passe le temps d'un long lancement.
+    Chaque étape est entourée d'un `with stage("nom"):` (ou décorée avec @instrumented()) qui mesure :
+        - la durée réelle (wall) et le temps CPU du processus
+        - les lignes en entrée / en sortie (rows_in, rows_out) et le débit
+        - le pic de mémoire et la mémoire restée allouée (tracemalloc, seulement si MEMORY est activé :
+          tracemalloc ralentit fortement le code ; avec des tâches asyncio en parallèle, le pic d'une étape
+          compte aussi la mémoire des autres tâches)
+        - des compteurs : count("trades_opened"), count("http_retries"), count("http_429")...
+    Les étapes peuvent être imbriquées (nom complet "main/trade/print_report") ; les compteurs d'une étape
+    sont aussi ajoutés à l'étape qui la contient. L'étape courante suit les tâches asyncio (contextvars).
+
+    * Sorties :
+        - LOG_FILE : une ligne JSON par étape terminée, écrite au fil de l'eau (suivi d'un lancement en cours)
+        - write_metrics(fichier) : toutes les étapes + les compteurs totaux dans un seul JSON
+        - format_summary() : tableau des étapes, à afficher à la fin d'un lancement
+
+    * Profilage d'une seule étape : PROFILE = {"trade"} (ou INSTRUMENT_PROFILE=trade) lance cProfile
+    pendant cette étape, écrit <étape>.prof dans PROFILE_DIR et affiche les fonctions les plus coûteuses.
+    Avec PROFILER = "pyinstrument" (s'il est installé) on obtient l'arbre d'appels de pyinstrument à la place.
+
+    Réglages par variables d'environnement : INSTRUMENT_LOG=etapes.jsonl INSTRUMENT_MEMORY=1
+    INSTRUMENT_PROFILE=trade,downloadDb INSTRUMENT_PROFILER=pyinstrument
+"""
+
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from collections import Counter
+
+# fichier JSON lines des étapes terminées (None pour ne rien écrire)
+LOG_FILE = os.environ.get("INSTRUMENT_LOG") or None
+# mesure de la mémoire avec tracemalloc
+MEMORY = os.environ.get("INSTRUMENT_MEMORY", "") not in ("", "0")
+# noms des étapes à profiler
+PROFILE = {name for name in os.environ.get("INSTRUMENT_PROFILE", "").split(",") if name}
+# profileur : "cProfile" ou "pyinstrument"
+PROFILER = os.environ.get("INSTRUMENT_PROFILER", "cProfile")
+# dossier des fichiers .prof
+PROFILE_DIR = "."
+# nombre de fonctions affichées par le profilage
+PROFILE_LINES = 25
+
+# étapes terminées, dans l'ordre de fin
+RECORDS = []
+# compteurs de tout le lancement (y compris hors étape)
+TOTALS = Counter()
+# étape en cours dans le contexte courant (thread ou tâche asyncio)
+_current = contextvars.ContextVar("instrumentation_stage", default=None)
+# étape en cours de profilage (un seul profileur à la fois)
+_profiling = None
+
+
+class Stage:
+    """
+    Mesures d'une étape, à utiliser avec `with stage(...) as s:` ; renseigner s.rows_out avant la fin.
+    """
+
+    def __init__(self, name, rows_in=None, memory=None, profile=None):
+        """
+        :param name: Nom de l'étape.
+        :param rows_in: Nombre de lignes en entrée (optionnel).
+        :param memory: Mesurer la mémoire (par défaut : MEMORY).
+        :param profile: Profiler l'étape (par défaut : si son nom est dans PROFILE).
+        """
+        self.name = name
+        self.path = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.counters = Counter()
+        self.memory = MEMORY if memory is None else memory
+        self.profile = name in PROFILE if profile is None else profile
+        self.record = None
+        self._parent = None
+        self._token = None
+        self._profiler = None
+        self._started_tracing = False
+        self._child_peak = 0
+
+    def count(self, name, n=1):
+        # ajoute n au compteur de l'étape (et au total du lancement)
+        self.counters[name] += n
+        TOTALS[name] += n
+
+    def __enter__(self):
+        self._parent = _current.get()
+        if self._parent is not None:
+            self.path = f"{self._parent.path}/{self.name}"
+        self._token = _current.set(self)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._mem_start, self._outer_peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        global _profiling
+        # une étape imbriquée dans une étape déjà profilée est dans son profil
+        if self.profile and _profiling is None:
+            self._profiler = _start_profiler()
+            _profiling = self
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        global _profiling
+        if self._profiler is not None:
+            _stop_profiler(self._profiler, self.path)
+            _profiling = None
+        peak_mb = allocated_mb = None
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # reset_peak a effacé le pic des étapes imbriquées terminées : on garde le plus haut
+            peak = max(peak, self._child_peak)
+            peak_mb = (peak - self._mem_start) / 1024**2
+            allocated_mb = (current - self._mem_start) / 1024**2
+            if self._started_tracing:
+                tracemalloc.stop()
+            elif self._parent is not None:
+                self._parent._child_peak = max(self._parent._child_peak, self._outer_peak, peak)
+        _current.reset(self._token)
+        if self._parent is not None:
+            self._parent.counters.update(self.counters)
+        # débit calculé sur les lignes en entrée (en sortie si l'entrée n'est pas connue)
+        rows = _to_int(self.rows_in if self.rows_in is not None else self.rows_out)
+        self.record = {
+            "stage": self.path,
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "rows_in": _to_int(self.rows_in),
+            "rows_out": _to_int(self.rows_out),
+            "rows_per_sec": rows / wall if rows is not None and wall else None,
+            "peak_mb": peak_mb,
+            "allocated_mb": allocated_mb,
+            "counters": dict(self.counters),
+            "error": exc_type.__name__ if exc_type else None,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        RECORDS.append(self.record)
+        log_record(self.record)
+        return False
+
+
+def _to_int(value):
+    # numpy / pandas -> int python (pour le JSON)
+    return None if value is None else int(value)
+
+
+def stage(name, rows_in=None, memory=None, profile=None):
+    """
+    Contexte mesurant une étape (voir Stage).
+
+    :return: Le Stage (s.rows_out, s.count(...), s.record une fois terminé).
+    """
+    return Stage(name, rows_in, memory, profile)
+
+
+def count(name, n=1):
+    """
+    Ajoute n au compteur `name` de l'étape en cours (et au total du lancement) ; sans étape en cours,
+    seul le total est mis à jour.
+    """
+    current = _current.get()
+    if current is not None:
+        current.count(name, n)
+    else:
+        TOTALS[name] += n
+
+
+def current_stage():
+    """
+    Étape en cours dans le contexte courant, ou None.
+    """
+    return _current.get()
+
+
+def _length(value):
+    # nombre de lignes d'un argument / résultat (len) ou None (les chaînes et dictionnaires n'en ont pas)
+    if isinstance(value, (str, bytes, dict)):
+        return None
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def instrumented(name=None, memory=None, profile=None):
+    """
+    Décorateur : chaque appel de la fonction est une étape (nom de la fonction par défaut).
+    rows_in = len du premier argument, rows_out = len du résultat, quand ils en ont une.
+    Marche aussi pour les fonctions async.
+    """
+    def decorator(function):
+        label = name or function.__name__
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with stage(label, _length(args[0]) if args else None, memory, profile) as s:
+                    result = await function(*args, **kwargs)
+                    s.rows_out = _length(result)
+                return result
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(label, _length(args[0]) if args else None, memory, profile) as s:
+                result = function(*args, **kwargs)
+                s.rows_out = _length(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def _start_profiler():
+    # pyinstrument s'il est demandé et installé, sinon cProfile
+    if PROFILER == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("⚠️ pyinstrument n'est pas installé, profilage avec cProfile.")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler, path):
+    # arrête le profileur, écrit le .prof (cProfile) et affiche les fonctions les plus coûteuses
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        file_name = os.path.join(PROFILE_DIR, path.replace("/", "__") + ".prof")
+        profiler.dump_stats(file_name)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        print(f"⏱️ Profil de {path} (enregistré dans {file_name}) :\n{out.getvalue()}")
+    else:
+        profiler.stop()
+        print(f"⏱️ Profil de {path} :\n{profiler.output_text(unicode=True)}")
+
+
+def log_record(record, file_name=None):
+    """
+    Ajoute une étape terminée au fichier JSON lines (LOG_FILE par défaut, rien si None).
+    """
+    file_name = file_name or LOG_FILE
+    if file_name:
+        with open(file_name, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def metrics(records=None):
+    """
+    Étapes terminées et compteurs totaux, sous forme de dictionnaire.
+    """
+    return {"stages": list(RECORDS if records is None else records), "counters": dict(TOTALS)}
+
+
+def write_metrics(file_name, records=None):
+    """
+    Écrit toutes les étapes terminées et les compteurs totaux dans un fichier JSON.
+    """
+    with open(file_name, "w") as f:
+        json.dump(metrics(records), f, indent=2)
+
+
+def reset():
+    """
+    Oublie les étapes terminées et les compteurs (nouveau lancement dans le même processus).
+    """
+    RECORDS.clear()
+    TOTALS.clear()
+
+
+def _cell(value, spec):
+    # case du tableau : vide si la mesure n'existe pas
+    return "" if value is None else format(value, spec)
+
+
+def format_summary(records=None):
+    """
+    Tableau des étapes terminées : durée, CPU, lignes, débit, mémoire, compteurs.
+    """
+    records = RECORDS if records is None else records
+    lines = [f"{'étape':<44} {'wall':>9} {'cpu':>9} {'lignes in':>11} {'lignes out':>11} {'lignes/s':>12} {'pic Mo':>8}  compteurs"]
+    for record in records:
+        counters = " ".join(f"{name}={value}" for name, value in sorted(record["counters"].items()))
+        error = f" ❌ {record['error']}" if record["error"] else ""
+        lines.append(
+            f"{record['stage']:<44} {record['wall_s']:8.3f}s {record['cpu_s']:8.3f}s "
+            f"{_cell(record['rows_in'], 'd'):>11} {_cell(record['rows_out'], 'd'):>11} "
+            f"{_cell(record['rows_per_sec'], ',.0f'):>12} {_cell(record['peak_mb'], '.1f'):>8}  {counters}{error}"
+        )
+    return "\n".join(lines)
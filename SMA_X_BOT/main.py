@@ -1,4 +1,3 @@
-
 # nouvelle version de la stratégie précédente 
 # utilidation de moyenne mobile simple 
 """
@@ -13,29 +12,52 @@
 """
 
 import pandas as pd
-import ta 
 import numpy as np
-import uuid
 import matplotlib.pyplot as plt
+from indicator_cache import IndicatorCache, derive_key
+from candle_store import store_path_for, store_exists, load_candles, store_fingerprint
+from day_partition import DayPartition
+from trade_ledger import TradeLedger
+from backtest_engine import BacktestEngine, StrategyConfig, trading_window
+from metrics import compute_metrics, format_report, to_json
+from instrumentation import count, format_summary, instrumented, stage, write_metrics
 
 
 # on récupère la base de donnée 
-def downloadDb(filaname):
+@instrumented()
+def downloadDb(filaname, start_date=None, end_date=None):
     print("Start downloading data...")
-    global START_DATE, END_DATE
-    # on stocke les données dans un data frame on parse les dates et on les indexe
-    df = pd.read_csv(filaname, parse_dates=['timestamp'], index_col='timestamp')
-    # on filtre les données selon les dates 
-    if START_DATE:
-        df = df[df.index >= pd.Timestamp(START_DATE)]
-    if END_DATE:
-        df = df[df.index <= pd.Timestamp(END_DATE)]
+    # par défaut les dates de main.py
+    start_date = START_DATE if start_date is None else start_date
+    end_date = END_DATE if end_date is None else end_date
+    # si le store binaire existe (voir candle_store.py), on ne lit que la plage de dates demandée
+    store_path = store_path_for(filaname)
+    if store_exists(store_path):
+        df = load_candles(store_path, start_date or None, end_date or None)
+    else:
+        # on stocke les données dans un data frame on parse les dates et on les indexe
+        df = pd.read_csv(filaname, parse_dates=['timestamp'], index_col='timestamp')
+        # on filtre les données selon les dates
+        if start_date:
+            df = df[df.index >= pd.Timestamp(start_date)]
+        if end_date:
+            df = df[df.index <= pd.Timestamp(end_date)]
     # on vérifie si la db est pas vide
     if df.empty:
         raise ValueError("No data available for the selected date range.")
     return df 
 
+# empreinte des données de downloadDb pour le cache d'indicateurs, sans relire les prix (None sans store)
+def data_key_for(filaname, start_date=None, end_date=None):
+    start_date = START_DATE if start_date is None else start_date
+    end_date = END_DATE if end_date is None else end_date
+    store_path = store_path_for(filaname)
+    if not store_exists(store_path):
+        return None
+    return store_fingerprint(store_path, start_date or None, end_date or None)
+
 # on vérifie l'intégrité de la base de donnée
+@instrumented()
 def verify_db_integrity(df, freq):
     # Créer un index complet basé sur les limites des timestamps
     complete_index = pd.date_range(start=df.index.min(), end=df.index.max(), freq=freq)
@@ -44,82 +66,60 @@ def verify_db_integrity(df, freq):
     if missing_timestamps.empty:
         print("No missing timestamps.")
     else:
-        print(f"Missing timestamps")
+        print(f"Missing timestamps: {len(missing_timestamps)} (voir repair_gaps.py pour les récupérer)")
+    return missing_timestamps
 
 # on subdivise la base de donnée par date
+@instrumented()
 def subdivide_db_by_date(df):
     print("Start subdividing db by name...")
-    # grouper les données par jour
-    grouped = df.groupby(pd.Grouper(freq='D'))
-    # crée un dictionnaire ou chaque clef est une date et chaque valeur est le DataFrame correspondant
-    daily_data = {date: data for date, data in grouped}
+    # un seul DataFrame + les bornes de chaque jour (voir day_partition.py),
+    # s'utilise comme un dictionnaire ou chaque clef est une date et chaque valeur le DataFrame du jour
+    daily_data = DayPartition(df)
     return daily_data
 
 # supprime mes jours qui ne ont pas 1440 min ou tout le SMA_X de calculé
 def remove_incomplete_days(daily_data):
     print("Start filtering daily_data...")
-    filtered_data = {}
-    removed_days = []
-    for date, data in daily_data.items():
-        if len(data) != 1440 or data['SMA_X'].isna().any():
-            removed_days.append(date)  # Enregistrer les jours supprimés
-        else:
-            filtered_data[date] = data  # Conserver les jours complets
+    # une seule opération sur tous les jours
+    filtered_data = daily_data.select(daily_data.complete_mask(['SMA_X']))
     return filtered_data
 
 # vérifie l'intégrité des données et affiche un print 
 def verify_daily_data_integrity(daily_data):
     print("🔍 Vérification de l'intégrité des données journalières...")
-    issues_found = False  # Indicateur si des problèmes sont détectés
-    for date, data in daily_data.items():
-        if len(data) == 1440:  # Vérifier les jours complets
-            missing_sma = data['SMA_X'].isna().sum()  # Vérifier SMA_X manquant
-            if missing_sma > 0:
-                #print(f"❌ SMA_X incomplet pour le jour {date.date()} - {missing_sma} valeurs manquantes.")
-                issues_found = True
-        else:
-            #print(f"⚠️ Jour {date.date()} ignoré (données incomplètes, {len(data)} minutes).")
-            issues_found = True
+    # jours incomplets ou avec un SMA_X manquant
+    issues_found = not daily_data.complete_mask(['SMA_X']).all()
     if not issues_found:
         print("✅ Toutes les données journalières sont complètes et valides !")
     else:
         print(f"❌ Problème détecté dans les données")
 
-# on calcul la moyenne mobile simple sur X périodes, et on supprime les période défectueses 
-def calculate_sma_x_on_daily_data(daily_data):
-    # valeur globale du SMA qu'on à défini 
-    global SMA_VALUE
+# on calcul la moyenne mobile simple sur X périodes, et on supprime les période défectueses
+@instrumented()
+def calculate_sma_x_on_daily_data(daily_data, cache=None, sma_value=None, data_key=None):
+    # valeur du SMA (par défaut celle de main.py)
+    sma_value = SMA_VALUE if sma_value is None else sma_value
     print("Start calculating SMA_X on daily data...")
-    # Données précédentes
-    previous_data = pd.DataFrame()
-    skipped_days = 0
-    processed_days = 0
-    filtered_data = {}  # Stocker les jours valides avec SMA_X complet
-    for date, data in daily_data.items():
-        # Ajouter la colonne SMA_X avec des valeurs NaN par défaut
-        data['SMA_X'] = np.nan
-        # Vérifier qu'il y a bien 1440 minutes dans la journée
-        if len(data) != 1440:
-            #print(f"Skipping date {date}: insufficient data ({len(data)} minutes)")
-            skipped_days += 1
-            continue
-        # Combiner les données précédentes avec celles du jour actuel
-        combined_data = pd.concat([previous_data, data])
-        # Calculer le SMA_X globalement
-        combined_data['SMA_X'] = ta.trend.sma_indicator(combined_data['close'], window=SMA_VALUE)
-        # Vérifier si toutes les lignes actuelles ont un SMA_X calculé
-        if combined_data['SMA_X'].loc[data.index].isna().any():
-            #print(f"Skipping date {date}: incomplete SMA_X calculation.")
-            skipped_days += 1
-            # Mettre à jour les données précédentes pour le prochain jour
-            previous_data = data.tail(SMA_VALUE)
-            continue
-        # Appliquer les valeurs calculées au DataFrame du jour actuel
-        data['SMA_X'] = combined_data['SMA_X'].loc[data.index]
-        filtered_data[date] = data  # Conserver uniquement les jours valides
-        processed_days += 1
-        # Mettre à jour les données précédentes (20 dernières minutes)
-        previous_data = data.tail(SMA_VALUE)
+    # cache des SMA (somme cumulée + colonnes enregistrées sur le disque)
+    cache = cache or IndicatorCache()
+    # on ne garde que les jours qui ont bien 1440 minutes, mis bout à bout
+    complete_days = daily_data.select(daily_data.lengths == 1440)
+    skipped_days = len(daily_data) - len(complete_days)
+    # SMA_X sur la base de donnée entière, NaN en dehors des jours complets
+    sma_x = np.full(len(daily_data.frame), np.nan)
+    if len(complete_days):
+        # Calculer le SMA_X en une seule fois sur tous les jours complets
+        close = np.ascontiguousarray(complete_days.gather('close'), dtype=np.float64)
+        # empreinte des jours complets tirée de celle des données (data_key_for), sinon hash des prix
+        key = derive_key(data_key, "complete_days") if data_key else None
+        sma_x[complete_days.rows()] = cache.sma(close, sma_value, key)
+    daily_data.frame['SMA_X'] = sma_x
+    # on ne garde que les jours où toutes les lignes ont un SMA_X calculé
+    warm = complete_days.complete_mask(['SMA_X'])
+    skipped_days += int((~warm).sum())
+    filtered_data = complete_days.select(warm)
+    processed_days = len(filtered_data)
     print(f"SMA_X calculation completed. Processed days: {processed_days}, ❌ Skipped days: {skipped_days}")
     return filtered_data
 
@@ -132,37 +132,27 @@ def buy_condition(data_row):
     return False
 
 # condition de vente
-def sell_condition(data_row, position):
-    # temps max entre chaque tarsaction / trade 
-    global MAX_WINDOW
-    # current_time est la date actuelle
-    current_time = data_row.name
+def sell_condition(data_row, ledger, trade_id, max_window=None):
+    # temps max entre chaque tarsaction / trade (par défaut celui de main.py)
+    max_window = MAX_WINDOW if max_window is None else max_window
+    # current_time est la date actuelle (en ns)
+    current_time = data_row.name.value
     # Vérifier si le prix atteint ou dépasse le target_price
-    if data_row['close'] >= position['target_price']:
+    if data_row['close'] >= ledger.target_price[trade_id]:
         return True  # Vente réussie à l'objectif de profit
     # Vérifier si la position est ouverte depuis plus de `window_size` minutes
-    if (current_time - position['buy_date']).total_seconds() / 60 > MAX_WINDOW:
+    if (current_time - ledger.buy_date[trade_id].astype(np.int64)) / 10**9 / 60 > max_window:
         return True  # Vente forcée après 60 minutes
     return False  # Pas de vente
 
-# creation de transaction , à chaque fois que on achète on crée cet élément 
-def create_transaction(buy_date, buy_price, quantity, buy_fee, target_price):
-    return {
-        "id": str(uuid.uuid4()), # ID unique pour chaque transaction
-        "buy_date": buy_date,    # Date et heure d'achat
-        "buy_price": buy_price,  # Prix d'achat
-        "quantity": quantity,    # Quantité achetée
-        "target_price": target_price, # prix cible
-        "buy_fee": buy_fee,      # Frais d'achat
-        "sell_fee": None,        # Frais de vente (sera mis à jour lors de la vente)
-        "sell_date": None,       # Date et heure de vente
-        "sell_price": None,      # Prix de vente
-        "profit": None           # Profit calculé après la vente
-    }
+# creation de transaction , à chaque fois que on achète on crée une ligne dans le registre (voir trade_ledger.py)
+def create_transaction(ledger, buy_index, buy_date, buy_price, quantity, buy_fee, target_price):
+    # l'id est le numéro de la ligne, les colonnes de vente seront remplies lors de la vente
+    return ledger.open(buy_index, buy_date, buy_price, quantity, buy_fee, target_price)
 
 # gère la transaction d'achat , donc ce que on avais avant dans la condition d'achat dans trade se retrouve ici 
-def treat_buy_transaction(row, invest_amount, fee_rate, min_profit):
-    global BALANCE
+# (le solde est tenu par l'appelant : la fonction ne touche à aucune variable globale)
+def treat_buy_transaction(ledger, row_index, row, invest_amount, fee_rate, min_profit):
     #print(f"Buy condition met at {row.name}")
     # Calcul des frais d'achat
     buy_fee = invest_amount * fee_rate
@@ -172,183 +162,139 @@ def treat_buy_transaction(row, invest_amount, fee_rate, min_profit):
     quantity = net_investment / row['close']
     # Calcul du prix cible (target_price)
     target_price = row['close'] * (1 + min_profit + 2 * fee_rate)
-    # on met à jour le solde
-    BALANCE -= invest_amount
     # Création d'une nouvelle transaction
-    return create_transaction(row.name, row['close'], quantity, buy_fee, target_price)
+    return create_transaction(ledger, row_index, row.name.value, row['close'], quantity, buy_fee, target_price)
 
-# on traite la transaction de vente
-def treat_sell_transaction(data_row, transaction, fee_rate):
-    global BALANCE
+# on traite la transaction de vente, renvoie le montant net à ajouter au solde
+def treat_sell_transaction(ledger, row_index, data_row, trade_id, fee_rate):
     #print(f"Sell condition met at {data_row.name}")
     # Prix de vente
     sell_price = data_row['close']
+    quantity = ledger.quantity[trade_id]
     # Calcul des frais de vente
-    sell_fee = sell_price * transaction['quantity'] * fee_rate
+    sell_fee = sell_price * quantity * fee_rate
     # Montant net obtenu après la vente
-    net_proceeds = sell_price * transaction['quantity'] - sell_fee
+    net_proceeds = sell_price * quantity - sell_fee
     # Calcul du profit
-    profit = net_proceeds - (transaction['buy_price'] * transaction['quantity'] + transaction['buy_fee'])
+    profit = net_proceeds - (ledger.buy_price[trade_id] * quantity + ledger.buy_fee[trade_id])
     # Mise à jour de la transaction
-    transaction.update({
-        "sell_fee": sell_fee,
-        "sell_date": data_row.name,
-        "sell_price": sell_price,
-        "profit": profit,
-    })
-    # on met à jour le solde
-    BALANCE += net_proceeds
-
-# print de compte rendu
-def print_report(archived_transactions, transactions):
-    # Valeur du portefeuille
-    global BALANCE
-    print(f"/Start de print de compte rendu.\\")
-    # Frais
-    total_buy_fee = archived_transactions['buy_fee'].sum()
-    total_sell_fee = archived_transactions['sell_fee'].sum()
-    total_fees = total_buy_fee + total_sell_fee
-    print(f"Total frais d'achat : {total_buy_fee:.2f}")
-    print(f"Total frais de vente : {total_sell_fee:.2f}")
-    print(f"Total frais : {total_fees:.2f}")
-    # Profits et soldes
-    total_profit = archived_transactions['profit'].sum()
-    print(f"Profit total : {total_profit:.2f}")
-    print(f"Solde final : {BALANCE:.2f}")
-    print(f"Nombre de transactions : {len(archived_transactions)}")
-
-    # Transactions par année
-    if 'sell_date' in archived_transactions:
-        archived_transactions['sell_date'] = pd.to_datetime(archived_transactions['sell_date'])
-        years = archived_transactions['sell_date'].dt.year.unique()
-        avg_transactions_per_year = len(archived_transactions) / len(years)
-        print(f"Transactions par année en moyenne : {avg_transactions_per_year:.2f}")
-    else:
-        print("Pas de dates de vente disponibles pour calculer les transactions par année.")
-
-    # Calcul du temps moyen d'un trade
-    archived_transactions['trade_duration'] = (
-        (pd.to_datetime(archived_transactions['sell_date']) - 
-         pd.to_datetime(archived_transactions['buy_date']))
-        .dt.total_seconds() / 60
-    )
-    avg_trade_duration = archived_transactions['trade_duration'].mean()
-    avg_days = int(avg_trade_duration // (24 * 60))
-    avg_hours = int((avg_trade_duration % (24 * 60)) // 60)
-    avg_minutes = int(avg_trade_duration % 60)
-    print(f"Durée moyenne d'un trade : {avg_days} jours, {avg_hours} heures, {avg_minutes} minutes ({avg_trade_duration:.2f} minutes)")
-
-    # Temps moyen par année
-    print("\nTemps moyen d'un trade par année :")
-    archived_transactions['year'] = archived_transactions['buy_date'].dt.year
-    for year, group in archived_transactions.groupby('year'):
-        avg_duration_year = group['trade_duration'].mean()
-        days = int(avg_duration_year // (24 * 60))
-        hours = int((avg_duration_year % (24 * 60)) // 60)
-        minutes = int(avg_duration_year % 60)
-        print(f"  {year}: {days} jours, {hours} heures, {minutes} minutes ({avg_duration_year:.2f} minutes)")
-
-    # Taux de réussite
-    winning_trades = archived_transactions[archived_transactions['profit'] > 0].copy()
-    losing_trades = archived_transactions[archived_transactions['profit'] <= 0].copy()
-    success_rate = len(winning_trades) / len(archived_transactions) * 100
-    print(f"\nTaux de réussite : {success_rate:.2f}% ({len(winning_trades)} gagnants, {len(losing_trades)} perdants)")
-
-    # Gain moyen par transaction
-    avg_profit_per_trade = archived_transactions['profit'].mean()
-    print(f"Gain moyen par transaction : {avg_profit_per_trade:.2f} EUR")
-
-    # Temps moyen des trades gagnants et perdants
-    winning_trades['trade_duration'] = (
-        (pd.to_datetime(winning_trades['sell_date']) - 
-         pd.to_datetime(winning_trades['buy_date']))
-        .dt.total_seconds() / 60
+    ledger.close(trade_id, row_index, data_row.name.value, sell_price, sell_fee, profit)
+    return net_proceeds
+
+# print de compte rendu : les métriques sont calculées en une passe (voir metrics.py), le texte n'est qu'un rendu
+@instrumented()
+def print_report(archived_transactions, transactions, period=None, balance=None):
+    # Valeur du portefeuille (par défaut BALANCE)
+    balance = BALANCE if balance is None else balance
+    report = compute_metrics(archived_transactions, balance, period=period)
+    print(format_report(report))
+    # rendu JSON pour comparer / agréger les backtests
+    if REPORT_FILE:
+        to_json(report, REPORT_FILE)
+    return report
+
+
+# paramètres de main.py dans un seul objet (voir backtest_engine.py), pour lancer plusieurs backtests
+# dans le même processus sans toucher aux variables globales
+def strategy_config():
+    return StrategyConfig(
+        balance=BALANCE, invest_amount=INVEST_AMOUNT, fee=FEE, max_transaction=MAX_TRANSACTION,
+        target_profit=TARGET_PROFIT, max_window=MAX_WINDOW, sma_value=SMA_VALUE, start_date=START_DATE, end_date=END_DATE,
     )
-    losing_trades['trade_duration'] = (
-        (pd.to_datetime(losing_trades['sell_date']) - 
-         pd.to_datetime(losing_trades['buy_date']))
-        .dt.total_seconds() / 60
-    )
-
-    avg_winning_duration = winning_trades['trade_duration'].mean() if not winning_trades.empty else 0
-    avg_losing_duration = losing_trades['trade_duration'].mean() if not losing_trades.empty else 0
-
-    def format_duration(minutes):
-        days = int(minutes // (24 * 60))
-        hours = int((minutes % (24 * 60)) // 60)
-        mins = int(minutes % 60)
-        return f"{days} jours, {hours} heures, {mins} minutes"
-
-    if not winning_trades.empty:
-        print(f"Temps moyen des trades gagnants : {format_duration(avg_winning_duration)} ({avg_winning_duration:.2f} minutes)")
-    else:
-        print("Pas de trades gagnants.")
-
-    if not losing_trades.empty:
-        print(f"Temps moyen des trades perdants : {format_duration(avg_losing_duration)} ({avg_losing_duration:.2f} minutes)")
-    else:
-        print("Pas de trades perdants.")
-
-    # Nombre de trades gagnants et perdants par année
-    print("\nNombre de trades gagnants et perdants par année :")
-    for year, group in archived_transactions.groupby('year'):
-        wins = len(group[group['profit'] > 0])
-        losses = len(group[group['profit'] <= 0])
-        print(f"  {year}: {wins} gagnants, {losses} perdants")
-
 
 # fonction de trading c'est ici on vas faire le backtest 
-def trade(daily_data):
-    # on utilise les variables globales
-    global BALANCE, INVEST_AMOUNT, FEE, MAX_TRANSACTION, TARGET_PROFIT
+@instrumented()
+def trade(daily_data, config=None):
+    # paramètres du backtest (par défaut ceux de main.py)
+    config = config or strategy_config()
     # print de début de trading
     print("Start of trading...")
+    # solde du backtest : local, aucune variable globale n'est modifiée
+    balance = config.balance
     # investement par trade
-    invest_amount = INVEST_AMOUNT
+    invest_amount = config.invest_amount
     # buy and sell fee of 0.1% 
-    fee_rate = FEE
+    fee_rate = config.fee
     #min profit
-    min_profit = TARGET_PROFIT
-    # on vas stocker chaque transaction dans cette liste
-    transactions = []  # Liste des transactions
-    # transactions archivés 
-    archived_transactions = []  # Liste des transactions archivées
+    min_profit = config.target_profit
+    # registre de toutes les transactions (une ligne par achat)
+    ledger = TradeLedger()
+    # ids des transactions ouvertes
+    open_ids = []
+    # numéro de la bougie courante
+    row_index = -1
     # on parcours les données
     for date, data in daily_data.items():
         # on parcour chaque ligne de la data
         for i, row in data.iterrows():
+            row_index += 1
             # condition d'achat , si elle est vrai + on à assez de cash + on a pas le max de transaction, on achète 
-            if len(transactions) < MAX_TRANSACTION and BALANCE >= INVEST_AMOUNT and buy_condition(row):
-                # on crée une nouvelle transaction
-                new_transaction = treat_buy_transaction(row, invest_amount, fee_rate, min_profit)
-                # si la nouvelle transaction est vrai on l'ajoute à la liste des transactions
-                if new_transaction:
-                    transactions.append(new_transaction)
-            # on passe à travers chaque transaction
-            for transaction in transactions[:]:
+            if len(open_ids) < config.max_transaction and balance >= invest_amount and buy_condition(row):
+                # on crée une nouvelle transaction et on garde son id
+                open_ids.append(treat_buy_transaction(ledger, row_index, row, invest_amount, fee_rate, min_profit))
+                balance -= invest_amount
+            # on passe à travers chaque transaction ouverte
+            sold = False
+            for trade_id in open_ids:
                 # si la condition de vente est vrai 
-                if sell_condition(row, transaction):
-                    # on traite la transaction de vente
-                    treat_sell_transaction(row, transaction, fee_rate)
-                    # on ajoute la transaction à la liste des transactions archivées
-                    archived_transactions.append(transaction)
-                    # on retire la transaction de la liste des transactions
-                    transactions.remove(transaction)
+                if sell_condition(row, ledger, trade_id, config.max_window):
+                    # on traite la transaction de vente (la ligne du registre est mise à jour)
+                    balance += treat_sell_transaction(ledger, row_index, row, trade_id, fee_rate)
+                    sold = True
+            if sold:
+                open_ids = [trade_id for trade_id in open_ids if ledger.is_open[trade_id]]
     # Clôturer les transactions ouvertes restantes
-    if transactions:
-        print(f"Clôture de {len(transactions)} transactions ouvertes restantes au dernier prix disponible.")
+    closed_at_end = len(open_ids)
+    if open_ids:
+        print(f"Clôture de {len(open_ids)} transactions ouvertes restantes au dernier prix disponible.")
         last_date = sorted(daily_data.keys())[-1]
         last_data = daily_data[last_date]
         last_row = last_data.iloc[-1]
-        for transaction in transactions:
-            treat_sell_transaction(last_row, transaction, fee_rate)
-            archived_transactions.append(transaction)
-        transactions.clear()
-
-    # on converti les transactions archivés en DataFrame, ceci sera plus facile à manipuler plus tard 
-    df_archived_transactions = pd.DataFrame(archived_transactions)
-    print_report(df_archived_transactions, transactions)
-    return 
+        for trade_id in open_ids:
+            balance += treat_sell_transaction(ledger, row_index, last_row, trade_id, fee_rate)
+        open_ids = []
+    # compteurs de l'étape en cours (voir instrumentation.py)
+    count("candles", row_index + 1)
+    count("trades_opened", len(ledger))
+    count("trades_closed_at_end", closed_at_end)
+
+    # DataFrame construit sur les colonnes du registre, sans copie
+    df_archived_transactions = ledger.to_dataframe()
+    timestamps = daily_data.gather()
+    period = (int(timestamps[0]), int(timestamps[-1])) if len(timestamps) else None
+    print_report(df_archived_transactions, open_ids, period, balance)
+    return df_archived_transactions
+
+# moteur du backtest vectorisé : même logique que trade() mais sur des tableaux numpy contigus,
+# sans variable globale, pour pouvoir le relancer avec d'autres paramètres (voir sweep.py).
+# La bougie de vente de chaque position est calculée dès l'achat (voir exit_index.py) : on ne visite
+# que les bougies où il se passe quelque chose (un achat possible ou une vente).
+# La boucle est celle de BacktestEngine (voir backtest_engine.py), qui garde son propre solde et ses positions.
+def run_backtest(close, sma_x, timestamps, balance, invest_amount, fee_rate, max_transaction, min_profit, max_window, exit_index=None):
+    config = StrategyConfig(balance, invest_amount, fee_rate, max_transaction, min_profit, max_window, None, None, None)
+    engine = BacktestEngine(config, trading_window(close, sma_x, timestamps, exit_index)).run()
+    return engine.ledger, engine.balance, engine.closed_at_end
+
+# fonction de trading vectorisée : même résultat que trade(), via BacktestEngine
+@instrumented()
+def trade_vectorized(daily_data, config=None):
+    # paramètres du backtest (par défaut ceux de main.py)
+    config = config or strategy_config()
+    print("Start of vectorized trading...")
+    # colonnes des jours gardés mises bout à bout (vues si les jours se suivent)
+    close = daily_data.gather('close')
+    sma_x = daily_data.gather('SMA_X')
+    timestamps = daily_data.gather()
+    engine = BacktestEngine(config, trading_window(close, sma_x, timestamps)).run()
+    # compteurs de l'étape en cours (voir instrumentation.py) : le moteur ne garde que les siens, sans état global
+    count("candles", len(close))
+    count("trades_opened", len(engine.ledger))
+    count("trades_closed_at_end", engine.closed_at_end)
+    if engine.closed_at_end:
+        print(f"Clôture de {engine.closed_at_end} transactions ouvertes restantes au dernier prix disponible.")
+    df_archived_transactions = engine.ledger.to_dataframe()
+    print_report(df_archived_transactions, [], engine.period(), engine.balance)
+    return df_archived_transactions
 
 # valeur du portefeuille
 BALANCE = 100
@@ -370,18 +316,33 @@ START_DATE = "2020-01-01"
 END_DATE = "2024-11-15"
 # nom du fichier de la base de donnée
 FILE_NAME = "1_min_eth_candles_01012017_15112024.csv"
+# moteur de backtest : "vectorized" (tableaux numpy) ou "iterrows" (boucle d'origine)
+ENGINE = "vectorized"
+# fichier JSON du compte rendu (None pour ne rien écrire)
+REPORT_FILE = None
+# fichier JSON des mesures de chaque étape (None pour ne rien écrire, voir instrumentation.py)
+METRICS_FILE = None
 
 def main():
-    # on download la base de donnée 
-    df = downloadDb(FILE_NAME)
-    # verifier la db
-    verify_db_integrity(df, '1min')
-    # devide by name 
-    daily_data = subdivide_db_by_date(df)
-    # calculer la moyenne mobile simple sur 20 périodes
-    daily_data = calculate_sma_x_on_daily_data(daily_data)
-    # on trade
-    trade(daily_data)
+    # chaque étape est mesurée (durée, CPU, lignes, compteurs), voir instrumentation.py
+    with stage("main"):
+        # on download la base de donnée 
+        df = downloadDb(FILE_NAME)
+        # verifier la db
+        verify_db_integrity(df, '1min')
+        # devide by name 
+        daily_data = subdivide_db_by_date(df)
+        # calculer la moyenne mobile simple sur 20 périodes
+        daily_data = calculate_sma_x_on_daily_data(daily_data, data_key=data_key_for(FILE_NAME))
+        # on trade
+        if ENGINE == "vectorized":
+            trade_vectorized(daily_data)
+        else:
+            trade(daily_data)
+    # où est passé le temps
+    print(format_summary())
+    if METRICS_FILE:
+        write_metrics(METRICS_FILE)
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,245 @@
+# métriques d'un backtest en une passe sur les colonnes du registre
+"""
+/*********************************\
+|* Métriques du backtest         *|
+\*********************************/
+
+    * print_report convertissait les dates 4 fois (pd.to_datetime), faisait plusieurs groupby('year'),
+    copiait les trades gagnants / perdants et ne faisait qu'afficher du texte.
+
+    * compute_metrics lit une seule fois les colonnes du registre (voir trade_ledger.py) en tableaux numpy
+    et calcule tout ce qu'affichait print_report, plus :
+        - la courbe d'équité réalisée (solde de départ + profits cumulés, à chaque vente) et le drawdown max
+        - l'exposition : part du temps avec au moins une position ouverte, nombre moyen de positions ouvertes
+        - le détail par année (année d'achat, comme print_report) avec np.bincount au lieu de groupby
+    Le résultat est un dictionnaire de types python (int, float, str), donc directement sérialisable en JSON.
+
+    * format_report est le rendu texte (le compte rendu de print_report), to_json le rendu JSON.
+"""
+
+import json
+
+import numpy as np
+
+# minutes dans un jour
+MINUTES_PER_DAY = 24 * 60
+# nanosecondes dans une minute
+NS_PER_MINUTE = 60 * 10**9
+
+
+def _dates_ns(values):
+    # colonne de dates (datetime64 ou int64 ns) -> int64 ns
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[ns]').view(np.int64)
+    return values.astype(np.int64)
+
+
+def _years(dates_ns):
+    # année calendaire de chaque date (int64 ns)
+    return dates_ns.view('datetime64[ns]').astype('datetime64[Y]').astype(np.int64) + 1970
+
+
+def _mean(total, count):
+    return float(total / count) if count else 0.0
+
+
+def equity_curve(sell_dates, profit, initial_balance):
+    """
+    Courbe d'équité réalisée : solde de départ + profits cumulés, après chaque vente (ordre des ventes).
+    Les positions ouvertes comptent pour leur prix d'achat.
+
+    :return: (dates des ventes en ns, équité après chaque vente)
+    """
+    order = np.argsort(sell_dates, kind='stable')
+    return sell_dates[order], initial_balance + np.cumsum(profit[order])
+
+
+def max_drawdown(equity, initial_balance):
+    """
+    Plus forte baisse de la courbe d'équité depuis son plus haut (le solde de départ compris).
+
+    :return: (baisse max en valeur, baisse max en % du plus haut)
+    """
+    if len(equity) == 0:
+        return 0.0, 0.0
+    curve = np.concatenate([[initial_balance], equity])
+    peak = np.maximum.accumulate(curve)
+    drawdown = peak - curve
+    percent = np.divide(drawdown, peak, out=np.zeros_like(drawdown), where=peak > 0) * 100
+    return float(drawdown.max()), float(percent.max())
+
+
+def time_in_market(buy_dates, sell_dates):
+    """
+    Durée (ns) pendant laquelle au moins une position est ouverte : union des intervalles [achat, vente].
+    """
+    if len(buy_dates) == 0:
+        return 0
+    order = np.argsort(buy_dates, kind='stable')
+    starts = buy_dates[order]
+    ends = sell_dates[order]
+    # fin la plus tardive des intervalles précédents : seule la partie qui dépasse est comptée
+    previous_end = np.concatenate([[starts[0]], np.maximum.accumulate(ends)[:-1]])
+    return int(np.maximum(ends - np.maximum(starts, previous_end), 0).sum())
+
+
+def compute_metrics(trades, final_balance, initial_balance=None, period=None, curve=True):
+    """
+    Calcule toutes les métriques d'un backtest.
+
+    :param trades: Transactions (ledger.to_dataframe() ou dictionnaire de colonnes), les transactions
+        encore ouvertes sont ignorées.
+    :param final_balance: Solde en fin de backtest.
+    :param initial_balance: Solde de départ (par défaut : solde final - profit total).
+    :param period: (début, fin) du backtest en ns pour l'exposition (par défaut : premier achat -> dernière vente).
+    :param curve: False pour ne pas renvoyer la courbe d'équité (sweep : une ligne par combinaison).
+    :return: Dictionnaire des métriques (sérialisable en JSON).
+    """
+    sell_dates = _dates_ns(trades['sell_date'])
+    closed = sell_dates != np.iinfo(np.int64).min
+    sell_dates = sell_dates[closed]
+    buy_dates = _dates_ns(trades['buy_date'])[closed]
+    profit = np.asarray(trades['profit'], dtype=np.float64)[closed]
+    buy_fee = np.asarray(trades['buy_fee'], dtype=np.float64)[closed]
+    sell_fee = np.asarray(trades['sell_fee'], dtype=np.float64)[closed]
+    count = len(profit)
+
+    total_profit = float(profit.sum())
+    if initial_balance is None:
+        initial_balance = final_balance - total_profit
+    duration = (sell_dates - buy_dates) / NS_PER_MINUTE
+    winning = profit > 0
+    wins = int(winning.sum())
+    losses = count - wins
+    metrics = {
+        "initial_balance": float(initial_balance),
+        "final_balance": float(final_balance),
+        "total_buy_fee": float(buy_fee.sum()),
+        "total_sell_fee": float(sell_fee.sum()),
+        "total_fees": float(buy_fee.sum() + sell_fee.sum()),
+        "total_profit": total_profit,
+        "return_percentage": _mean(total_profit * 100, initial_balance),
+        "transactions": count,
+        "transactions_per_year": _mean(count, len(np.unique(_years(sell_dates)))),
+        "avg_trade_duration": _mean(duration.sum(), count),
+        "success_rate": _mean(wins * 100, count),
+        "winning_trades": wins,
+        "losing_trades": losses,
+        "avg_profit_per_trade": _mean(total_profit, count),
+        "avg_winning_duration": _mean(duration[winning].sum(), wins),
+        "avg_losing_duration": _mean(duration[~winning].sum(), losses),
+    }
+
+    # courbe d'équité et drawdown
+    curve_dates, equity = equity_curve(sell_dates, profit, initial_balance)
+    metrics["max_drawdown"], metrics["max_drawdown_percentage"] = max_drawdown(equity, initial_balance)
+
+    # exposition
+    if period is None:
+        period = (int(buy_dates.min()), int(sell_dates.max())) if count else (0, 0)
+    period_ns = period[1] - period[0]
+    metrics["exposure_percentage"] = _mean(time_in_market(buy_dates, sell_dates) * 100, period_ns)
+    metrics["avg_open_positions"] = _mean(float((sell_dates - buy_dates).sum()), period_ns)
+
+    # détail par année d'achat : une seule passe avec bincount
+    years, year_index = np.unique(_years(buy_dates), return_inverse=True)
+    per_year = {
+        "transactions": np.bincount(year_index, minlength=len(years)),
+        "winning_trades": np.bincount(year_index, weights=winning, minlength=len(years)),
+        "profit": np.bincount(year_index, weights=profit, minlength=len(years)),
+        "fees": np.bincount(year_index, weights=buy_fee + sell_fee, minlength=len(years)),
+        "duration": np.bincount(year_index, weights=duration, minlength=len(years)),
+    }
+    metrics["years"] = {
+        str(year): {
+            "transactions": int(per_year["transactions"][i]),
+            "winning_trades": int(per_year["winning_trades"][i]),
+            "losing_trades": int(per_year["transactions"][i] - per_year["winning_trades"][i]),
+            "profit": float(per_year["profit"][i]),
+            "fees": float(per_year["fees"][i]),
+            "avg_trade_duration": _mean(per_year["duration"][i], per_year["transactions"][i]),
+        }
+        for i, year in enumerate(years.tolist())
+    }
+    if curve:
+        metrics["equity_curve"] = {
+            "dates": np.datetime_as_string(curve_dates.view('datetime64[ns]'), unit='s').tolist(),
+            "equity": equity.tolist(),
+        }
+    return metrics
+
+
+def summary(metrics):
+    """
+    Métriques à une seule valeur (sans le détail par année ni la courbe), pour un tableau de résultats.
+    """
+    return {name: value for name, value in metrics.items() if not isinstance(value, dict)}
+
+
+def format_duration(minutes):
+    days = int(minutes // MINUTES_PER_DAY)
+    hours = int((minutes % MINUTES_PER_DAY) // 60)
+    mins = int(minutes % 60)
+    return f"{days} jours, {hours} heures, {mins} minutes"
+
+
+def format_report(metrics):
+    """
+    Rendu texte des métriques (le compte rendu affiché par print_report).
+    """
+    lines = [
+        "/Start de print de compte rendu.\\",
+        f"Total frais d'achat : {metrics['total_buy_fee']:.2f}",
+        f"Total frais de vente : {metrics['total_sell_fee']:.2f}",
+        f"Total frais : {metrics['total_fees']:.2f}",
+        f"Profit total : {metrics['total_profit']:.2f}",
+        f"Solde final : {metrics['final_balance']:.2f}",
+        f"Nombre de transactions : {metrics['transactions']}",
+    ]
+    if metrics["transactions"] == 0:
+        lines.append("Pas de transactions.")
+        return "\n".join(lines)
+    avg_duration = metrics["avg_trade_duration"]
+    lines.append(f"Transactions par année en moyenne : {metrics['transactions_per_year']:.2f}")
+    lines.append(f"Durée moyenne d'un trade : {format_duration(avg_duration)} ({avg_duration:.2f} minutes)")
+
+    lines.append("\nTemps moyen d'un trade par année :")
+    for year, values in metrics["years"].items():
+        duration = values["avg_trade_duration"]
+        lines.append(f"  {year}: {format_duration(duration)} ({duration:.2f} minutes)")
+
+    lines.append(f"\nTaux de réussite : {metrics['success_rate']:.2f}% "
+                 f"({metrics['winning_trades']} gagnants, {metrics['losing_trades']} perdants)")
+    lines.append(f"Gain moyen par transaction : {metrics['avg_profit_per_trade']:.2f} EUR")
+    if metrics["winning_trades"]:
+        duration = metrics["avg_winning_duration"]
+        lines.append(f"Temps moyen des trades gagnants : {format_duration(duration)} ({duration:.2f} minutes)")
+    else:
+        lines.append("Pas de trades gagnants.")
+    if metrics["losing_trades"]:
+        duration = metrics["avg_losing_duration"]
+        lines.append(f"Temps moyen des trades perdants : {format_duration(duration)} ({duration:.2f} minutes)")
+    else:
+        lines.append("Pas de trades perdants.")
+
+    lines.append("\nNombre de trades gagnants et perdants par année :")
+    for year, values in metrics["years"].items():
+        lines.append(f"  {year}: {values['winning_trades']} gagnants, {values['losing_trades']} perdants")
+
+    lines.append(f"\nRendement : {metrics['return_percentage']:.2f}%")
+    lines.append(f"Drawdown max : {metrics['max_drawdown']:.2f} ({metrics['max_drawdown_percentage']:.2f}%)")
+    lines.append(f"Exposition : {metrics['exposure_percentage']:.2f}% du temps, "
+                 f"{metrics['avg_open_positions']:.2f} positions ouvertes en moyenne")
+    return "\n".join(lines)
+
+
+def to_json(metrics, file_name=None):
+    """
+    Rendu JSON des métriques, écrit dans `file_name` si donné.
+    """
+    text = json.dumps(metrics, indent=2)
+    if file_name:
+        with open(file_name, "w") as f:
+            f.write(text)
+    return text
@@ -0,0 +1,294 @@
+# paper trading en direct : flux websocket de bougies 1m, mêmes règles que le backtest
+"""
+/*********************************\
+|* Paper trading (asyncio)       *|
+\*********************************/
+
+    * La stratégie SMA_X n'existait qu'en backtest sur un DataFrame chargé en entier. Ici les bougies 1m
+    clôturées arrivent une par une depuis un flux (feed) et chaque bougie est traitée en O(1) :
+        - SMA_X mise à jour avec RollingSMA (voir rolling_sma.py), sans DataFrame
+        - buy_condition / sell_condition de main.py évaluées sur la bougie (mêmes règles, MAX_WINDOW de la configuration)
+        - positions gardées en mémoire dans un TradeLedger (voir trade_ledger.py), solde propre au trader
+    La SMA est calculée sur les bougies reçues à la suite (pas de filtre des jours incomplets comme en backtest).
+
+    * Un feed est n'importe quel itérateur asynchrone de Kline : websocket_feed lit le flux kline de Binance
+    (ou celui du faux serveur local, voir fake_klines_server.py), d'autres sources peuvent être branchées.
+
+    * Latence tick -> décision : de la réception du message à la fin du traitement de la bougie, p50 / p99
+    calculés sur les LATENCY_SAMPLES dernières bougies.
+
+    Lancement : python paper_trading.py
+    Contre le faux serveur local : python paper_trading.py --local
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+import main as bot
+from download_db import INTERVAL_MS, fetch_ranges, page_ranges, report_failed_ranges
+from rate_limiter import RateLimiter
+from rolling_sma import RollingSMA
+from trade_ledger import TradeLedger
+
+# paire suivie
+SYMBOL = "ETHUSDT"
+# URL des flux websocket (Binance par défaut)
+BINANCE_WS_URL = os.environ.get("BINANCE_WS_URL", "wss://stream.binance.com:9443/ws")
+# nombre de dernières latences gardées pour les percentiles
+LATENCY_SAMPLES = 100_000
+# attente avant de se reconnecter au flux (s)
+RECONNECT_DELAY = 5
+# ping websocket (s)
+HEARTBEAT = 30
+
+# bougie clôturée reçue d'un feed (received : time.perf_counter_ns() à la réception du message)
+Kline = namedtuple("Kline", ["open_time", "open", "high", "low", "close", "volume", "received"])
+
+
+class Bar(dict):
+    # ligne minimale lue par buy_condition / sell_condition : bar['close'], bar['SMA_X'], bar.name (date)
+    __slots__ = ("name",)
+
+
+def stream_url(symbol, interval="1m", base_url=BINANCE_WS_URL):
+    """
+    URL du flux kline d'une paire (ex: wss://stream.binance.com:9443/ws/ethusdt@kline_1m).
+    """
+    return f"{base_url}/{symbol.lower()}@kline_{interval}"
+
+
+def parse_kline_event(message, received):
+    """
+    Convertit un événement websocket "kline" en Kline, ou None si la bougie n'est pas encore clôturée.
+    """
+    k = message.get("k")
+    if k is None or not k["x"]:
+        return None
+    return Kline(k["t"], float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"]), received)
+
+
+async def websocket_feed(url, session=None, reconnect=True):
+    """
+    Feed websocket : itère sur les bougies clôturées du flux, se reconnecte si la connexion tombe.
+
+    :param url: URL du flux (voir stream_url).
+    :param session: ClientSession à utiliser (une nouvelle par défaut).
+    :param reconnect: False pour s'arrêter quand le serveur ferme le flux.
+    """
+    own_session = session is None
+    session = session or aiohttp.ClientSession()
+    try:
+        while True:
+            try:
+                async with session.ws_connect(url, heartbeat=HEARTBEAT) as ws:
+                    async for message in ws:
+                        received = time.perf_counter_ns()
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            kline = parse_kline_event(json.loads(message.data), received)
+                            if kline is not None:
+                                yield kline
+                        elif message.type == aiohttp.WSMsgType.ERROR:
+                            break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"⚠️ Flux interrompu : {e}")
+            if not reconnect:
+                break
+            await asyncio.sleep(RECONNECT_DELAY)
+    finally:
+        if own_session:
+            await session.close()
+
+
+class PaperTrader:
+    """
+    Applique la stratégie SMA_X bougie par bougie, avec un solde et des positions simulés.
+    Les paramètres par défaut sont ceux de main.py.
+
+    :param sma_value: Fenêtre de la SMA_X.
+    :param balance: Solde de départ.
+    :param invest_amount: Montant investi par achat.
+    :param fee_rate: Frais d'achat et de vente.
+    :param max_transaction: Nombre max de positions ouvertes.
+    :param min_profit: Profit recherché.
+    :param verbose: True pour afficher chaque achat / vente.
+    :param config: StrategyConfig (voir backtest_engine.py) dont viennent les paramètres non donnés, et MAX_WINDOW.
+    """
+
+    def __init__(self, sma_value=None, balance=None, invest_amount=None, fee_rate=None, max_transaction=None, min_profit=None, verbose=False, config=None):
+        config = config or bot.strategy_config()
+        self.sma = RollingSMA(sma_value or config.sma_value)
+        self.balance = config.balance if balance is None else balance
+        self.invest_amount = config.invest_amount if invest_amount is None else invest_amount
+        self.fee_rate = config.fee if fee_rate is None else fee_rate
+        self.max_transaction = config.max_transaction if max_transaction is None else max_transaction
+        self.min_profit = config.target_profit if min_profit is None else min_profit
+        self.max_window = config.max_window
+        self.verbose = verbose
+        self.ledger = TradeLedger()
+        self.open_ids = []
+        self.bars = 0
+        self.last_open_time = None
+        # dernières latences (ns) dans un buffer circulaire
+        self.latencies = np.zeros(LATENCY_SAMPLES, dtype=np.int64)
+
+    def warm_up(self, open_times, closes):
+        """
+        Remplit la SMA avec l'historique récent (ex: les SMA_VALUE dernières bougies de l'API REST).
+        """
+        if len(closes):
+            self.sma.update_many(closes)
+            self.last_open_time = int(open_times[-1])
+
+    def on_kline(self, kline):
+        """
+        Traite une bougie clôturée : mise à jour de la SMA_X, achat puis ventes, comme trade().
+
+        :return: Liste des décisions [("buy" | "sell", trade_id)] (vide le plus souvent).
+        """
+        # bougie déjà vue (ex: après une reconnexion)
+        if self.last_open_time is not None and kline.open_time <= self.last_open_time:
+            return []
+        self.last_open_time = kline.open_time
+        ledger = self.ledger
+        bar = Bar(close=kline.close, SMA_X=self.sma.update(kline.close))
+        bar.name = pd.Timestamp(kline.open_time, unit='ms')
+        row_index = self.bars
+        self.bars += 1
+        decisions = []
+        # condition d'achat
+        if len(self.open_ids) < self.max_transaction and self.balance >= self.invest_amount and bot.buy_condition(bar):
+            buy_fee = self.invest_amount * self.fee_rate
+            quantity = (self.invest_amount - buy_fee) / kline.close
+            target_price = kline.close * (1 + self.min_profit + 2 * self.fee_rate)
+            self.balance -= self.invest_amount
+            trade_id = ledger.open(row_index, bar.name.value, kline.close, quantity, buy_fee, target_price)
+            self.open_ids.append(trade_id)
+            decisions.append(("buy", trade_id))
+        # condition de vente
+        sold = False
+        for trade_id in self.open_ids:
+            if bot.sell_condition(bar, ledger, trade_id, self.max_window):
+                quantity = ledger.quantity[trade_id]
+                sell_fee = kline.close * quantity * self.fee_rate
+                net_proceeds = kline.close * quantity - sell_fee
+                profit = net_proceeds - (ledger.buy_price[trade_id] * quantity + ledger.buy_fee[trade_id])
+                self.balance += net_proceeds
+                ledger.close(trade_id, row_index, bar.name.value, kline.close, sell_fee, profit)
+                decisions.append(("sell", trade_id))
+                sold = True
+        if sold:
+            self.open_ids = [trade_id for trade_id in self.open_ids if ledger.is_open[trade_id]]
+        self.latencies[row_index % LATENCY_SAMPLES] = time.perf_counter_ns() - kline.received
+        if self.verbose:
+            for action, trade_id in decisions:
+                print(f"{'🟢 Achat' if action == 'buy' else '🔴 Vente'} #{trade_id} à {kline.close:.2f} ({bar.name}), solde {self.balance:.2f}")
+        return decisions
+
+    def latency_us(self):
+        """
+        Latence tick -> décision en microsecondes : {p50, p99, max} sur les dernières bougies.
+        """
+        samples = self.latencies[:min(self.bars, LATENCY_SAMPLES)]
+        if len(samples) == 0:
+            return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+        p50, p99 = np.percentile(samples, [50, 99]) / 1000
+        return {"p50": float(p50), "p99": float(p99), "max": float(samples.max() / 1000)}
+
+    def stats(self):
+        """
+        État courant : bougies traitées, solde, positions, latences.
+        """
+        return {
+            "bars": self.bars,
+            "balance": float(self.balance),
+            "open_positions": len(self.open_ids),
+            "trades": len(self.ledger),
+            "sma_x": self.sma.value,
+            "latency_us": self.latency_us(),
+        }
+
+
+async def fetch_warmup(symbol, window, api_url=None):
+    """
+    Récupère par l'API REST les `window` dernières bougies 1m clôturées, pour chauffer la SMA_X.
+
+    :return: (open times en ms, prix de clôture)
+    """
+    end_ts = int(time.time() * 1000)
+    start_ts = end_ts - (window + 1) * INTERVAL_MS["1m"]
+    async with aiohttp.ClientSession() as session:
+        pages, failed = await fetch_ranges(session, symbol, page_ranges(start_ts, end_ts), RateLimiter(), api_url)
+    report_failed_ranges(failed)
+    candles = [candle for index in sorted(pages) for candle in pages[index] if candle[6] < end_ts][-window:]
+    return np.array([candle[0] for candle in candles], dtype=np.int64), np.array([float(candle[4]) for candle in candles])
+
+
+async def run_paper_trading(feed, trader, max_bars=None, report_every=60):
+    """
+    Consomme un feed avec un PaperTrader.
+
+    :param feed: Itérateur asynchrone de Kline.
+    :param max_bars: Nombre de bougies après lequel s'arrêter (None : jusqu'à la fin du feed).
+    :param report_every: Affiche l'état toutes les `report_every` bougies (None pour ne rien afficher).
+    :return: Le trader.
+    """
+    async for kline in feed:
+        trader.on_kline(kline)
+        if report_every and trader.bars % report_every == 0:
+            stats = trader.stats()
+            print(f"📈 {trader.bars} bougies, solde {stats['balance']:.2f}, {stats['open_positions']} positions, "
+                  f"latence p50 {stats['latency_us']['p50']:.1f}µs p99 {stats['latency_us']['p99']:.1f}µs")
+        if max_bars and trader.bars >= max_bars:
+            break
+    return trader
+
+
+async def run_local(bars=50_000, port=8096):
+    """
+    Paper trading contre le faux serveur local (flux websocket sans pause) : vérifie la chaîne complète
+    et mesure la latence tick -> décision.
+    """
+    import fake_klines_server
+
+    app = fake_klines_server.create_app(stream_interval=0)
+    runner, api_url = await fake_klines_server.start_server(app, port=port)
+    try:
+        trader = PaperTrader(verbose=False)
+        start_ts = fake_klines_server.FIRST_CANDLE_TS
+        url = f"{stream_url(SYMBOL, base_url=f'ws://{fake_klines_server.HOST}:{port}/ws')}?startTime={start_ts}&count={bars}"
+        started = time.perf_counter()
+        await run_paper_trading(websocket_feed(url, reconnect=False), trader, report_every=10_000)
+        elapsed = time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+    stats = trader.stats()
+    print(f"✅ {stats['bars']} bougies en {elapsed:.1f}s, {stats['trades']} achats, solde {stats['balance']:.2f}, "
+          f"latence p50 {stats['latency_us']['p50']:.1f}µs p99 {stats['latency_us']['p99']:.1f}µs")
+    return trader
+
+
+async def run_live(symbol=SYMBOL):
+    trader = PaperTrader(verbose=True)
+    open_times, closes = await fetch_warmup(symbol, trader.sma.window)
+    trader.warm_up(open_times, closes)
+    print(f"🔥 SMA_X chauffée avec {len(closes)} bougies, SMA_X = {trader.sma.value:.2f}")
+    await run_paper_trading(websocket_feed(stream_url(symbol)), trader)
+
+
+def main():
+    if "--local" in sys.argv:
+        asyncio.run(run_local())
+        return
+    asyncio.run(run_live())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# limiteur de débit adaptatif pour l'API klines de Binance
+"""
+/*********************************\
+|* Limiteur de débit (poids API) *|
+\*********************************/
+
+    * Binance compte un "poids" par requête (2 pour /api/v3/klines) avec une limite par minute (6000),
+    et renvoie le poids déjà utilisé dans l'en-tête X-MBX-USED-WEIGHT-1M. Au-delà : 429 (puis 418 = ban)
+    avec un en-tête Retry-After.
+
+    * RateLimiter remplace le asyncio.Semaphore(10) fixe :
+        - un seau à jetons (token bucket) sur la fenêtre de poids, recalé sur l'en-tête du serveur ;
+        - une pause globale respectant Retry-After dès qu'un 429/418 arrive ;
+        - un nombre de requêtes en vol ajusté en continu (AIMD) : +1 par "tour" de réponses quand il reste
+          de la marge, divisé par 2 à chaque 429, pour rester juste sous la limite.
+
+    Benchmark contre le faux serveur local : python rate_limiter.py
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+# limite de poids de l'API (REQUEST_WEIGHT) par fenêtre
+WEIGHT_LIMIT = 6000
+# durée de la fenêtre de poids (s)
+WINDOW_SECONDS = 60
+# poids d'une requête klines
+KLINE_WEIGHT = 2
+# en-tête renvoyé par Binance avec le poids déjà utilisé dans la fenêtre
+USED_WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+# nombre de fois qu'un segment en échec est remis dans la file avant d'abandonner
+MAX_REQUEUES = 3
+
+
+class FetchError(Exception):
+    """
+    Un segment n'a pas pu être téléchargé après toutes les tentatives.
+    """
+
+    def __init__(self, start_ts, end_ts, reason):
+        super().__init__(f"{start_ts} -> {end_ts} : {reason}")
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.reason = reason
+
+
+class RateLimiter:
+    """
+    Limiteur de débit qui suit le poids utilisé côté serveur.
+
+    :param weight_limit: Poids max par fenêtre (limite du serveur).
+    :param window_seconds: Durée de la fenêtre de poids.
+    :param safety: Part de la limite qu'on s'autorise (0.9 = on vise 90%).
+    :param initial_concurrency: Nombre de requêtes en vol au départ.
+    :param max_concurrency: Nombre max de requêtes en vol.
+    :param min_concurrency: Nombre min de requêtes en vol.
+    """
+
+    def __init__(self, weight_limit=WEIGHT_LIMIT, window_seconds=WINDOW_SECONDS, safety=0.9,
+                 initial_concurrency=10, max_concurrency=64, min_concurrency=1):
+        self.weight_limit = weight_limit
+        self.capacity = weight_limit * safety
+        self.rate = self.capacity / window_seconds  # jetons rechargés par seconde
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.concurrency = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._condition = None
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "peak_concurrency": initial_concurrency}
+
+    def _get_condition(self):
+        # créée à la demande, dans la boucle asyncio qui l'utilise
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, weight=KLINE_WEIGHT):
+        """
+        Attend une place parmi les requêtes en vol, la fin d'une éventuelle pause, puis assez de jetons.
+        """
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.concurrency))
+            self.in_flight += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    break
+                await asyncio.sleep((weight - self.tokens) / self.rate)
+        except BaseException:
+            await self.release()
+            raise
+        self.stats["requests"] += 1
+
+    async def release(self):
+        """
+        Libère une place de requête en vol.
+        """
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self, weight=KLINE_WEIGHT):
+        """
+        async with limiter.slot(): ... -> une requête de poids `weight`.
+        """
+        await self.acquire(weight)
+        try:
+            yield self
+        finally:
+            await self.release()
+
+    def update(self, headers):
+        """
+        Recale le seau à jetons sur le poids utilisé annoncé par le serveur.
+        """
+        used = headers.get(USED_WEIGHT_HEADER)
+        if used is None:
+            return
+        used = int(used)
+        self._refill()
+        # le serveur fait foi : on ne peut pas avoir plus de jetons que ce qu'il reste chez lui
+        self.tokens = min(self.tokens, max(0.0, self.capacity - used))
+        # proche de la vraie limite : on retire une requête en vol
+        if used > 0.95 * self.weight_limit:
+            self._set_concurrency(self.concurrency - 1)
+
+    def on_success(self):
+        """
+        Réponse OK : s'il reste de la marge, on augmente doucement le nombre de requêtes en vol
+        (+1 après environ `concurrency` réponses).
+        """
+        self._refill()
+        if self.tokens > 0.5 * self.capacity:
+            self._set_concurrency(self.concurrency + 1 / self.concurrency)
+
+    def on_throttled(self, retry_after=None):
+        """
+        429/418 : pause globale jusqu'à la fin du Retry-After et nombre de requêtes en vol divisé par 2.
+        """
+        self.stats["throttled"] += 1
+        delay = float(retry_after) if retry_after else 1.0
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self._set_concurrency(self.concurrency / 2)
+
+    def on_error(self):
+        """
+        Erreur réseau ou 5xx : on compte et on réduit un peu la pression.
+        """
+        self.stats["errors"] += 1
+        self._set_concurrency(self.concurrency - 1)
+
+    def _set_concurrency(self, value):
+        self.concurrency = max(float(self.min_concurrency), min(float(self.max_concurrency), value))
+        self.stats["peak_concurrency"] = max(self.stats["peak_concurrency"], int(self.concurrency))
+
+
+async def benchmark(days=180, weight_limit=60, window_seconds=1, latency=0.05, port=8093):
+    """
+    Mesure le débit soutenu (bougies/s) contre le faux serveur local qui applique une limite de poids.
+    """
+    import aiohttp
+    import fake_klines_server
+    from download_db import fetch_ranges, page_ranges
+
+    app = fake_klines_server.create_app(weight_limit=weight_limit, window_seconds=window_seconds, latency=latency)
+    runner, url = await fake_klines_server.start_server(app, port=port)
+    try:
+        start_ts = 1672531200000  # 1er janvier 2023
+        ranges = page_ranges(start_ts, start_ts + days * 1440 * 60 * 1000)
+        limiter = RateLimiter(weight_limit=weight_limit, window_seconds=window_seconds)
+        started = time.perf_counter()
+        async with aiohttp.ClientSession() as session:
+            pages, failed = await fetch_ranges(session, "ETHUSDT", ranges, limiter, url)
+        elapsed = time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+    candles = sum(len(page) for page in pages.values())
+    # limite théorique : (poids max / poids d'une requête) requêtes par fenêtre
+    ceiling = weight_limit / KLINE_WEIGHT / window_seconds * 1000
+    print(f"📊 {candles} bougies en {elapsed:.2f}s -> {candles / elapsed:.0f} bougies/s "
+          f"(plafond du serveur : {ceiling:.0f} bougies/s)")
+    print(f"   requêtes : {limiter.stats['requests']}, 429/418 : {app[fake_klines_server.STATE]['throttled']}, "
+          f"segments en échec : {len(failed)}, requêtes en vol max : {limiter.stats['peak_concurrency']}")
+    return candles / elapsed
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
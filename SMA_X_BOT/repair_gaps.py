@@ -0,0 +1,174 @@
+# réparation ciblée des trous d'une base de bougies
+"""
+/*********************************\
+|* Réparation des trous (gaps)   *|
+\*********************************/
+
+    * verify_db_integrity (main.py) et validate_data_integrity (GO_BOT/DB_S, liste "gaps" du rapport) trouvent les minutes manquantes,
+    ici on les regroupe en trous contigus, puis on les couvre avec le plus petit nombre possible
+    de requêtes klines de 1000 bougies (une requête peut couvrir plusieurs petits trous proches).
+
+    * Seules ces requêtes sont envoyées (via fetch_ranges de download_db.py), les bougies récupérées
+    sont insérées à leur place dans le CSV (et dans le store binaire s'il existe).
+
+    * Les trous pour lesquels l'exchange n'a vraiment aucune donnée sont listés à la fin, séparément de ceux
+    dont la requête a été abandonnée (réseau, 429...) : ces derniers sont à retenter, relancer le script suffit.
+
+    Lancement : python repair_gaps.py [fichier.csv]
+"""
+
+import asyncio
+import os
+import sys
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+from candle_store import merge_candles, store_exists, store_path_for
+from download_db import MAX_LIMIT, candles_to_dataframe, fetch_ranges, report_failed_ranges
+from indicator_columns import invalidate
+from indicator_engine import add_indicators
+from instrumentation import format_summary, stage
+from rate_limiter import RateLimiter
+
+# une minute en ms
+MINUTE_MS = 60 * 1000
+# colonnes d'indicateurs des anciens fichiers de GO_BOT (download_data.py), recalculées après réparation
+EMA_COLUMNS = {'EMA1': 13, 'EMA2': 38}
+
+
+def to_ms(timestamps):
+    """
+    Convertit des dates en timestamps int64 en millisecondes.
+    """
+    return pd.DatetimeIndex(timestamps).as_unit('ns').asi8 // 10**6
+
+
+def find_missing_timestamps(df, freq='1min'):
+    """
+    Minutes manquantes entre la première et la dernière bougie (même calcul que verify_db_integrity).
+    """
+    complete_index = pd.date_range(start=df.index.min(), end=df.index.max(), freq=freq)
+    return complete_index.difference(df.index)
+
+
+def missing_to_gaps(missing_timestamps):
+    """
+    Regroupe les minutes manquantes en trous contigus.
+
+    :return: Liste de (début, fin) en ms, bornes incluses.
+    """
+    missing_ms = np.sort(to_ms(missing_timestamps))
+    if len(missing_ms) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(missing_ms) != MINUTE_MS)
+    starts = missing_ms[np.concatenate([[0], breaks + 1])]
+    ends = missing_ms[np.concatenate([breaks, [len(missing_ms) - 1]])]
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def gaps_to_requests(missing_timestamps, limit=MAX_LIMIT):
+    """
+    Couvre les minutes manquantes avec le plus petit nombre de requêtes de `limit` bougies :
+    chaque requête commence à la première minute pas encore couverte (glouton, optimal ici).
+
+    :return: Liste de (startTime, endTime) en ms, bornes incluses.
+    """
+    missing_ms = np.sort(to_ms(missing_timestamps))
+    requests = []
+    i = 0
+    while i < len(missing_ms):
+        start = int(missing_ms[i])
+        j = int(np.searchsorted(missing_ms, start + (limit - 1) * MINUTE_MS, side='right'))
+        requests.append((start, int(missing_ms[j - 1])))
+        i = j
+    return requests
+
+
+async def fetch_requests(symbol, requests, api_url=None, limiter=None):
+    """
+    Envoie les requêtes de réparation avec le fetch_candles existant (via la file de fetch_ranges).
+
+    :return: (liste des bougies brutes récupérées, liste des FetchError des requêtes abandonnées)
+    """
+    limiter = limiter or RateLimiter()
+    async with aiohttp.ClientSession() as session:
+        pages, failed = await fetch_ranges(session, symbol, requests, limiter, api_url)
+    return [candle for index in sorted(pages) for candle in pages[index]], failed
+
+
+def merge_into_csv(filename, new_candles):
+    """
+    Insère les bougies récupérées dans le CSV, dans l'ordre des timestamps, puis remplace le fichier
+    de façon atomique. Les colonnes EMA d'un ancien fichier GO_BOT sont recalculées, les colonnes
+    d'indicateurs enregistrées à côté du fichier (indicator_columns.py) sont supprimées.
+    """
+    df = pd.read_csv(filename, parse_dates=['timestamp'], index_col='timestamp')
+    merged = pd.concat([df, new_candles])
+    merged = merged[~merged.index.duplicated(keep='first')].sort_index()
+    add_indicators(merged, {name: ("ema", {"window": window}) for name, window in EMA_COLUMNS.items() if name in merged})
+    tmp_path = filename + ".tmp"
+    merged.to_csv(tmp_path)
+    os.replace(tmp_path, filename)
+    invalidate(filename)
+
+
+def repair_gaps(filename, symbol="ETHUSDT", api_url=None):
+    """
+    Répare les trous d'un fichier de bougies 1m en ne téléchargeant que les minutes manquantes.
+
+    :param filename: CSV produit par download_db.py ou download_data.py.
+    :param symbol: Paire de la base de donnée.
+    :param api_url: URL de l'API klines (BINANCE_API_URL par défaut).
+    :return: (trous (début, fin) en ms pour lesquels l'exchange n'a pas de données,
+              trous (début, fin) en ms des requêtes abandonnées, à retenter)
+    """
+    print(f"🔍 Recherche des trous dans {filename}...")
+    df = pd.read_csv(filename, parse_dates=['timestamp'], index_col='timestamp', usecols=['timestamp', 'close'])
+    missing = find_missing_timestamps(df)
+    del df
+    if missing.empty:
+        print("✅ Aucun timestamp manquant, rien à réparer.")
+        return [], []
+    gaps = missing_to_gaps(missing)
+    requests = gaps_to_requests(missing)
+    print(f"❌ {len(missing)} minutes manquantes en {len(gaps)} trous -> {len(requests)} requêtes.")
+
+    data, failed_requests = asyncio.run(fetch_requests(symbol, requests, api_url))
+    new_candles = candles_to_dataframe(data).apply(pd.to_numeric)
+    # on ne garde que les minutes qui manquaient vraiment
+    new_candles = new_candles[new_candles.index.isin(missing)]
+    if not new_candles.empty:
+        merge_into_csv(filename, new_candles)
+        store_path = store_path_for(filename)
+        if store_exists(store_path):
+            merge_candles(store_path, new_candles)
+    print(f"✅ {len(new_candles)} bougies récupérées et insérées dans {filename}.")
+
+    # minutes des requêtes abandonnées : on ne sait pas si l'exchange a des données, elles restent à retenter
+    remaining = missing.difference(new_candles.index)
+    remaining_ms = to_ms(remaining)
+    not_fetched = np.zeros(len(remaining), dtype=bool)
+    for error in failed_requests:
+        not_fetched |= (remaining_ms >= error.start_ts) & (remaining_ms <= error.end_ts)
+    failed = missing_to_gaps(remaining[not_fetched])
+    unavailable = missing_to_gaps(remaining[~not_fetched])
+    report_failed_ranges(failed_requests)
+    if unavailable:
+        print(f"⚠️ {len(unavailable)} trous sans données chez l'exchange :")
+        for start, end in unavailable:
+            minutes = (end - start) // MINUTE_MS + 1
+            print(f"  - {pd.Timestamp(start, unit='ms')} -> {pd.Timestamp(end, unit='ms')} ({minutes} minutes)")
+    return unavailable, failed
+
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else "1_min_eth_candles_01012017_15112024.csv"
+    with stage("repair_gaps"):
+        repair_gaps(filename)
+    print(format_summary())
+
+
+if __name__ == "__main__":
+    main()
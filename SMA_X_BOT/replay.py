@@ -0,0 +1,250 @@
+# rejeu accéléré des bougies enregistrées, pour mesurer le débit de la stratégie
+"""
+/*********************************\
+|* Rejeu historique (feed)       *|
+\*********************************/
+
+    * replay_feed lit les bougies d'un store (voir candle_store.py) ou d'un CSV et les renvoie comme un flux
+    (itérateur asynchrone de Kline, le même format que websocket_feed dans paper_trading.py) :
+        - speed=None : aussi vite que possible
+        - speed=60 : une minute de marché par seconde, speed=1 : temps réel...
+    Un producteur remplit une file asyncio bornée (queue_size), le consommateur la vide.
+
+    * Compteurs (dictionnaire stats) : bougies produites / consommées, débit (bougies/s), profondeur de la file
+    (max et moyenne), événements de contre-pression (le producteur trouve la file pleine et doit attendre
+    le consommateur) et retard max d'une bougie sur son horaire prévu (lag). Un consommateur tient le rythme
+    tant que le lag reste proche de 0 : on trouve son débit max en augmentant speed.
+
+    * start_replay_server sert le même rejeu sur un websocket local au format du flux kline de Binance,
+    pour tester la chaîne complète (websocket_feed + PaperTrader).
+
+    Lancement : python replay.py <fichier.csv ou .store> [--speed 6000] [--socket]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from candle_store import COLUMNS, find_range, open_columns, store_exists, store_path_for
+from fake_klines_server import kline_event
+from paper_trading import Kline, PaperTrader, run_paper_trading, stream_url, websocket_feed
+
+# taille de la file entre le producteur et le consommateur
+QUEUE_SIZE = 1024
+# bougies lues à la fois dans le store
+CHUNK_ROWS = 65536
+# durée d'une bougie 1m en ms
+MINUTE_MS = 60 * 1000
+HOST = "127.0.0.1"
+PORT = 8097
+
+
+def new_stats():
+    """
+    Compteurs d'un rejeu.
+    """
+    return {
+        "produced": 0,
+        "consumed": 0,
+        "backpressure_events": 0,
+        "max_queue_depth": 0,
+        "queue_depth_sum": 0,
+        "max_lag_ms": 0.0,
+        "started": None,
+        "seconds": 0.0,
+    }
+
+
+def summarize(stats):
+    """
+    Compteurs + valeurs dérivées (débit, profondeur moyenne de la file).
+    """
+    seconds = stats["seconds"] or (time.perf_counter() - stats["started"] if stats["started"] else 0.0)
+    consumed = stats["consumed"]
+    return dict(
+        {name: value for name, value in stats.items() if name not in ("started", "queue_depth_sum")},
+        seconds=seconds,
+        candles_per_sec=consumed / seconds if seconds else 0.0,
+        avg_queue_depth=stats["queue_depth_sum"] / consumed if consumed else 0.0,
+    )
+
+
+def iter_chunks(source, start=None, end=None, chunk_rows=CHUNK_ROWS):
+    """
+    Lit les bougies par blocs : (open times en ms, {colonne: tableau}).
+
+    :param source: Store (.store) ou CSV ; si le CSV a un store à côté, c'est le store qui est lu.
+    """
+    store_path = source if source.endswith(".store") else store_path_for(source)
+    if store_exists(store_path):
+        timestamps, arrays = open_columns(store_path, COLUMNS)
+        i, j = find_range(timestamps, start, end)
+        for k in range(i, j, chunk_rows):
+            stop = min(k + chunk_rows, j)
+            yield np.asarray(timestamps[k:stop]) * MINUTE_MS, {name: np.asarray(arrays[name][k:stop], dtype=np.float64) for name in COLUMNS}
+        return
+    for chunk in pd.read_csv(source, usecols=['timestamp'] + COLUMNS, parse_dates=['timestamp'], chunksize=chunk_rows):
+        if start is not None:
+            chunk = chunk[chunk['timestamp'] >= pd.Timestamp(start)]
+        if end is not None:
+            chunk = chunk[chunk['timestamp'] <= pd.Timestamp(end)]
+        open_times = pd.DatetimeIndex(chunk['timestamp']).as_unit('ms').asi8
+        yield open_times, {name: chunk[name].to_numpy(dtype=np.float64) for name in COLUMNS}
+
+
+async def _produce(queue, source, start, end, speed, stats):
+    # remplit la file en respectant l'horaire de chaque bougie (speed) ; None marque la fin
+    clock_start = time.perf_counter_ns()
+    first_open_time = None
+    for open_times, columns in iter_chunks(source, start, end):
+        rows = zip(open_times.tolist(), columns["open"].tolist(), columns["high"].tolist(), columns["low"].tolist(),
+                   columns["close"].tolist(), columns["volume"].tolist())
+        for open_time, open_, high, low, close, volume in rows:
+            if speed:
+                if first_open_time is None:
+                    first_open_time = open_time
+                # horaire prévu de la bougie (ns depuis le début du rejeu)
+                due = clock_start + int((open_time - first_open_time) * 10**6 / speed)
+                delay = due - time.perf_counter_ns()
+                if delay > 0:
+                    await asyncio.sleep(delay / 10**9)
+            else:
+                due = time.perf_counter_ns()
+            if queue.full():
+                stats["backpressure_events"] += 1
+            await queue.put(Kline(open_time, open_, high, low, close, volume, due))
+            stats["produced"] += 1
+    await queue.put(None)
+
+
+async def replay_feed(source, start=None, end=None, speed=None, queue_size=QUEUE_SIZE, stats=None):
+    """
+    Rejoue les bougies enregistrées comme un flux.
+
+    :param source: Store ou CSV de bougies 1m.
+    :param start: Date de début incluse (ou None).
+    :param end: Date de fin incluse (ou None).
+    :param speed: Accélération (minutes de marché par minute réelle), None pour aller aussi vite que possible.
+    :param queue_size: Taille de la file entre le producteur et le consommateur.
+    :param stats: Dictionnaire de compteurs à remplir (voir new_stats).
+    :return: Itérateur asynchrone de Kline (received = heure de remise au consommateur).
+    """
+    stats = new_stats() if stats is None else stats
+    queue = asyncio.Queue(queue_size)
+    stats["started"] = time.perf_counter()
+    producer = asyncio.create_task(_produce(queue, source, start, end, speed, stats))
+    try:
+        while True:
+            depth = queue.qsize()
+            kline = await queue.get()
+            if kline is None:
+                break
+            now = time.perf_counter_ns()
+            stats["consumed"] += 1
+            stats["queue_depth_sum"] += depth
+            if depth > stats["max_queue_depth"]:
+                stats["max_queue_depth"] = depth
+            if speed:
+                lag = (now - kline.received) / 10**6
+                if lag > stats["max_lag_ms"]:
+                    stats["max_lag_ms"] = lag
+            yield kline._replace(received=now)
+        await producer
+    finally:
+        producer.cancel()
+        stats["seconds"] = time.perf_counter() - stats["started"]
+
+
+async def replay_stream(request):
+    """
+    Handler websocket : rejoue les bougies au format du flux kline de Binance (bougies clôturées).
+    """
+    app = request.app
+    symbol, _, interval = request.match_info["stream"].partition("@kline_")
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    stats = new_stats()
+    app["streams"].append(stats)
+    async for kline in replay_feed(app["source"], app["start"], app["end"], app["speed"], stats=stats):
+        rest_kline = [kline.open_time, repr(kline.open), repr(kline.high), repr(kline.low), repr(kline.close),
+                      repr(kline.volume), kline.open_time + MINUTE_MS - 1]
+        await ws.send_str(json.dumps(kline_event(symbol.upper(), interval, rest_kline, True)))
+    await ws.close()
+    return ws
+
+
+async def start_replay_server(source, start=None, end=None, speed=None, host=HOST, port=PORT):
+    """
+    Démarre un serveur websocket local qui rejoue les bougies (une connexion = un rejeu complet).
+
+    :return: (runner à arrêter avec await runner.cleanup(), URL de base des flux, application (app["streams"] : compteurs))
+    """
+    app = web.Application()
+    app.update(source=source, start=start, end=end, speed=speed, streams=[])
+    app.router.add_get("/ws/{stream}", replay_stream)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, f"ws://{host}:{port}/ws", app
+
+
+async def drain(feed):
+    # consommateur vide : mesure le coût du feed seul
+    count = 0
+    async for _ in feed:
+        count += 1
+    return count
+
+
+def print_stats(label, stats, trader=None):
+    summary = summarize(stats)
+    line = (f"📊 {label} : {summary['consumed']} bougies en {summary['seconds']:.2f}s -> {summary['candles_per_sec']:.0f} bougies/s, "
+            f"file max {summary['max_queue_depth']} (moy. {summary['avg_queue_depth']:.0f}), "
+            f"contre-pression {summary['backpressure_events']}, lag max {summary['max_lag_ms']:.1f}ms")
+    if trader is not None:
+        latency = trader.latency_us()
+        line += f", latence p50 {latency['p50']:.1f}µs p99 {latency['p99']:.1f}µs"
+    print(line)
+    return summary
+
+
+async def benchmark(source, speed=None, socket=False, start=None, end=None):
+    """
+    Débit du feed seul, puis de la stratégie (PaperTrader) alimentée par le feed.
+    """
+    stats = new_stats()
+    await drain(replay_feed(source, start, end, speed, stats=stats))
+    results = {"feed": print_stats("feed seul", stats)}
+    stats = new_stats()
+    trader = PaperTrader()
+    await run_paper_trading(replay_feed(source, start, end, speed, stats=stats), trader, report_every=None)
+    results["strategy"] = print_stats("feed + stratégie", stats, trader)
+    if socket:
+        runner, base_url, app = await start_replay_server(source, start, end, speed)
+        try:
+            trader = PaperTrader()
+            await run_paper_trading(websocket_feed(stream_url("ETHUSDT", base_url=base_url), reconnect=False), trader, report_every=None)
+        finally:
+            await runner.cleanup()
+        results["socket"] = print_stats("websocket + stratégie", app["streams"][0], trader)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rejeu accéléré des bougies enregistrées (débit de la stratégie).")
+    parser.add_argument("source", nargs="?", default="1_min_eth_candles_01012017_15112024.csv", help="fichier .csv ou .store")
+    parser.add_argument("--speed", type=float, default=None, help="accélération (60 = une minute de marché par seconde ; aussi vite que possible par défaut)")
+    parser.add_argument("--socket", action="store_true", help="rejoue aussi le flux à travers un websocket local")
+    args = parser.parse_args()
+    if not os.path.exists(args.source) and not store_exists(store_path_for(args.source)):
+        raise FileNotFoundError(args.source)
+    asyncio.run(benchmark(args.source, args.speed, args.socket))
+
+if __name__ == "__main__":
+    main()
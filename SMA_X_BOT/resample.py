@@ -0,0 +1,194 @@
+# bougies 5m / 15m / 1h / 4h / 1d construites à partir du store 1m
+"""
+/*********************************\
+|* Cache multi-intervalles       *|
+\*********************************/
+
+    * Avoir un autre intervalle (ex: le historical_data_eth_1H.csv lu par GO_BOT/data_loader) voulait dire
+    un nouveau téléchargement complet depuis l'API. Ici les bougies plus longues sont calculées à partir du
+    store 1m (voir candle_store.py) : open = première, high = max, low = min, close = dernière, volume = somme.
+
+    * Une seule passe sur le store 1m, lu par blocs (mmap) coupés sur une frontière de jour, calcule tous
+    les intervalles d'un coup (np.maximum.reduceat...). Chaque intervalle est enregistré à côté de la
+    source : <nom>.store -> <nom>_5m.store, <nom>_1h.store... (même format, meta.json dit de quelle source
+    et jusqu'à quelle bougie 1m il a été construit).
+
+    * Mise à jour incrémentale : si des bougies 1m ont seulement été ajoutées à la fin, on recalcule à partir
+    du début du dernier jour déjà construit (la dernière bougie était peut-être incomplète). Si le store 1m
+    a changé au milieu (trous réparés), l'intervalle est reconstruit entièrement.
+
+    Lancement : python resample.py 1_min_eth_candles_01012017_15112024.csv [5m,1h] [--csv]
+    (--csv écrit aussi <nom>_<intervalle>.csv au format lu par GO_BOT)
+"""
+
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from candle_store import (COLUMNS, convert_csv_to_store, from_epoch_minutes, load_candles, open_columns,
+                          read_meta, store_exists, store_path_for, write_store)
+
+# intervalles construits par défaut (en minutes)
+TIMEFRAMES = {"5m": 5, "15m": 15, "1h": 60, "4h": 240, "1d": 1440}
+# nombre de bougies 1m lues à la fois
+CHUNK_ROWS = 2_000_000
+
+
+def timeframe_store_path(store_path, timeframe):
+    """
+    Chemin du store d'un intervalle, à côté du store 1m : <nom>.store -> <nom>_<intervalle>.store.
+    """
+    base, suffix = os.path.splitext(store_path)
+    return f"{base}_{timeframe}{suffix}"
+
+
+def resample_chunk(timestamps, columns, minutes):
+    """
+    Regroupe des bougies 1m consécutives (triées) en bougies de `minutes` minutes.
+    Les intervalles sans aucune bougie 1m ne donnent pas de bougie (comme l'API).
+
+    :param timestamps: Tableau int64 des minutes depuis l'epoch.
+    :param columns: Dictionnaire {open, high, low, close, volume: tableau}.
+    :return: (début de chaque bougie en minutes, {nom: tableau})
+    """
+    if len(timestamps) == 0:
+        return timestamps, {name: np.empty(0) for name in COLUMNS}
+    buckets = timestamps // minutes * minutes
+    starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    lasts = np.append(starts[1:], len(buckets)) - 1
+    return buckets[starts], {
+        "open": columns["open"][starts],
+        "high": np.maximum.reduceat(columns["high"], starts),
+        "low": np.minimum.reduceat(columns["low"], starts),
+        "close": columns["close"][lasts],
+        "volume": np.add.reduceat(columns["volume"], starts),
+    }
+
+
+def resume_minute(store_path, timeframe, timestamps):
+    """
+    Minute 1m à partir de laquelle un intervalle doit être recalculé : None s'il est à jour,
+    0 s'il faut tout reconstruire, sinon le début de sa dernière bougie.
+    """
+    path = timeframe_store_path(store_path, timeframe)
+    if not store_exists(path):
+        return 0
+    meta = read_meta(path)
+    source_rows, source_last = meta.get("source_rows"), meta.get("source_last")
+    if source_rows is None or meta["last"] is None:
+        return 0
+    # les bougies déjà utilisées doivent être exactement les premières du store 1m (sinon il a changé au milieu)
+    if source_rows > len(timestamps) or int(np.searchsorted(timestamps, source_last, side='right')) != source_rows:
+        return 0
+    if source_rows == len(timestamps):
+        return None
+    return meta["last"]
+
+
+def update_timeframes(store_path, timeframes=None, chunk_rows=CHUNK_ROWS):
+    """
+    Construit ou met à jour les stores des intervalles à partir du store 1m, en une seule passe.
+
+    :param store_path: Store 1m.
+    :param timeframes: Dictionnaire {nom: minutes} (TIMEFRAMES par défaut) ou liste de noms de TIMEFRAMES.
+    :param chunk_rows: Nombre de bougies 1m lues à la fois.
+    :return: Dictionnaire {intervalle: {bars, rebuilt_from}} des intervalles mis à jour.
+    """
+    timeframes = TIMEFRAMES if timeframes is None else timeframes
+    if not isinstance(timeframes, dict):
+        timeframes = {name: TIMEFRAMES[name] for name in timeframes}
+    meta = read_meta(store_path)
+    timestamps, arrays = open_columns(store_path, COLUMNS)
+    resume = {name: resume_minute(store_path, name, timestamps) for name in timeframes}
+    stale = {name: minutes for name, minutes in timeframes.items() if resume[name] is not None}
+    if not stale or len(timestamps) == 0:
+        return {}
+    # les blocs et la reprise sont alignés sur un multiple de tous les intervalles : aucune bougie coupée en deux
+    step = math.lcm(*stale.values())
+    start_minute = min(resume[name] for name in stale) // step * step
+    i = int(np.searchsorted(timestamps, start_minute))
+    n = len(timestamps)
+    parts = {name: [] for name in stale}
+    while i < n:
+        boundary = int(timestamps[min(i + chunk_rows, n) - 1]) // step * step
+        cut = n if i + chunk_rows >= n else int(np.searchsorted(timestamps, boundary))
+        if cut <= i:
+            cut = int(np.searchsorted(timestamps, boundary + step))
+        chunk = {name: np.asarray(arrays[name][i:cut], dtype=np.float64) for name in COLUMNS}
+        chunk_timestamps = np.asarray(timestamps[i:cut])
+        for name, minutes in stale.items():
+            parts[name].append(resample_chunk(chunk_timestamps, chunk, minutes))
+        i = cut
+    extra = {"source": os.path.basename(store_path), "source_rows": int(n), "source_last": int(timestamps[-1])}
+    results = {}
+    for name, minutes in stale.items():
+        path = timeframe_store_path(store_path, name)
+        new_timestamps = np.concatenate([part[0] for part in parts[name]])
+        new_columns = {column: np.concatenate([part[1][column] for part in parts[name]]) for column in COLUMNS}
+        # on garde les bougies déjà construites avant la reprise
+        if start_minute > 0 and store_exists(path):
+            old_timestamps, old_arrays = open_columns(path, COLUMNS)
+            keep = int(np.searchsorted(old_timestamps, start_minute))
+            new_timestamps = np.concatenate([old_timestamps[:keep], new_timestamps])
+            new_columns = {column: np.concatenate([old_arrays[column][:keep], new_columns[column]]) for column in COLUMNS}
+            del old_timestamps, old_arrays
+        write_store(path, new_timestamps, new_columns, dtype=np.dtype(meta["dtype"]),
+                    extra_meta=dict(extra, timeframe=name, minutes=minutes))
+        results[name] = {"bars": int(len(new_timestamps)), "rebuilt_from": int(start_minute)}
+    return results
+
+
+def load_timeframe(store_path, timeframe, start=None, end=None):
+    """
+    Charge les bougies d'un intervalle entre deux dates (comme load_candles), après avoir mis à jour
+    son store si le store 1m a reçu de nouvelles bougies.
+    """
+    if timeframe == "1m":
+        return load_candles(store_path, start, end)
+    update_timeframes(store_path, [timeframe])
+    return load_candles(timeframe_store_path(store_path, timeframe), start, end)
+
+
+def export_csv(store_path, csv_path, chunk_rows=CHUNK_ROWS):
+    """
+    Écrit un store en CSV (timestamp "YYYY-MM-DD HH:MM:SS", open, high, low, close, volume),
+    le format lu par GO_BOT/data_loader.
+    """
+    timestamps, arrays = open_columns(store_path, COLUMNS)
+    with open(csv_path, "w", newline="") as f:
+        f.write("timestamp," + ",".join(COLUMNS) + "\n")
+        for i in range(0, len(timestamps), chunk_rows):
+            index = from_epoch_minutes(timestamps[i:i + chunk_rows])
+            dates = index.strftime("%Y-%m-%d %H:%M:%S")
+            values = np.column_stack([np.asarray(arrays[name][i:i + chunk_rows], dtype=np.float64) for name in COLUMNS])
+            f.writelines(f"{date},{','.join(map(repr, row))}\n" for date, row in zip(dates, values.tolist()))
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    source = args[0] if args else "1_min_eth_candles_01012017_15112024.csv"
+    timeframes = args[1].split(",") if len(args) > 1 else list(TIMEFRAMES)
+    store_path = source if source.endswith(".store") else store_path_for(source)
+    if not store_exists(store_path):
+        convert_csv_to_store(source, store_path)
+    started = time.perf_counter()
+    results = update_timeframes(store_path, timeframes)
+    elapsed = time.perf_counter() - started
+    if not results:
+        print("✅ Tous les intervalles sont à jour.")
+    for name, result in results.items():
+        print(f"✅ {name} : {result['bars']} bougies dans {timeframe_store_path(store_path, name)}")
+    if results:
+        print(f"⏱️ {len(results)} intervalles construits en {elapsed:.1f}s")
+    if "--csv" in sys.argv:
+        for name in timeframes:
+            csv_path = os.path.splitext(timeframe_store_path(store_path, name))[0] + ".csv"
+            export_csv(timeframe_store_path(store_path, name), csv_path)
+            print(f"📄 {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# moyenne mobile simple (SMA) calculée en continu
+"""
+/*********************************\
+|* SMA en flux (rolling, O(1))   *|
+\*********************************/
+
+    * RollingSMA garde un buffer circulaire des X dernières bougies et une somme courante,
+    on peut donc lui donner les bougies une par une (update) ou par paquets (update_many),
+    journée après journée, sans jamais recalculer tout l'historique.
+
+    * Une valeur n'est "chaude" (warm) que lorsque X bougies ont été vues, avant ça on renvoie NaN,
+    exactement comme ta.trend.sma_indicator (min_periods = window).
+
+    * Comme pandas, on utilise une somme compensée (Kahan) et on renvoie directement le prix
+    quand les X dernières valeurs sont identiques, pour que close > SMA_X donne le même résultat.
+"""
+
+import numpy as np
+
+
+class RollingSMA:
+    """
+    Moyenne mobile simple sur `window` périodes avec état conservé entre les appels.
+
+    :param window: Nombre de périodes de la moyenne (ex: 650).
+    """
+
+    def __init__(self, window):
+        if window <= 0:
+            raise ValueError("window must be a positive integer.")
+        self.window = int(window)
+        self.reset()
+
+    def reset(self):
+        """
+        Remet l'état à zéro (buffer vide, somme nulle).
+        """
+        self.buffer = [0.0] * self.window  # buffer circulaire des dernières valeurs
+        self.position = 0                  # prochaine case à écrire (= plus ancienne valeur)
+        self.count = 0                     # nombre total de valeurs vues
+        self.total = 0.0                   # somme courante des valeurs du buffer
+        self.compensation = 0.0            # compensation de Kahan
+        self.same_count = 0                # nombre de valeurs identiques consécutives
+        self.last_value = np.nan           # dernière valeur vue
+
+    @property
+    def warm(self):
+        """
+        True quand au moins `window` valeurs ont été vues.
+        """
+        return self.count >= self.window
+
+    @property
+    def value(self):
+        """
+        Valeur courante de la SMA (NaN si pas encore chaude).
+        """
+        if not self.warm:
+            return np.nan
+        if self.same_count >= self.window:
+            return self.last_value
+        return self.total / self.window
+
+    def _add(self, x):
+        # addition compensée (Kahan), comme dans le roll_mean de pandas
+        y = x - self.compensation
+        t = self.total + y
+        self.compensation = (t - self.total) - y
+        self.total = t
+
+    def update(self, price):
+        """
+        Ajoute une bougie et renvoie la SMA courante, en O(1).
+
+        :param price: Prix de clôture de la bougie.
+        :return: La SMA, ou NaN si pas encore chaude.
+        """
+        price = float(price)
+        if self.count >= self.window:
+            self._add(-self.buffer[self.position])
+        self.buffer[self.position] = price
+        self._add(price)
+        self.position = (self.position + 1) % self.window
+        self.count += 1
+        if price == self.last_value:
+            self.same_count += 1
+        else:
+            self.same_count = 1
+            self.last_value = price
+        return self.value
+
+    def _history(self):
+        # les (window - 1) dernières valeurs, de la plus ancienne à la plus récente
+        if self.count >= self.window:
+            ordered = self.buffer[self.position:] + self.buffer[:self.position]
+        else:
+            ordered = self.buffer[:self.count]
+        return np.asarray(ordered[-(self.window - 1):] if self.window > 1 else [], dtype=np.float64)
+
+    def update_many(self, prices):
+        """
+        Ajoute un paquet de bougies (ex: une journée) et renvoie la SMA de chacune.
+        Le calcul est vectorisé sur le paquet, l'état est reporté au paquet suivant.
+
+        :param prices: Tableau des prix de clôture.
+        :return: Tableau numpy de la SMA (NaN pour les bougies pas encore chaudes).
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        n = len(prices)
+        if n == 0:
+            return np.empty(0, dtype=np.float64)
+        window = self.window
+        history = self._history()
+        h = len(history)
+        extended = np.concatenate([history, prices])
+        # somme glissante par différence de sommes cumulées sur (historique + paquet)
+        cumulative = np.concatenate([[0.0], np.cumsum(extended)])
+        ends = np.arange(h + 1, h + n + 1)
+        starts = ends - window
+        result = np.full(n, np.nan)
+        warm = starts >= 0
+        result[warm] = (cumulative[ends[warm]] - cumulative[starts[warm]]) / window
+        # longueur des séries de valeurs identiques, pour renvoyer le prix exact
+        indices = np.arange(len(extended))
+        changes = np.concatenate([[True], extended[1:] != extended[:-1]])
+        run_starts = np.maximum.accumulate(np.where(changes, indices, 0))
+        runs = indices - run_starts + 1
+        flat = warm & (runs[h:] >= window)
+        result[flat] = prices[flat]
+        # mise à jour de l'état pour le paquet suivant
+        if runs[-1] == len(extended) and h > 0:
+            self.same_count += n
+        else:
+            self.same_count = int(runs[-1])
+        self.last_value = float(prices[-1])
+        tail = extended[-window:].tolist()
+        self.count += n
+        if len(tail) == window:
+            self.buffer = tail
+            self.position = 0
+        else:
+            self.buffer = tail + [0.0] * (window - len(tail))
+            self.position = len(tail)
+        self.total = float(np.sum(tail))
+        self.compensation = 0.0
+        return result
+
+
+# taille des paquets du calcul en une passe (limite l'erreur des sommes cumulées)
+CHUNK_SIZE = 1 << 16
+
+def rolling_sma(values, window):
+    """
+    Calcule la SMA sur toute une série en une seule passe.
+
+    :param values: Tableau des prix de clôture.
+    :param window: Nombre de périodes.
+    :return: Tableau numpy de la SMA (NaN tant que la fenêtre n'est pas remplie).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    sma = RollingSMA(window)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.float64)
+    return np.concatenate([sma.update_many(values[i:i + CHUNK_SIZE]) for i in range(0, len(values), CHUNK_SIZE)])
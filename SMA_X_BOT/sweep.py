@@ -0,0 +1,167 @@
+# balayage de paramètres (sweep) du bot SMA_X sur tous les cœurs
+"""
+/*********************************\
+|* Sweep de paramètres parallèle *|
+\*********************************/
+
+    * Au lieu de modifier les constantes en bas de main.py et de relancer un backtest à la fois,
+    on donne une grille de paramètres (SMA_VALUE, TARGET_PROFIT, MAX_WINDOW, MAX_TRANSACTION)
+    et toutes les combinaisons sont testées en parallèle, une par processus.
+
+    * Les bougies ne sont chargées qu'une seule fois, puis copiées dans de la mémoire partagée
+    (multiprocessing.shared_memory) : les workers lisent directement ces tableaux, sans copie.
+
+    * Chaque combinaison donne une ligne avec les métriques de metrics.py (sans le détail par année), le tout
+    est rassemblé dans un seul tableau (sweep_results.csv).
+"""
+
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import main as bot
+from backtest_engine import BacktestEngine, complete_day_rows, select_trading_days, trading_window, with_params
+from indicator_cache import IndicatorCache, derive_key, fingerprint
+from metrics import summary
+
+# grille de paramètres testée par défaut
+PARAM_GRID = {
+    "SMA_VALUE": [200, 400, 650, 900],
+    "TARGET_PROFIT": [0.01, 0.02, 0.03, 0.05],
+    "MAX_WINDOW": [60 * 24 * 30, 60 * 24 * 90],
+    "MAX_TRANSACTION": [3, 6],
+}
+# fichier de sortie des résultats
+RESULTS_FILE = "sweep_results.csv"
+
+# tableaux partagés vus par chaque worker (remplis par _init_worker)
+_SHARED = {}
+# dernière sélection de jours du worker (les tâches sont triées par SMA_VALUE)
+_WINDOW_CACHE = {}
+
+
+def share_array(array):
+    """
+    Copie un tableau numpy dans un bloc de mémoire partagée.
+
+    :return: (bloc SharedMemory, description (nom, forme, dtype) à passer aux workers)
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    view[:] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach_array(spec):
+    """
+    Ouvre un tableau partagé à partir de sa description, sans copie.
+
+    :return: (bloc SharedMemory, tableau numpy en lecture seule)
+    """
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    array.flags.writeable = False
+    return block, array
+
+
+def _init_worker(close_spec, timestamps_spec, data_key):
+    # chaque worker ouvre les tableaux partagés une seule fois
+    _SHARED["close"] = attach_array(close_spec)
+    _SHARED["timestamps"] = attach_array(timestamps_spec)
+    # empreinte des bougies calculée par le processus principal (les workers ne hashent pas les prix)
+    _SHARED["data_key"] = data_key
+    # la somme cumulée est calculée une fois par worker, les SMA sont partagées via le cache disque
+    _SHARED["cache"] = IndicatorCache()
+    _SHARED["complete_rows"] = complete_day_rows(_SHARED["timestamps"][1])
+
+
+def run_one(params):
+    """
+    Lance un backtest sur les tableaux partagés avec une combinaison de paramètres.
+
+    :param params: Dictionnaire {SMA_VALUE, TARGET_PROFIT, MAX_WINDOW, MAX_TRANSACTION}.
+    :return: Dictionnaire paramètres + métriques.
+    """
+    close = _SHARED["close"][1]
+    timestamps = _SHARED["timestamps"][1]
+    window = params["SMA_VALUE"]
+    if window not in _WINDOW_CACHE:
+        _WINDOW_CACHE.clear()
+        rows, sma_x = select_trading_days(timestamps, close, window, _SHARED["cache"], _SHARED["complete_rows"], _SHARED["data_key"])
+        # l'index de sortie ne dépend que des bougies gardées : partagé par toutes les combinaisons de cette fenêtre
+        _WINDOW_CACHE[window] = trading_window(close[rows], sma_x, timestamps[rows])
+    trading = _WINDOW_CACHE[window]
+    row = dict(params)
+    if len(trading.close) == 0:
+        row.update({"final_balance": bot.BALANCE, "transactions": 0})
+        return row
+    engine = BacktestEngine(with_params(bot.strategy_config(), params), trading).run()
+    row.update(summary(engine.report(curve=False)))
+    return row
+
+
+def expand_grid(grid):
+    """
+    Transforme une grille {paramètre: [valeurs]} en liste de combinaisons,
+    triée par SMA_VALUE pour que chaque worker réutilise sa SMA.
+    """
+    names = list(grid)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    return sorted(combinations, key=lambda params: params.get("SMA_VALUE", bot.SMA_VALUE))
+
+
+def run_sweep(grid=PARAM_GRID, filename=bot.FILE_NAME, workers=None, results_file=RESULTS_FILE):
+    """
+    Lance toutes les combinaisons de la grille en parallèle et renvoie un tableau de résultats.
+
+    :param grid: Grille de paramètres.
+    :param filename: Fichier de bougies (le store binaire est utilisé s'il existe).
+    :param workers: Nombre de processus (par défaut : tous les cœurs).
+    :param results_file: Fichier CSV de sortie (None pour ne rien écrire).
+    :return: DataFrame, une ligne par combinaison.
+    """
+    workers = workers or os.cpu_count()
+    combinations = expand_grid(grid)
+    # on charge les bougies une seule fois
+    df = bot.downloadDb(filename)
+    close = np.ascontiguousarray(df['close'].to_numpy(dtype=np.float64))
+    timestamps = df.index.values.astype('datetime64[ns]').view(np.int64)
+    del df
+    # une seule empreinte pour tout le sweep : celle du store, sinon le hash des bougies
+    data_key = bot.data_key_for(filename) or derive_key(fingerprint(close), fingerprint(timestamps))
+    close_block, close_spec = share_array(close)
+    timestamps_block, timestamps_spec = share_array(timestamps)
+    del close, timestamps
+    print(f"🔄 Sweep de {len(combinations)} combinaisons sur {workers} processus...")
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(close_spec, timestamps_spec, data_key)) as executor:
+            chunksize = max(1, len(combinations) // (workers * 4))
+            rows = list(executor.map(run_one, combinations, chunksize=chunksize))
+    finally:
+        close_block.close()
+        close_block.unlink()
+        timestamps_block.close()
+        timestamps_block.unlink()
+    elapsed = time.perf_counter() - started
+    results = pd.DataFrame(rows).sort_values("final_balance", ascending=False, ignore_index=True)
+    print(f"✅ {len(combinations)} backtests en {elapsed:.1f}s ({len(combinations) / elapsed * 60:.1f} backtests/minute)")
+    if results_file:
+        results.to_csv(results_file, index=False)
+        print(f"📊 Résultats enregistrés dans {results_file}")
+    return results
+
+
+def main():
+    results = run_sweep()
+    print(results.head(10).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# registre des transactions en tableaux numpy
+"""
+/*********************************\
+|* Registre des transactions     *|
+\*********************************/
+
+    * Avant : un dictionnaire de 10 clés + un uuid4 par achat, des listes dont on retirait les transactions
+    vendues, et un DataFrame construit à la fin.
+
+    * TradeLedger garde une colonne numpy par champ (prix, quantité, frais, dates en ns, profit...), allouée
+    à l'avance et agrandie par doublement. Un achat = une nouvelle ligne, son id est le numéro de la ligne
+    (entier séquentiel). Une vente remplit les colonnes de vente de cette ligne : rien n'est déplacé.
+
+    * to_dataframe() renvoie un DataFrame construit sur ces colonnes sans les copier.
+"""
+
+import numpy as np
+import pandas as pd
+
+# colonnes du registre (dans l'ordre du DataFrame renvoyé) et leur type
+LEDGER_COLUMNS = {
+    "id": np.int64,
+    "buy_date": "datetime64[ns]",
+    "buy_price": np.float64,
+    "quantity": np.float64,
+    "target_price": np.float64,
+    "buy_fee": np.float64,
+    "sell_fee": np.float64,
+    "sell_date": "datetime64[ns]",
+    "sell_price": np.float64,
+    "profit": np.float64,
+    "buy_index": np.int64,
+    "sell_index": np.int64,
+}
+
+
+class TradeLedger:
+    """
+    Registre des transactions (une ligne par achat) en colonnes numpy.
+
+    :param capacity: Nombre de lignes allouées au départ (doublé quand il est atteint).
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.capacity = max(1, capacity)
+        self._columns = {name: np.empty(self.capacity, dtype=dtype) for name, dtype in LEDGER_COLUMNS.items()}
+        self.is_open = np.zeros(self.capacity, dtype=bool)
+
+    def __len__(self):
+        return self.size
+
+    def __getattr__(self, name):
+        # ledger.buy_price, ledger.profit... : la colonne entière (y compris les lignes pas encore utilisées)
+        columns = self.__dict__.get("_columns")
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, values in self._columns.items():
+            grown = np.empty(self.capacity, dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            self._columns[name] = grown
+        is_open = np.zeros(self.capacity, dtype=bool)
+        is_open[:self.size] = self.is_open[:self.size]
+        self.is_open = is_open
+
+    def open(self, buy_index, buy_date, buy_price, quantity, buy_fee, target_price):
+        """
+        Enregistre un achat.
+
+        :param buy_index: Numéro de la bougie d'achat.
+        :param buy_date: Date d'achat en nanosecondes (int64).
+        :return: L'id de la transaction (numéro de ligne).
+        """
+        if self.size == self.capacity:
+            self._grow()
+        trade_id = self.size
+        columns = self._columns
+        columns["id"][trade_id] = trade_id
+        columns["buy_index"][trade_id] = buy_index
+        columns["buy_date"][trade_id] = buy_date
+        columns["buy_price"][trade_id] = buy_price
+        columns["quantity"][trade_id] = quantity
+        columns["buy_fee"][trade_id] = buy_fee
+        columns["target_price"][trade_id] = target_price
+        columns["sell_index"][trade_id] = -1
+        columns["sell_date"][trade_id] = np.datetime64("NaT")
+        columns["sell_price"][trade_id] = np.nan
+        columns["sell_fee"][trade_id] = np.nan
+        columns["profit"][trade_id] = np.nan
+        self.is_open[trade_id] = True
+        self.size += 1
+        return trade_id
+
+    def close(self, trade_id, sell_index, sell_date, sell_price, sell_fee, profit):
+        """
+        Enregistre la vente d'une transaction ouverte.
+
+        :param sell_date: Date de vente en nanosecondes (int64).
+        """
+        columns = self._columns
+        columns["sell_index"][trade_id] = sell_index
+        columns["sell_date"][trade_id] = sell_date
+        columns["sell_price"][trade_id] = sell_price
+        columns["sell_fee"][trade_id] = sell_fee
+        columns["profit"][trade_id] = profit
+        self.is_open[trade_id] = False
+
+    def to_dataframe(self):
+        """
+        DataFrame des transactions (ordre des achats), construit sur les colonnes du registre sans copie.
+        """
+        return pd.DataFrame({name: values[:self.size] for name, values in self._columns.items()}, copy=False)
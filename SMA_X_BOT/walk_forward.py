@@ -0,0 +1,271 @@
+# walk-forward : le backtest découpé en fenêtres de temps, une par processus
+"""
+/*********************************\
+|* Walk-forward parallèle        *|
+\*********************************/
+
+    * Le backtest de main.py est séquentiel (les positions et le solde passent d'un jour à l'autre) et
+    tourne donc sur un seul cœur. Ici la période est découpée en fenêtres de test de TEST_DAYS jours,
+    chacune précédée d'une fenêtre d'entraînement de TRAIN_DAYS jours :
+        - sur la fenêtre d'entraînement on teste toutes les combinaisons de WALK_GRID et on garde la meilleure
+        - on la rejoue sur la fenêtre de test qui suit (évaluation hors échantillon)
+    Chaque fenêtre (shard) tourne dans son propre processus, sur les bougies en mémoire partagée (voir sweep.py).
+
+    * Préchauffage : comme dans calculate_sma_x_on_daily_data, la SMA est calculée sur les jours complets
+    mis bout à bout. Chaque fenêtre reçoit en plus les jours complets qui la précèdent (assez pour SMA_VALUE
+    bougies), la SMA de ses premières bougies est donc la même que dans un backtest d'un seul tenant.
+
+    * Chaque fenêtre part du solde de départ et clôture ses positions à sa fin. Les transactions de toutes les
+    fenêtres de test sont mises bout à bout dans un seul compte rendu (voir metrics.py), avec le détail par fenêtre.
+
+    Lancement : python walk_forward.py
+    Sans entraînement (le backtest de main.py découpé en fenêtres) : python walk_forward.py --no-train
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import main as bot
+from backtest_engine import BacktestEngine, complete_day_rows, select_trading_days, trading_window, with_params
+from day_partition import MINUTES_PER_DAY, NS_PER_DAY
+from indicator_cache import IndicatorCache, derive_key, fingerprint
+from metrics import compute_metrics, format_report, summary, to_json
+from sweep import attach_array, expand_grid, share_array
+from trade_ledger import TradeLedger
+
+# jours de la fenêtre d'entraînement
+TRAIN_DAYS = 365
+# jours de chaque fenêtre de test
+TEST_DAYS = 180
+# combinaisons testées sur chaque fenêtre d'entraînement (les autres paramètres viennent de main.py)
+WALK_GRID = {
+    "SMA_VALUE": [400, 650, 900],
+    "TARGET_PROFIT": [0.01, 0.02, 0.03, 0.05],
+    "MAX_TRANSACTION": [3, 6],
+}
+# fichier JSON du compte rendu
+REPORT_FILE = "walk_forward_report.json"
+
+# tableaux partagés vus par chaque worker (remplis par _init_worker)
+_SHARED = {}
+
+
+def default_params():
+    """
+    Paramètres de main.py.
+    """
+    return {
+        "SMA_VALUE": bot.SMA_VALUE,
+        "TARGET_PROFIT": bot.TARGET_PROFIT,
+        "MAX_WINDOW": bot.MAX_WINDOW,
+        "MAX_TRANSACTION": bot.MAX_TRANSACTION,
+    }
+
+
+def make_shards(start, end, train_days=TRAIN_DAYS, test_days=TEST_DAYS):
+    """
+    Découpe [start, end) en fenêtres de test consécutives, chacune précédée de sa fenêtre d'entraînement.
+
+    :param start: Début de la période en ns (minuit).
+    :param end: Fin de la période en ns (exclue).
+    :return: Liste de dictionnaires {shard, train: (début, fin) ou None, test: (début, fin)}.
+    """
+    shards = []
+    test_start = start + train_days * NS_PER_DAY
+    while test_start < end:
+        test_end = min(test_start + test_days * NS_PER_DAY, end)
+        train = (test_start - train_days * NS_PER_DAY, test_start) if train_days else None
+        shards.append({"shard": len(shards), "train": train, "test": (test_start, test_end)})
+        test_start = test_end
+    return shards
+
+
+def window_rows(start, end, window, cache=None):
+    """
+    Bougies d'une fenêtre [start, end) et leur SMA_X, préchauffée avec les jours complets qui précèdent.
+
+    :return: (indices des lignes gardées, SMA_X de ces lignes)
+    """
+    timestamps = _SHARED["timestamps"][1]
+    complete_rows = _SHARED["complete_rows"]
+    complete_timestamps = timestamps[complete_rows]
+    first = int(np.searchsorted(complete_timestamps, start))
+    last = int(np.searchsorted(complete_timestamps, end))
+    # jours entiers de préchauffage : au moins window - 1 bougies avant la fenêtre
+    warmup = -(-(window - 1) // MINUTES_PER_DAY) * MINUTES_PER_DAY
+    # la série de la SMA est identifiée par l'empreinte des bougies et la tranche de jours complets gardée
+    data_key = derive_key(_SHARED["data_key"], max(0, first - warmup), last)
+    rows, sma_x = select_trading_days(timestamps, _SHARED["close"][1], window, cache, complete_rows[max(0, first - warmup):last], data_key)
+    keep = timestamps[rows] >= start
+    return rows[keep], sma_x[keep]
+
+
+def backtest(rows, sma_x, params):
+    """
+    Backtest (BacktestEngine) sur des lignes choisies.
+
+    :return: (registre, solde final, transactions clôturées à la fin)
+    """
+    if len(rows) == 0:
+        return None, bot.BALANCE, 0
+    window = trading_window(_SHARED["close"][1][rows], sma_x, _SHARED["timestamps"][1][rows])
+    engine = BacktestEngine(with_params(bot.strategy_config(), params), window).run()
+    return engine.ledger, engine.balance, engine.closed_at_end
+
+
+def train(shard, grid):
+    """
+    Teste toutes les combinaisons de la grille sur la fenêtre d'entraînement.
+
+    :return: (meilleurs paramètres, solde final obtenu avec eux)
+    """
+    best, best_balance = default_params(), None
+    selected = {}
+    for combination in expand_grid(grid):
+        params = default_params()
+        params.update(combination)
+        window = params["SMA_VALUE"]
+        # les combinaisons sont triées par SMA_VALUE : une sélection de jours par valeur
+        if window not in selected:
+            selected.clear()
+            selected[window] = window_rows(*shard["train"], window, _SHARED["cache"])
+        _, balance, _ = backtest(*selected[window], params)
+        if best_balance is None or balance > best_balance:
+            best, best_balance = params, balance
+    return best, best_balance
+
+
+def _init_worker(close_spec, timestamps_spec, data_key):
+    # chaque worker ouvre les tableaux partagés une seule fois
+    _SHARED["close"] = attach_array(close_spec)
+    _SHARED["timestamps"] = attach_array(timestamps_spec)
+    # empreinte des bougies calculée par le processus principal (les workers ne hashent pas les prix)
+    _SHARED["data_key"] = data_key
+    _SHARED["cache"] = IndicatorCache()
+    _SHARED["complete_rows"] = complete_day_rows(_SHARED["timestamps"][1])
+
+
+def run_shard(task):
+    """
+    Entraîne (si une grille est donnée) puis teste une fenêtre.
+
+    :param task: (shard, grille ou None).
+    :return: Dictionnaire (paramètres choisis, transactions de la fenêtre de test, solde final...).
+    """
+    shard, grid = task
+    started = time.perf_counter()
+    params, train_balance = default_params(), None
+    if grid and shard["train"]:
+        params, train_balance = train(shard, grid)
+    rows, sma_x = window_rows(*shard["test"], params["SMA_VALUE"], _SHARED["cache"])
+    ledger, balance, closed_at_end = backtest(rows, sma_x, params)
+    return dict(
+        shard,
+        params=params,
+        train_balance=train_balance,
+        trades=ledger.to_dataframe() if ledger is not None else None,
+        final_balance=balance,
+        closed_at_end=closed_at_end,
+        seconds=time.perf_counter() - started,
+    )
+
+
+def load_candles(filename, grid):
+    """
+    Charge les bougies de main.py avec, en plus, les jours de préchauffage avant START_DATE.
+
+    :return: (DataFrame, début et fin de la période testée en ns, empreinte des bougies pour le cache)
+    """
+    windows = (grid or {}).get("SMA_VALUE", []) + [bot.SMA_VALUE]
+    warmup_days = -(-max(windows) // MINUTES_PER_DAY) + 1
+    start_date = bot.START_DATE
+    warmup_start = str((pd.Timestamp(start_date) - pd.Timedelta(days=warmup_days)).date()) if start_date else start_date
+    df = bot.downloadDb(filename, warmup_start)
+    timestamps = df.index.values.astype('datetime64[ns]').view(np.int64)
+    start = max(int(timestamps[0]), pd.Timestamp(start_date).value if start_date else 0)
+    # une seule empreinte pour toutes les fenêtres : celle du store, sinon le hash des bougies
+    data_key = bot.data_key_for(filename, warmup_start) or derive_key(fingerprint(df['close'].to_numpy(dtype=np.float64)), fingerprint(timestamps))
+    return df, start // NS_PER_DAY * NS_PER_DAY, int(timestamps[-1]) + 1, data_key
+
+
+def stitch(results):
+    """
+    Met bout à bout les transactions des fenêtres de test (ids renumérotés) et calcule le compte rendu.
+
+    :return: (métriques de l'ensemble, DataFrame d'une ligne par fenêtre)
+    """
+    frames = [result["trades"] for result in results if result["trades"] is not None]
+    trades = pd.concat(frames, ignore_index=True) if frames else TradeLedger().to_dataframe()
+    trades["id"] = np.arange(len(trades))
+    final_balance = bot.BALANCE + trades["profit"].sum()
+    period = (results[0]["test"][0], results[-1]["test"][1]) if results else None
+    report = compute_metrics(trades, final_balance, bot.BALANCE, period)
+    rows = []
+    for result in results:
+        row = {
+            "shard": result["shard"],
+            "test_start": pd.Timestamp(result["test"][0]).strftime("%Y-%m-%d"),
+            "test_end": pd.Timestamp(result["test"][1]).strftime("%Y-%m-%d"),
+            **result["params"],
+            "train_balance": result["train_balance"],
+            "seconds": result["seconds"],
+        }
+        if result["trades"] is not None:
+            row.update(summary(compute_metrics(result["trades"], result["final_balance"], bot.BALANCE, result["test"], curve=False)))
+        else:
+            row.update({"final_balance": result["final_balance"], "transactions": 0})
+        rows.append(row)
+    report["shards"] = {str(row["shard"]): {name: value for name, value in row.items() if name != "shard"} for row in rows}
+    return report, pd.DataFrame(rows)
+
+
+def walk_forward(grid=WALK_GRID, filename=bot.FILE_NAME, train_days=TRAIN_DAYS, test_days=TEST_DAYS, workers=None, report_file=REPORT_FILE):
+    """
+    Lance toutes les fenêtres en parallèle et renvoie le compte rendu de l'ensemble.
+
+    :param grid: Grille testée sur chaque fenêtre d'entraînement (None : paramètres de main.py, sans entraînement).
+    :param filename: Fichier de bougies (le store binaire est utilisé s'il existe).
+    :param train_days: Jours de la fenêtre d'entraînement (ignoré sans grille).
+    :param test_days: Jours de chaque fenêtre de test.
+    :param workers: Nombre de processus (par défaut : tous les cœurs).
+    :param report_file: Fichier JSON du compte rendu (None pour ne rien écrire).
+    :return: (métriques de l'ensemble, DataFrame d'une ligne par fenêtre)
+    """
+    workers = workers or os.cpu_count()
+    df, start, end, data_key = load_candles(filename, grid)
+    shards = make_shards(start, end, train_days if grid else 0, test_days)
+    close_block, close_spec = share_array(np.ascontiguousarray(df['close'].to_numpy(dtype=np.float64)))
+    timestamps_block, timestamps_spec = share_array(df.index.values.astype('datetime64[ns]').view(np.int64))
+    del df
+    print(f"🔄 Walk-forward : {len(shards)} fenêtres de {test_days} jours sur {workers} processus...")
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(close_spec, timestamps_spec, data_key)) as executor:
+            results = list(executor.map(run_shard, [(shard, grid) for shard in shards]))
+    finally:
+        close_block.close()
+        close_block.unlink()
+        timestamps_block.close()
+        timestamps_block.unlink()
+    elapsed = time.perf_counter() - started
+    report, table = stitch(results)
+    print(f"✅ {len(shards)} fenêtres en {elapsed:.1f}s (somme des fenêtres : {table['seconds'].sum():.1f}s)")
+    print(format_report(report))
+    print(table.to_string(index=False))
+    if report_file:
+        to_json(report, report_file)
+        print(f"📊 Compte rendu enregistré dans {report_file}")
+    return report, table
+
+
+def main():
+    walk_forward(None if "--no-train" in sys.argv else WALK_GRID)
+
+
+if __name__ == "__main__":
+    main()